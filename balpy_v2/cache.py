@@ -1,4 +0,0 @@
-from joblib import Memory
-
-cachedir = ".balpy_cache"
-memory = Memory(cachedir, verbose=0)
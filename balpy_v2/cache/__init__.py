@@ -0,0 +1,15 @@
+import atexit
+import os
+
+from balpy_v2.cache.manager import CacheManager
+from balpy_v2.lib.time import WEEK_IN_SECONDS
+
+CACHE_DIR = os.getenv("BALPY_CACHE_DIR", ".balpy_cache")
+
+cache_manager = CacheManager(CACHE_DIR)
+atexit.register(cache_manager.flush_stats)
+
+# ABIs and deployment artifacts, which change with new deployments
+memory = cache_manager.namespace(
+    "default", max_entries=1024, max_bytes=256 * 1024**2, ttl=WEEK_IN_SECONDS
+)
@@ -0,0 +1,313 @@
+import os
+import pickle
+import shutil
+import sys
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class CacheStats:
+    """
+    Counters for a cache namespace.
+
+    :ivar hits: Lookups answered from the cache.
+    :ivar misses: Lookups that had to be computed.
+    :ivar writes: Values stored.
+    :ivar evictions: Values dropped by TTL or budget enforcement.
+    :ivar bytes_written: Total size of the values stored.
+    """
+
+    FIELDS = ("hits", "misses", "writes", "evictions", "bytes_written")
+
+    def __init__(self, **counters):
+        for field in self.FIELDS:
+            setattr(self, field, counters.get(field, 0))
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __add__(self, other):
+        return CacheStats(
+            **{
+                field: getattr(self, field) + getattr(other, field)
+                for field in self.FIELDS
+            }
+        )
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def sizeof(value):
+    """
+    Cheaply estimates the in-memory size of a cached value.
+    """
+    if hasattr(value, "memory_usage"):
+        usage = value.memory_usage(index=True)
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if isinstance(value, (bytes, str)):
+        return len(value)
+    return sys.getsizeof(value)
+
+
+class MemoryBackend:
+    """
+    Keeps cached values in an LRU-ordered dictionary.
+
+    Entries past ``ttl`` seconds are dropped on access, and the least recently
+    used entries are evicted whenever ``max_entries`` or ``max_bytes`` would
+    be exceeded.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.nbytes = 0
+        self._store = OrderedDict()
+
+    def _expired(self, stored_at, now=None):
+        return self.ttl is not None and (now or time.time()) - stored_at > self.ttl
+
+    def get(self, key):
+        entry = self._store.get(key)
+        if entry is not None and self._expired(entry[2]):
+            self._drop(key)
+            self.stats.evictions += 1
+            entry = None
+        if entry is None:
+            self.stats.misses += 1
+            return MISSING
+        self._store.move_to_end(key)
+        self.stats.hits += 1
+        return entry[0]
+
+    def set(self, key, value):
+        size = sizeof(value)
+        self._drop(key)
+        self._store[key] = (value, size, time.time())
+        self.nbytes += size
+        self.stats.writes += 1
+        self.stats.bytes_written += size
+        self.prune()
+
+    def _drop(self, key):
+        entry = self._store.pop(key, None)
+        if entry is not None:
+            self.nbytes -= entry[1]
+
+    def delete(self, key):
+        self._drop(key)
+
+    def clear(self, prefix=None):
+        if prefix is None:
+            self._store.clear()
+            self.nbytes = 0
+            return
+        for key in [k for k in self._store if str(k).startswith(f"{prefix}/")]:
+            self._drop(key)
+
+    def prune(self, max_entries=None, max_bytes=None, ttl=None):
+        """
+        Evicts expired entries, then least recently used ones until the
+        backend fits its budgets.
+
+        :return: The number of evicted entries
+        """
+        max_entries = max_entries if max_entries is not None else self.max_entries
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        ttl = ttl if ttl is not None else self.ttl
+        evicted = 0
+        if ttl is not None:
+            now = time.time()
+            for key in [k for k, e in self._store.items() if now - e[2] > ttl]:
+                self._drop(key)
+                evicted += 1
+        while self._store and (
+            (max_entries is not None and len(self._store) > max_entries)
+            or (max_bytes is not None and self.nbytes > max_bytes)
+        ):
+            self._drop(next(iter(self._store)))
+            evicted += 1
+        self.stats.evictions += evicted
+        return evicted
+
+    def size(self):
+        return self.nbytes
+
+    def __len__(self):
+        return len(self._store)
+
+    def __contains__(self, key):
+        return key in self._store
+
+    def __getitem__(self, key):
+        return self._store[key][0]
+
+    def __setitem__(self, key, value):
+        self.set(key, value)
+
+
+class DiskBackend:
+    """
+    Pickles cached values to one file per key under a directory.
+
+    The directory is only created on the first write, so importing a module
+    that declares a cache never touches the filesystem. A file's mtime is its
+    write time (used for ``ttl``) and its atime is bumped on every hit (used
+    for LRU eviction).
+    """
+
+    def __init__(self, directory, max_entries=None, max_bytes=None, ttl=None):
+        self.directory = directory
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self._nbytes = None
+        self._nentries = None
+
+    def _path(self, key):
+        prefix, _, digest = key.rpartition("/")
+        return os.path.join(self.directory, prefix, digest[:2], f"{digest}.pkl")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+            stat = os.stat(path)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.stats.misses += 1
+            return MISSING
+        now = time.time()
+        if self.ttl is not None and now - stat.st_mtime > self.ttl:
+            self._remove(path, stat.st_size)
+            self.stats.evictions += 1
+            self.stats.misses += 1
+            return MISSING
+        os.utime(path, (now, stat.st_mtime))
+        self.stats.hits += 1
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so readers never see partial pickles
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        size = os.path.getsize(tmp_path)
+        try:
+            previous = os.path.getsize(path)
+        except FileNotFoundError:
+            previous = None
+        os.replace(tmp_path, path)
+        self.stats.writes += 1
+        self.stats.bytes_written += size
+
+        if self.max_entries is None and self.max_bytes is None:
+            return
+        if self._nbytes is None:
+            self._scan_totals()
+        else:
+            self._nbytes += size - (previous or 0)
+            self._nentries += previous is None
+        if (self.max_entries is not None and self._nentries > self.max_entries) or (
+            self.max_bytes is not None and self._nbytes > self.max_bytes
+        ):
+            self.prune()
+
+    def _remove(self, path, size):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            return
+        if self._nbytes is not None:
+            self._nbytes -= size
+            self._nentries -= 1
+
+    def delete(self, key):
+        path = self._path(key)
+        try:
+            self._remove(path, os.path.getsize(path))
+        except FileNotFoundError:
+            pass
+
+    def clear(self, prefix=None):
+        directory = (
+            self.directory if prefix is None else os.path.join(self.directory, prefix)
+        )
+        shutil.rmtree(directory, ignore_errors=True)
+        self._nbytes = self._nentries = None
+
+    def entries(self):
+        """
+        Yields (path, size, atime, mtime) for every stored value.
+        """
+        for root, _, files in os.walk(self.directory):
+            for file in files:
+                if not file.endswith(".pkl"):
+                    continue
+                path = os.path.join(root, file)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, stat.st_size, stat.st_atime, stat.st_mtime
+
+    def _scan_totals(self):
+        sizes = [size for _, size, _, _ in self.entries()]
+        self._nbytes, self._nentries = sum(sizes), len(sizes)
+
+    def prune(self, max_entries=None, max_bytes=None, ttl=None):
+        """
+        Removes expired files, then least recently used ones until the
+        directory fits its budgets.
+
+        :return: The number of evicted entries
+        """
+        max_entries = max_entries if max_entries is not None else self.max_entries
+        max_bytes = max_bytes if max_bytes is not None else self.max_bytes
+        ttl = ttl if ttl is not None else self.ttl
+        now = time.time()
+        evicted = 0
+        kept = []
+        for path, size, atime, mtime in self.entries():
+            if ttl is not None and now - mtime > ttl:
+                os.remove(path)
+                evicted += 1
+            else:
+                kept.append((atime, path, size))
+
+        kept.sort()
+        nbytes = sum(size for _, _, size in kept)
+        nentries = len(kept)
+        for _, path, size in kept:
+            if not (
+                (max_entries is not None and nentries > max_entries)
+                or (max_bytes is not None and nbytes > max_bytes)
+            ):
+                break
+            os.remove(path)
+            nbytes -= size
+            nentries -= 1
+            evicted += 1
+
+        self._nbytes, self._nentries = nbytes, nentries
+        self.stats.evictions += evicted
+        return evicted
+
+    def size(self):
+        if self._nbytes is None:
+            self._scan_totals()
+        return self._nbytes
+
+    def __len__(self):
+        if self._nentries is None:
+            self._scan_totals()
+        return self._nentries
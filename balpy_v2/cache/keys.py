@@ -0,0 +1,101 @@
+import hashlib
+import inspect
+import pickle
+import sys
+from enum import Enum
+
+
+def _update_frame(hasher, obj):
+    """
+    Fingerprints a pandas object by content, without pickling it.
+    """
+    from pandas.util import hash_pandas_object
+
+    hasher.update(type(obj).__name__.encode())
+    if hasattr(obj, "columns"):
+        hasher.update(repr(list(obj.columns)).encode())
+        hasher.update(repr(list(obj.dtypes.astype(str))).encode())
+    else:
+        hasher.update(repr((obj.name, str(obj.dtype))).encode())
+    try:
+        hasher.update(hash_pandas_object(obj, index=True).values.tobytes())
+    except TypeError:
+        # cells holding arrays (e.g. list columns read from Parquet) aren't
+        # hashable, so hash their string form instead
+        hasher.update(hash_pandas_object(obj.astype(str), index=True).values.tobytes())
+
+
+def _is_pandas_object(obj):
+    pd = sys.modules.get("pandas")
+    return pd is not None and isinstance(obj, (pd.DataFrame, pd.Series))
+
+
+def _update(hasher, obj):
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        hasher.update(f"{type(obj).__name__}:{obj!r};".encode())
+    elif isinstance(obj, Enum):
+        hasher.update(f"{type(obj).__qualname__}.{obj.name};".encode())
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(f"{type(obj).__name__}[{len(obj)}".encode())
+        for item in obj:
+            _update(hasher, item)
+        hasher.update(b"]")
+    elif isinstance(obj, dict):
+        hasher.update(f"dict[{len(obj)}".encode())
+        for key in sorted(obj, key=repr):
+            _update(hasher, key)
+            _update(hasher, obj[key])
+        hasher.update(b"]")
+    elif isinstance(obj, (set, frozenset)):
+        hasher.update(f"set[{len(obj)}".encode())
+        for digest in sorted(fingerprint(item) for item in obj):
+            hasher.update(digest.encode())
+        hasher.update(b"]")
+    elif _is_pandas_object(obj):
+        _update_frame(hasher, obj)
+    elif type(obj).__module__ == "numpy" and hasattr(obj, "tobytes"):
+        hasher.update(f"ndarray{obj.dtype}{obj.shape}".encode())
+        hasher.update(obj.tobytes())
+    elif hasattr(obj, "__dict__") and not callable(obj):
+        hasher.update(f"{type(obj).__qualname__}".encode())
+        _update(hasher, vars(obj))
+    else:
+        hasher.update(pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def fingerprint(obj):
+    """
+    Returns a stable hex digest for an argument value.
+
+    DataFrames and Series are hashed by content, containers recursively and
+    plain objects through their attributes, so equal arguments produce equal
+    fingerprints across processes.
+
+    :param obj: The value to fingerprint
+    :return: A hex digest string
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    _update(hasher, obj)
+    return hasher.hexdigest()
+
+
+def function_name(func):
+    return f"{func.__module__}.{func.__qualname__}".replace("<", "").replace(">", "")
+
+
+def make_key(func, args, kwargs, ignore=()):
+    """
+    Builds the cache key of a call, binding arguments to their parameter names
+    so positional, keyword and defaulted calls share the same key.
+
+    :param func: The cached function
+    :param args: The positional arguments of the call
+    :param kwargs: The keyword arguments of the call
+    :param ignore: Parameter names left out of the key, optional
+    :return: A hex digest string
+    """
+    bound = inspect.signature(func).bind(*args, **kwargs)
+    bound.apply_defaults()
+    arguments = {k: v for k, v in bound.arguments.items() if k not in ignore}
+    code = getattr(func, "__code__", None)
+    return fingerprint((code.co_code if code else b"", arguments))
@@ -0,0 +1,131 @@
+import json
+import os
+
+from balpy_v2.cache.backends import CacheStats, DiskBackend, MemoryBackend
+from balpy_v2.cache.memoize import Cache
+
+STATS_FILE_NAME = ".stats.json"
+
+
+class CacheManager:
+    """
+    Owns every named cache namespace of the process.
+
+    Each namespace has its own backend and budgets. Disk namespaces live in
+    a subdirectory of ``directory`` and persist their cumulative counters
+    there, so ``balpy cache stats`` can report across runs.
+
+    :ivar backends: A dictionary of namespace name to backend.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.backends = {}
+
+    def backend(self, name, max_entries=None, max_bytes=None, ttl=None, disk=True):
+        """
+        Retrieves or creates the backend of a namespace.
+
+        :param name: The namespace name
+        :param max_entries: The maximum number of entries kept, optional
+        :param max_bytes: The maximum total size of the entries kept, optional
+        :param ttl: The number of seconds an entry stays valid, optional
+        :param disk: Whether values are pickled to disk or kept in memory
+        :return: A DiskBackend or MemoryBackend
+        """
+        if name not in self.backends:
+            if disk:
+                self.backends[name] = DiskBackend(
+                    os.path.join(self.directory, name), max_entries, max_bytes, ttl
+                )
+            else:
+                self.backends[name] = MemoryBackend(max_entries, max_bytes, ttl)
+        return self.backends[name]
+
+    def namespace(self, name, max_entries=None, max_bytes=None, ttl=None, disk=True):
+        """
+        Creates a Cache whose decorated functions share a namespace backend.
+        """
+        return Cache(self.backend(name, max_entries, max_bytes, ttl, disk))
+
+    def _disk_namespaces(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted(
+            name
+            for name in os.listdir(self.directory)
+            if os.path.isdir(os.path.join(self.directory, name))
+        )
+
+    def _stats_path(self, name):
+        return os.path.join(self.directory, name, STATS_FILE_NAME)
+
+    def _persisted_stats(self, name):
+        try:
+            with open(self._stats_path(name)) as f:
+                return CacheStats(**json.load(f))
+        except (FileNotFoundError, json.JSONDecodeError):
+            return CacheStats()
+
+    def _get_backend(self, name):
+        if name in self.backends:
+            return self.backends[name]
+        return DiskBackend(os.path.join(self.directory, name))
+
+    def _names(self, name=None):
+        if name:
+            return [name]
+        return sorted(set(self.backends) | set(self._disk_namespaces()))
+
+    def stats(self):
+        """
+        Reports entries, bytes and counters for every known namespace.
+
+        :return: A dictionary of namespace name to statistics
+        """
+        report = {}
+        for name in self._names():
+            backend = self._get_backend(name)
+            stats = backend.stats
+            if isinstance(backend, DiskBackend):
+                stats = self._persisted_stats(name) + stats
+            report[name] = dict(
+                kind="disk" if isinstance(backend, DiskBackend) else "memory",
+                entries=len(backend),
+                bytes=backend.size(),
+                hit_ratio=stats.hit_ratio(),
+                **stats.as_dict(),
+            )
+        return report
+
+    def prune(self, name=None, max_entries=None, max_bytes=None, ttl=None):
+        """
+        Enforces TTL and budgets, either the namespaces' own or the given ones.
+
+        :param name: The namespace to prune, all namespaces if omitted
+        :return: A dictionary of namespace name to evicted entries
+        """
+        return {
+            n: self._get_backend(n).prune(max_entries, max_bytes, ttl)
+            for n in self._names(name)
+        }
+
+    def clear(self, name=None):
+        for n in self._names(name):
+            self._get_backend(n).clear()
+
+    def flush_stats(self):
+        """
+        Adds this process' counters of disk namespaces to their persisted ones.
+        """
+        for name, backend in self.backends.items():
+            if not isinstance(backend, DiskBackend) or not any(
+                backend.stats.as_dict().values()
+            ):
+                continue
+            if not os.path.isdir(backend.directory):
+                continue
+            stats = self._persisted_stats(name) + backend.stats
+            with open(self._stats_path(name), "w") as f:
+                json.dump(stats.as_dict(), f)
+            backend.stats = CacheStats()
@@ -0,0 +1,78 @@
+import asyncio
+from functools import wraps
+
+from balpy_v2.cache.backends import MISSING
+from balpy_v2.cache.keys import function_name, make_key
+
+
+class Cache:
+    """
+    Memoizes sync and async functions on a pluggable backend.
+
+    Coroutine functions are awaited and their results stored, not the
+    coroutine objects. Concurrent calls with identical arguments share a
+    single in-flight task, so a burst of equal requests hits the network once.
+
+    :ivar backend: The backend shared by every function decorated through it.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def cache(self, func=None, *, ignore=()):
+        """
+        Decorates a function so its results are cached by argument values.
+
+        Usable as ``@memory.cache`` or ``@memory.cache(ignore=["client"])``.
+
+        :param func: The function to decorate
+        :param ignore: Parameter names left out of the cache key, optional
+        :return: The decorated function, exposing ``cache_clear()``
+        """
+        if func is None:
+            return lambda f: self.cache(f, ignore=ignore)
+
+        name = function_name(func)
+        backend = self.backend
+
+        if asyncio.iscoroutinefunction(func):
+            in_flight = {}
+
+            async def compute(key, args, kwargs):
+                try:
+                    value = await func(*args, **kwargs)
+                    backend.set(key, value)
+                    return value
+                finally:
+                    in_flight.pop(key, None)
+
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                key = f"{name}/{make_key(func, args, kwargs, ignore)}"
+                value = backend.get(key)
+                if value is not MISSING:
+                    return value
+
+                task = in_flight.get(key)
+                if task is None or task.get_loop() is not asyncio.get_running_loop():
+                    task = asyncio.ensure_future(compute(key, args, kwargs))
+                    in_flight[key] = task
+                # shield so one cancelled caller doesn't cancel the shared call
+                return await asyncio.shield(task)
+
+            wrapper = async_wrapper
+        else:
+
+            @wraps(func)
+            def sync_wrapper(*args, **kwargs):
+                key = f"{name}/{make_key(func, args, kwargs, ignore)}"
+                value = backend.get(key)
+                if value is MISSING:
+                    value = func(*args, **kwargs)
+                    backend.set(key, value)
+                return value
+
+            wrapper = sync_wrapper
+
+        wrapper.cache_clear = lambda: backend.clear(name)
+        return wrapper
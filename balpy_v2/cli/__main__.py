@@ -2,16 +2,20 @@ from click import command
 
 import asyncclick as click
 
-from balpy_v2.contracts.base_contract import BalancerContractFactory
+# web3 and the contract modules are imported inside the commands using them,
+# so invocations that don't need them (and shell completion) start fast
 from balpy_v2.lib import Chain
 from balpy_v2.cli.helpers import (
     _network_autocompletion,
+    _contract_autocompletion,
     _contract_function_autocompletion,
     _vault_function_autocompletion,
     print_function_info,
     get_read_and_write_functions,
     print_contract_details,
+    format_bytes,
 )
+import json
 import logging
 
 
@@ -31,17 +35,90 @@ def get_chain_from_context(ctx):
 @click.option(
     "-v", "--verbose", count=True, help="Increase verbosity (e.g., -v or -vv)."
 )
+@click.option(
+    "--no-daemon", is_flag=True, help="Don't use a running balpy serve daemon."
+)
+@click.option(
+    "--metrics",
+    "metrics_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write a JSON summary of requests, caches and stages to this file.",
+)
+@click.option(
+    "--profile",
+    "profile_dir",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Profile the command, writing collapsed stacks and hotspots here.",
+)
 @click.pass_context
-def balpy(ctx, network, verbose):
+def balpy(ctx, network, verbose, no_daemon, metrics_path, profile_dir):
     log_level = max(logging.WARNING - 10 * verbose, logging.DEBUG)
     logging.basicConfig(level=log_level)
     ctx.ensure_object(dict)
     ctx.obj["verbose"] = verbose
     ctx.obj["network"] = Chain[network] if network else Chain.mainnet
+    ctx.obj["daemon"] = not no_daemon
+    if metrics_path:
+
+        def write_metrics():
+            from balpy_v2.lib.metrics import metrics
+
+            metrics.write_summary(metrics_path)
+
+        ctx.call_on_close(write_metrics)
+    if profile_dir:
+        from balpy_v2.lib.profiling import Profiler
+
+        profiler = Profiler().start()
+
+        def write_profile():
+            profiler.stop()
+            for path in profiler.write(profile_dir):
+                click.echo(f"Profile written to {path}", err=True)
+
+        ctx.call_on_close(write_profile)
+
+
+async def get_daemon_from_context(ctx):
+    """
+    Returns a client of the running daemon, or None if there's none or it
+    was disabled with --no-daemon.
+    """
+    if not ctx.obj.get("daemon"):
+        return None
+    from balpy_v2.daemon.client import get_daemon_client
+
+    return await get_daemon_client()
+
+
+async def call_on_daemon(ctx, contract_identifier, function_name, args=()):
+    """
+    Runs a contract call on the running daemon.
+
+    :return: The call's result dict, or None when no daemon is running
+    """
+    client = await get_daemon_from_context(ctx)
+    if client is None:
+        return None
+    spec = dict(
+        chain=get_chain_from_context(ctx).name,
+        contract=contract_identifier,
+        function=function_name,
+        args=list(args),
+    )
+    try:
+        (line,) = await client.batch([json.dumps(spec)])
+    finally:
+        await client.aclose()
+    return json.loads(line)
 
 
 # Create a new function that creates a contract from the current context
 def create_contract_from_context(ctx):
+    from balpy_v2.contracts.base_contract import BalancerContractFactory
+
     network = ctx.obj["network"]
     chain = Chain.mainnet if network == "mainnet" else Chain.polygon
     contract = BalancerContractFactory.create(chain, ctx.obj["contract_identifier"])
@@ -66,7 +143,7 @@ def vault(ctx):
 
 # Replace the contract group with this group
 @balpy.group("contract")
-@click.argument("identifier")
+@click.argument("identifier", shell_complete=_contract_autocompletion)
 @click.pass_context
 def contract(ctx, identifier):
     ctx.obj["contract_identifier"] = identifier
@@ -93,6 +170,18 @@ def contract_info(ctx):
 )
 @click.pass_context
 async def vault_fn(ctx, function_name, list, filter):
+    if function_name and not list:
+        response = await call_on_daemon(ctx, "Vault", function_name)
+        if response is not None:
+            if "error" in response:
+                click.echo(click.style(f"Error: {response['error']}", fg="red"))
+                return
+            click.echo(click.style(f"Result of {function_name}:", fg="cyan"))
+            click.echo(click.style(f"  {response['result']}", fg="white"))
+            return
+
+    from balpy_v2.contracts.base_contract import BalancerContractFactory
+
     network = ctx.obj["network"]
     chain = Chain.mainnet if network == "mainnet" else Chain.polygon
     vault = BalancerContractFactory.create(chain, "Vault")
@@ -129,6 +218,16 @@ async def vault_fn(ctx, function_name, list, filter):
 async def contract_fn(ctx, function_name, args):
     logging.debug("Entering fn command")
 
+    response = await call_on_daemon(
+        ctx, ctx.obj["contract_identifier"], function_name, args
+    )
+    if response is not None:
+        if "error" in response:
+            click.echo(click.style(f"Error: {response['error']}", fg="red"))
+        else:
+            click.echo(click.style(f"Result: {response['result']}", fg="green"))
+        return
+
     contract = create_contract_from_context(ctx)
 
     try:
@@ -141,5 +240,315 @@ async def contract_fn(ctx, function_name, args):
         click.echo(click.style(f"Error: {e}", fg="red"))
 
 
+@balpy.command("batch", help="Run JSONL contract calls, batched with Multicall3.")
+@click.argument("calls", type=click.File("r"), default="-")
+@click.option(
+    "--batch-size", type=int, default=100, help="Maximum calls per multicall."
+)
+@click.option(
+    "--concurrency", type=int, default=8, help="Maximum multicalls in flight."
+)
+@click.pass_context
+async def batch(ctx, calls, batch_size, concurrency):
+    from balpy_v2.contracts.multicall import CallSpec, run_batch
+
+    lines, specs = [], []
+    for number, line in enumerate(calls, start=1):
+        if not line.strip():
+            continue
+        try:
+            specs.append(CallSpec.from_json(line))
+        except (ValueError, KeyError, TypeError) as e:
+            raise click.BadParameter(f"line {number}: {e}", param_hint="CALLS")
+        lines.append(line.strip())
+
+    client = await get_daemon_from_context(ctx)
+    if client is not None:
+        try:
+            for result in await client.batch(lines):
+                click.echo(result)
+        finally:
+            await client.aclose()
+        return
+
+    async for result in run_batch(specs, batch_size, concurrency):
+        click.echo(result)
+
+
+@balpy.command(
+    "serve", help="Keep contracts, blocks and prices warm behind a local API."
+)
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Unix socket to listen on.",
+)
+@click.option("--host", default="127.0.0.1", show_default=True)
+@click.option("--port", type=int, default=None, help="Listen on TCP instead.")
+async def serve(socket_path, host, port):
+    from balpy_v2.daemon import DAEMON_SOCKET_PATH
+    from balpy_v2.daemon.server import Daemon
+
+    socket_path = socket_path or DAEMON_SOCKET_PATH
+    click.echo(
+        click.style(
+            f"Serving on {f'{host}:{port}' if port else socket_path}", fg="green"
+        ),
+        err=True,
+    )
+    await Daemon().serve(socket_path, host, port)
+
+
+@balpy.group("fees", help="Compute protocol fee reports.")
+def fees():
+    pass
+
+
+def pool_options(command):
+    """
+    Adds the --pool, --gauges and --chain options selecting pools to report on.
+    """
+    options = [
+        click.option(
+            "--pool",
+            "pools",
+            multiple=True,
+            help="A pool id, or <chain>:<pool id>. Can be repeated.",
+        ),
+        click.option(
+            "--gauges",
+            type=click.Path(exists=True, dir_okay=False),
+            help="A gauges JSON file to take the pools from.",
+        ),
+        click.option(
+            "--all-gauges",
+            is_flag=True,
+            help="Take the pools of every live gauge from the gauges subgraphs.",
+        ),
+        click.option(
+            "--chain",
+            "chains",
+            multiple=True,
+            type=click.Choice([x.name for x in Chain], case_sensitive=False),
+            help="Only report on these chains. Can be repeated.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+async def pools_from_options(pools, gauges, all_gauges, chains):
+    from fees_reporting.report import parse_pool, pools_from_gauges
+
+    chains = [Chain[name] for name in chains]
+    default_chain = chains[0] if chains else Chain.mainnet
+    pool_ids_chains = [parse_pool(pool, default_chain) for pool in pools]
+    if gauges:
+        pool_ids_chains += pools_from_gauges(gauges, chains)
+    if all_gauges:
+        from balpy_v2.subgraphs.gauges import DEPLOYED_CHAINS, get_gauge_universe
+
+        universe = await get_gauge_universe(
+            [chain for chain in DEPLOYED_CHAINS if not chains or chain in chains]
+        )
+        pool_ids_chains += universe.select().pool_ids_chains()
+    if not pool_ids_chains:
+        raise click.UsageError("Give pools with --pool, --gauges or --all-gauges.")
+    return list(dict.fromkeys(pool_ids_chains))
+
+
+@fees.command("report", help="Compute fees per cycle, pool and token.")
+@pool_options
+@click.option(
+    "--from-cycle",
+    type=click.IntRange(min=1),
+    default=None,
+    help="First cycle, from 1.",
+)
+@click.option(
+    "--to-cycle",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Last cycle (inclusive).",
+)
+@click.option("--jobs", type=int, default=None, help="Processes to aggregate fees in.")
+@click.option(
+    "--output",
+    type=click.Path(file_okay=False),
+    default="fees_report",
+    show_default=True,
+    help="Directory of the report and its checkpoint.",
+)
+@click.option(
+    "--format",
+    "output_format",
+    type=click.Choice(["parquet", "csv"]),
+    default="parquet",
+    show_default=True,
+)
+@click.option(
+    "--store",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Directory raw events are cached in.",
+)
+@click.option(
+    "--update-aggregates",
+    is_flag=True,
+    help="Also upsert the result into the fee aggregate store.",
+)
+@click.option(
+    "--restart", is_flag=True, help="Discard completed units of a previous run."
+)
+@click.option(
+    "--aggregate-first",
+    is_flag=True,
+    help="Report per-pool totals from subgraph snapshots, only fetching the "
+    "events of pools failing their checks. The report has one row per cycle "
+    "and pool, without token amounts: swapFeeUSD, joinExitFeeUSD, totalUSD and "
+    "the source of the row, snapshot or events.",
+)
+async def fees_report(
+    pools,
+    gauges,
+    all_gauges,
+    chains,
+    from_cycle,
+    to_cycle,
+    jobs,
+    output,
+    output_format,
+    store,
+    update_aggregates,
+    restart,
+    aggregate_first,
+):
+    from fees_reporting.aggregate_store import aggregate_store
+    from fees_reporting.event_store import EventStore, event_store
+    from fees_reporting.report import run_report, select_cycles
+
+    pool_ids_chains = await pools_from_options(pools, gauges, all_gauges, chains)
+    cycles = select_cycles(from_cycle, to_cycle)
+    if not cycles:
+        raise click.UsageError("No cycle in the given range.")
+
+    path = await run_report(
+        pool_ids_chains,
+        cycles,
+        output,
+        output_format,
+        jobs=jobs,
+        store=EventStore(store) if store else event_store,
+        aggregate_store=aggregate_store if update_aggregates else None,
+        restart=restart,
+        aggregate_first=aggregate_first,
+        echo=lambda line: click.echo(line, err=True),
+    )
+    click.echo(click.style(f"Report written to {path}", fg="green"))
+
+
+@fees.command("follow", help="Keep the current cycle's fees up to date.")
+@pool_options
+@click.option(
+    "--interval", type=float, default=60, show_default=True, help="Seconds per poll."
+)
+@click.option(
+    "--reorg-depth",
+    type=int,
+    default=12,
+    show_default=True,
+    help="Blocks behind the subgraph head an event must be to be counted.",
+)
+@click.option(
+    "--update-aggregates",
+    is_flag=True,
+    help="Upsert the running totals into the fee aggregate store.",
+)
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    help="Serve Prometheus metrics on this port, at /metrics.",
+)
+async def fees_follow(
+    pools,
+    gauges,
+    all_gauges,
+    chains,
+    interval,
+    reorg_depth,
+    update_aggregates,
+    metrics_port,
+):
+    import asyncio
+
+    from fees_reporting.aggregate_store import aggregate_store
+    from fees_reporting.follow import FeeFollower
+
+    follower = FeeFollower(
+        await pools_from_options(pools, gauges, all_gauges, chains),
+        reorg_depth,
+        aggregate_store=aggregate_store if update_aggregates else None,
+    )
+
+    def report(follower, events):
+        blocks = ", ".join(
+            f"{chain.name}@{block}" for chain, (block, _) in follower.cursors.items()
+        )
+        total = follower.per_cycle["totalUSD"].sum()
+        click.echo(f"{blocks}: {events} new events, {total:,.2f} USD in fees")
+
+    if metrics_port is None:
+        await follower.follow(interval, on_poll=report)
+        return
+
+    from balpy_v2.daemon.server import Daemon
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(Daemon().serve(port=metrics_port))
+        group.create_task(follower.follow(interval, on_poll=report))
+
+
+@balpy.group("cache", help="Inspect and prune the local caches.")
+def cache():
+    pass
+
+
+@cache.command("stats", help="Display entries, size and hit rate per namespace.")
+def cache_stats():
+    from balpy_v2.cache import cache_manager
+
+    for name, stats in cache_manager.stats().items():
+        # in-memory namespaces only live as long as this process
+        if stats["kind"] == "memory" and not stats["entries"]:
+            continue
+        click.echo(click.style(f"{name} ({stats['kind']}):", fg="cyan"))
+        click.echo(
+            f"  entries: {stats['entries']}, size: {format_bytes(stats['bytes'])}"
+        )
+        click.echo(
+            f"  hits: {stats['hits']}, misses: {stats['misses']}, "
+            f"hit ratio: {stats['hit_ratio']:.1%}, evictions: {stats['evictions']}"
+        )
+
+
+@cache.command("prune", help="Evict expired and least recently used entries.")
+@click.option("--namespace", default=None, help="Only prune this namespace.")
+@click.option("--max-bytes", type=int, default=None, help="Size budget in bytes.")
+@click.option("--max-entries", type=int, default=None, help="Entries budget.")
+@click.option(
+    "--older-than", type=int, default=None, help="Evict entries older than N seconds."
+)
+def cache_prune(namespace, max_bytes, max_entries, older_than):
+    from balpy_v2.cache import cache_manager
+
+    evicted = cache_manager.prune(namespace, max_entries, max_bytes, older_than)
+    for name, count in evicted.items():
+        click.echo(f"{name}: {count} entries evicted")
+
+
 if __name__ == "__main__":
     balpy(_anyio_backend="asyncio")
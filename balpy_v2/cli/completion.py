@@ -0,0 +1,103 @@
+import json
+import os
+
+from balpy_v2.cache import CACHE_DIR
+
+DEPLOYMENTS_DIR = os.path.join("balpy_v2", "deployments")
+COMPLETION_INDEX_PATH = os.path.join(CACHE_DIR, "completion_index.json")
+
+
+def _addresses_path(chain_name):
+    return os.path.join(DEPLOYMENTS_DIR, "addresses", f"{chain_name}.json")
+
+
+def _artifact_path(task, name):
+    return os.path.join(DEPLOYMENTS_DIR, "tasks", task, "artifact", f"{name}.json")
+
+
+def _read_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+class CompletionIndex:
+    """
+    An on-disk index of contract names and ABI function names per chain.
+
+    Shell completion runs on every keystroke, so it reads this small JSON file
+    instead of importing web3 and building contracts. A chain's entry is
+    rebuilt from the deployment files whenever its address book changes.
+
+    :ivar path: The JSON file the index is stored in.
+    """
+
+    def __init__(self, path=COMPLETION_INDEX_PATH):
+        self.path = path
+        self._index = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            try:
+                self._index = _read_json(self.path)
+            except (OSError, ValueError):
+                self._index = {}
+        return self._index
+
+    def _build(self, chain_name):
+        address_book = _read_json(_addresses_path(chain_name))
+        contracts, addresses = {}, {}
+        for address, deployment in address_book.items():
+            name = deployment["name"]
+            addresses[address.lower()] = name
+            if name in contracts:
+                continue
+            path = _artifact_path(deployment["task"], name)
+            abi = _read_json(path)["abi"] if os.path.exists(path) else []
+            contracts[name] = sorted(
+                {item["name"] for item in abi if item.get("type") == "function"}
+            )
+        return dict(contracts=contracts, addresses=addresses)
+
+    def chain(self, chain_name):
+        """
+        Returns the index of a chain, rebuilding it if the address book changed.
+        """
+        addresses_path = _addresses_path(chain_name)
+        if not os.path.exists(addresses_path):
+            return dict(contracts={}, addresses={})
+        mtime = os.path.getmtime(addresses_path)
+        entry = self.index.get(chain_name)
+        if entry is None or entry.get("mtime") != mtime:
+            entry = dict(self._build(chain_name), mtime=mtime)
+            self.index[chain_name] = entry
+            self.save()
+        return entry
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.index, f)
+        os.replace(tmp_path, self.path)
+
+    def contract_names(self, chain_name):
+        return sorted(self.chain(chain_name)["contracts"])
+
+    def function_names(self, chain_name, identifier):
+        """
+        Returns the function names of a contract given by name or address.
+        """
+        entry = self.chain(chain_name)
+        name = entry["addresses"].get(identifier.lower(), identifier)
+        return next(
+            (
+                functions
+                for contract, functions in entry["contracts"].items()
+                if contract.casefold() == name.casefold()
+            ),
+            [],
+        )
+
+
+completion_index = CompletionIndex()
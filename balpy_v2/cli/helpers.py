@@ -1,39 +1,36 @@
 import asyncclick as click
 
-from balpy_v2.contracts.base_contract import BalancerContractFactory
+from balpy_v2.cli.completion import completion_index
 from balpy_v2.lib import Chain
 
 import logging
 
 
 def _network_autocompletion(ctx, args, incomplete):
-    networks = ["mainnet", "polygon"]
+    networks = [chain.name for chain in Chain]
     return [n for n in networks if n.startswith(incomplete)]
 
 
+def _chain_name(ctx):
+    return ctx.find_root().params.get("network") or Chain.mainnet.name
+
+
+def _contract_autocompletion(ctx, args, incomplete):
+    names = completion_index.contract_names(_chain_name(ctx))
+    return [name for name in names if name.startswith(incomplete)]
+
+
 def _vault_function_autocompletion(ctx, args, incomplete):
-    chain = Chain.mainnet if "mainnet" in args else Chain.polygon
-    vault = BalancerContractFactory.create(chain, "Vault")
-    functions = [f["name"] for f in vault.web3_contract.abi if f["type"] == "function"]
+    functions = completion_index.function_names(_chain_name(ctx), "Vault")
     return [fn for fn in functions if fn.startswith(incomplete)]
 
 
 def _contract_function_autocompletion(ctx, args, incomplete):
-    chain = Chain.mainnet if "mainnet" in args else Chain.polygon
-
-    contract_address_key = "contract"
-    contract_address_index = (
-        args.index(contract_address_key) + 1 if contract_address_key in args else None
-    )
-    contract_address = args[contract_address_index] if contract_address_index else None
-
-    if not contract_address:
+    contract_identifier = ctx.parent.params.get("identifier") if ctx.parent else None
+    if not contract_identifier:
         return []
 
-    contract = BalancerContractFactory.create(chain, contract_address)
-    functions = [
-        f["name"] for f in contract.web3_contract.abi if f["type"] == "function"
-    ]
+    functions = completion_index.function_names(_chain_name(ctx), contract_identifier)
     return [fn for fn in functions if fn.startswith(incomplete)]
 
 
@@ -97,3 +94,11 @@ def print_contract_details(contract):
     click.echo(click.style("Write functions:", fg="cyan"))
     for function in write_functions:
         print_function_info(function)
+
+
+def format_bytes(size):
+    for unit in ["B", "KiB", "MiB"]:
+        if size < 1024:
+            return f"{size:.0f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
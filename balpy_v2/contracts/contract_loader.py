@@ -1,10 +1,11 @@
 import os
 import json
-from functools import cache
 from balpy_v2.lib import CaseInsensitiveDict, Chain
 import logging
 from balpy_v2.lib.web3_provider import Web3Provider
-from balpy_v2.cache import memory
+from balpy_v2.cache import cache_manager, memory
+
+abi_cache = cache_manager.namespace("abis", max_entries=1024, disk=False)
 
 
 @memory.cache
@@ -87,7 +88,7 @@ def load_all_deployments_artifacts():
     return artifacts
 
 
-@cache
+@abi_cache.cache
 def load_deployment_address_task(network, address):
     """
     Loads the deployment address task for a given network and address.
@@ -100,7 +101,7 @@ def load_deployment_address_task(network, address):
     return address_book.get(address)
 
 
-@cache
+@abi_cache.cache
 def load_task_artifact(task, name):
     """
     Loads a task artifact with the given task and name from a JSON file.
@@ -118,7 +119,7 @@ def load_task_artifact(task, name):
         return json.load(f)
 
 
-@cache
+@abi_cache.cache
 def load_abi_from_address(network, address):
     """
     Loads the ABI for a contract deployed on a given network and address.
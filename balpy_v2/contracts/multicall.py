@@ -0,0 +1,204 @@
+import asyncio
+import json
+import logging
+
+from eth_utils.abi import collapse_if_tuple
+
+from balpy_v2.contracts.base_contract import BalancerContractFactory
+from balpy_v2.lib import Chain
+from balpy_v2.lib.metrics import metrics
+from balpy_v2.lib.web3_provider import Web3Provider
+
+# https://www.multicall3.com - same address on every supported chain
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL3_ABI = [
+    {
+        "name": "aggregate3",
+        "type": "function",
+        "stateMutability": "payable",
+        "inputs": [
+            {
+                "name": "calls",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "target", "type": "address"},
+                    {"name": "allowFailure", "type": "bool"},
+                    {"name": "callData", "type": "bytes"},
+                ],
+            }
+        ],
+        "outputs": [
+            {
+                "name": "returnData",
+                "type": "tuple[]",
+                "components": [
+                    {"name": "success", "type": "bool"},
+                    {"name": "returnData", "type": "bytes"},
+                ],
+            }
+        ],
+    }
+]
+
+BATCH_SIZE = 100
+CONCURRENCY = 8
+
+
+class CallSpec:
+    """
+    A read-only contract call, as given by one JSONL line of ``balpy batch``.
+
+    :ivar chain: The Chain to call on
+    :ivar contract: The contract name or address
+    :ivar function: The function name
+    :ivar args: The function arguments
+    :ivar block: The block number to call at, or "latest"
+    """
+
+    def __init__(self, contract, function, args=(), chain=None, block=None):
+        self.chain = Chain[chain] if chain else Chain.mainnet
+        self.contract = contract
+        self.function = function
+        self.args = list(args)
+        self.block = block if block is not None else "latest"
+
+    @classmethod
+    def from_json(cls, line):
+        return cls(**json.loads(line))
+
+    def as_dict(self):
+        return dict(
+            chain=self.chain.name,
+            contract=self.contract,
+            function=self.function,
+            args=self.args,
+            block=self.block,
+        )
+
+    def contract_function(self):
+        contract = BalancerContractFactory.create(self.chain, self.contract)
+        if not contract._function_exists_in_abi(self.function):
+            raise AttributeError(f"Function '{self.function}' not found.")
+        return getattr(contract.web3_contract.functions, self.function)(*self.args)
+
+
+def _to_json(value):
+    if isinstance(value, bytes):
+        return "0x" + value.hex()
+    if isinstance(value, (list, tuple)):
+        return [_to_json(item) for item in value]
+    return value
+
+
+def _decode(w3, function, data):
+    types = [collapse_if_tuple(output) for output in function.abi["outputs"]]
+    values = w3.codec.decode(types, data)
+    return values[0] if len(values) == 1 else list(values)
+
+
+async def _call_each(functions, block):
+    """
+    Calls functions one by one, for chains or blocks without Multicall3.
+    """
+
+    async def call(function):
+        try:
+            return dict(result=await function.call(block_identifier=block))
+        except Exception as e:
+            return dict(error=str(e))
+
+    return await asyncio.gather(*[call(function) for function in functions])
+
+
+async def multicall(chain, functions, block="latest"):
+    """
+    Runs contract function calls in a single Multicall3 ``aggregate3`` call,
+    falling back to individual calls when Multicall3 isn't available.
+
+    :param chain: The Chain to call on
+    :param functions: Bound web3 contract functions
+    :param block: The block number to call at, or "latest"
+    :return: One dict per call, with either a "result" or an "error"
+    """
+    w3 = Web3Provider.get_instance(chain)
+    multicall3 = w3.eth.contract(address=MULTICALL3_ADDRESS, abi=MULTICALL3_ABI)
+    calls = [
+        (function.address, True, function._encode_transaction_data())
+        for function in functions
+    ]
+    metrics.inc("multicall_calls", len(calls), chain=chain.name)
+    try:
+        responses = await multicall3.functions.aggregate3(calls).call(
+            block_identifier=block
+        )
+    except Exception as e:
+        logging.debug(f"Multicall3 failed on {chain.name} at {block}: {e}")
+        return await _call_each(functions, block)
+
+    results = []
+    for function, (success, data) in zip(functions, responses):
+        if not success:
+            results.append(dict(error="execution reverted"))
+            continue
+        try:
+            results.append(dict(result=_decode(w3, function, data)))
+        except Exception as e:
+            results.append(dict(error=str(e)))
+    return results
+
+
+async def run_batch(specs, batch_size=BATCH_SIZE, concurrency=CONCURRENCY):
+    """
+    Runs call specs concurrently, grouping them per (chain, block) into
+    Multicall3 batches, and yields JSONL results in input order as soon as
+    every earlier result is ready.
+
+    :param specs: A list of CallSpec
+    :param batch_size: The maximum number of calls per multicall
+    :param concurrency: The maximum number of multicalls in flight
+    """
+    results = [None] * len(specs)
+    ready = [asyncio.Event() for _ in specs]
+
+    def resolve(index, result):
+        results[index] = dict(specs[index].as_dict(), **result)
+        ready[index].set()
+
+    groups = {}
+    for index, spec in enumerate(specs):
+        try:
+            function = spec.contract_function()
+        except Exception as e:
+            resolve(index, dict(error=str(e)))
+            continue
+        groups.setdefault((spec.chain, spec.block), []).append((index, function))
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(chain, block, batch):
+        try:
+            async with semaphore:
+                responses = await multicall(chain, [f for _, f in batch], block)
+            for (index, _), response in zip(batch, responses):
+                resolve(index, response)
+        except Exception as e:
+            # an unresolved index would block the output forever
+            for index, _ in batch:
+                if not ready[index].is_set():
+                    resolve(index, dict(error=str(e)))
+
+    tasks = [
+        asyncio.create_task(run(chain, block, calls[i : i + batch_size]))
+        for (chain, block), calls in groups.items()
+        for i in range(0, len(calls), batch_size)
+    ]
+    try:
+        for index in range(len(specs)):
+            await ready[index].wait()
+            result = dict(results[index], result=_to_json(results[index].get("result")))
+            if "error" in result:
+                del result["result"]
+            yield json.dumps(result)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,9 @@
+import os
+
+from balpy_v2.cache import CACHE_DIR
+
+DAEMON_SOCKET_PATH = os.getenv(
+    "BALPY_DAEMON_SOCKET", os.path.join(CACHE_DIR, "balpy.sock")
+)
+# e.g. http://127.0.0.1:8545, to reach a daemon served over TCP instead
+DAEMON_URL = os.getenv("BALPY_DAEMON_URL")
@@ -0,0 +1,79 @@
+import os
+
+import httpx
+
+from balpy_v2.daemon import DAEMON_SOCKET_PATH, DAEMON_URL
+
+HEALTH_TIMEOUT = 0.5
+REQUEST_TIMEOUT = 120
+
+
+class DaemonClient:
+    """
+    A client of a running ``balpy serve`` daemon.
+
+    :ivar client: The httpx AsyncClient bound to the daemon's socket or URL.
+    """
+
+    def __init__(self, socket_path=DAEMON_SOCKET_PATH, url=DAEMON_URL):
+        if url:
+            self.client = httpx.AsyncClient(base_url=url, timeout=REQUEST_TIMEOUT)
+        else:
+            transport = httpx.AsyncHTTPTransport(uds=socket_path)
+            self.client = httpx.AsyncClient(
+                transport=transport, base_url="http://balpy", timeout=REQUEST_TIMEOUT
+            )
+
+    async def request(self, method, path, params=None, content=None, **kwargs):
+        response = await self.client.request(
+            method, path, params=params, content=content, **kwargs
+        )
+        if response.status_code != httpx.codes.OK:
+            raise RuntimeError(response.json()["error"])
+        if response.headers["content-type"] == "application/x-ndjson":
+            return response.text.splitlines()
+        if response.headers["content-type"].startswith("text/plain"):
+            return response.text
+        return response.json()
+
+    async def batch(self, lines):
+        """
+        Runs JSONL call specs on the daemon, returning its JSONL results.
+        """
+        return await self.request("POST", "/batch", content="\n".join(lines))
+
+    async def block(self, chain, timestamp):
+        response = await self.request(
+            "GET", "/block", params=dict(chain=chain.name, timestamp=timestamp)
+        )
+        return response["block"]
+
+    async def price(self, coins, timestamp=None):
+        params = dict(coins=coins)
+        if timestamp is not None:
+            params["timestamp"] = timestamp
+        return await self.request("GET", "/price", params=params)
+
+    async def fees(self, **params):
+        return await self.request("GET", "/fees", params=params)
+
+    async def metrics(self):
+        return await self.request("GET", "/metrics")
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+async def get_daemon_client(socket_path=DAEMON_SOCKET_PATH, url=DAEMON_URL):
+    """
+    Returns a client of the running daemon, or None when none answers.
+    """
+    if not url and not os.path.exists(socket_path):
+        return None
+    client = DaemonClient(socket_path, url)
+    try:
+        await client.request("GET", "/health", timeout=HEALTH_TIMEOUT)
+    except (httpx.HTTPError, RuntimeError, OSError):
+        await client.aclose()
+        return None
+    return client
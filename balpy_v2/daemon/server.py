@@ -0,0 +1,200 @@
+import asyncio
+import json
+import logging
+import os
+from http import HTTPStatus
+from urllib.parse import parse_qsl, urlsplit
+
+from balpy_v2.cache import cache_manager
+from balpy_v2.contracts.multicall import CallSpec, run_batch
+from balpy_v2.daemon import DAEMON_SOCKET_PATH
+from balpy_v2.lib import Chain, llama
+from balpy_v2.lib.metrics import metrics
+from balpy_v2.lib.time import MINUTE_IN_SECONDS
+from balpy_v2.subgraphs.blocks import get_block_number_by_timestamp
+
+# kept in the daemon's memory on top of the disk caches of each lookup
+historical_prices_cache = cache_manager.namespace(
+    "daemon_historical_prices", max_entries=100_000, disk=False
+)
+current_prices_cache = cache_manager.namespace(
+    "daemon_current_prices", ttl=MINUTE_IN_SECONDS, disk=False
+)
+blocks_cache = cache_manager.namespace("daemon_blocks", disk=False)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4"
+
+
+@historical_prices_cache.cache
+async def get_historical_prices(timestamp, coins):
+    return await llama.get_historical_prices(timestamp, coins)
+
+
+@current_prices_cache.cache
+async def get_current_prices(coins):
+    return await llama.get_current_prices(coins)
+
+
+@blocks_cache.cache
+async def get_block(chain, timestamp):
+    return await get_block_number_by_timestamp(chain=chain, timestamp=timestamp)
+
+
+class Daemon:
+    """
+    A long-running process answering contract reads, block, price and fee
+    queries over a minimal HTTP/1.1 JSON API, on a Unix socket or TCP port.
+
+    Contracts, ABIs and web3 providers are singletons of the process, and
+    blocks and prices are cached in memory, so everything a query touches
+    stays warm across requests. Handlers return JSON data, JSONL as a str,
+    or a (content type, text) pair.
+
+    :ivar routes: A dictionary of (method, path) to handler.
+    """
+
+    def __init__(self):
+        self.routes = {
+            ("GET", "/health"): self.health,
+            ("POST", "/batch"): self.batch,
+            ("GET", "/block"): self.block,
+            ("GET", "/price"): self.price,
+            ("GET", "/fees"): self.fees,
+            ("GET", "/metrics"): self.metrics,
+        }
+        self._aggregates_mtime = None
+
+    async def health(self, params, body):
+        return dict(status="ok", pid=os.getpid())
+
+    async def batch(self, params, body):
+        """
+        Runs JSONL call specs, answering with JSONL results in input order.
+        """
+        specs = [CallSpec.from_json(line) for line in body.splitlines() if line.strip()]
+        lines = [line async for line in run_batch(specs)]
+        return "".join(f"{line}\n" for line in lines)
+
+    async def block(self, params, body):
+        chain = Chain[params.get("chain", Chain.mainnet.name)]
+        return dict(block=await get_block(chain, int(params["timestamp"])))
+
+    async def price(self, params, body):
+        if "timestamp" in params:
+            return await get_historical_prices(
+                int(params["timestamp"]), params["coins"]
+            )
+        return await get_current_prices(params["coins"])
+
+    async def metrics(self, params, body):
+        """
+        Exposes the process metrics in the Prometheus text format.
+        """
+        return PROMETHEUS_CONTENT_TYPE, metrics.prometheus()
+
+    def _aggregate_store(self):
+        from fees_reporting.aggregate_store import aggregate_store
+
+        # reports upsert from other processes, reload when the files change
+        mtime = (
+            max(
+                (entry.stat().st_mtime for entry in os.scandir(aggregate_store.root)),
+                default=None,
+            )
+            if os.path.isdir(aggregate_store.root)
+            else None
+        )
+        if mtime != self._aggregates_mtime:
+            self._aggregates_mtime = mtime
+            aggregate_store._frame = None
+        return aggregate_store
+
+    async def fees(self, params, body):
+        """
+        Queries per-cycle fee aggregates, grouped ``by`` "pool", "chain" or
+        not at all ("rows"), optionally keeping the ``top`` pools.
+        """
+        store = self._aggregate_store()
+        start = int(params["start_cycle"]) if "start_cycle" in params else None
+        end = int(params["end_cycle"]) if "end_cycle" in params else None
+        chain = Chain[params["chain"]] if "chain" in params else None
+        by = params.get("by", "pool")
+        if "top" in params:
+            df = store.top_pools(int(params["top"]), start, end, chain)
+        elif by == "pool":
+            df = store.fees_per_pool(start, end, chain)
+        elif by == "chain":
+            df = store.chain_totals(start, end)
+        elif by == "rows":
+            df = store.select(start, end, chain)
+        else:
+            raise ValueError(f"Unknown grouping '{by}'")
+        return df.reset_index().to_dict(orient="records")
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            return HTTPStatus.NOT_FOUND, dict(error=f"No route {method} {url.path}")
+        try:
+            return HTTPStatus.OK, await handler(dict(parse_qsl(url.query)), body)
+        except (KeyError, ValueError, TypeError) as e:
+            return HTTPStatus.BAD_REQUEST, dict(error=str(e))
+        except Exception as e:
+            logging.exception(f"{method} {target} failed")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, dict(error=str(e))
+
+    async def handle(self, reader, writer):
+        try:
+            while request_line := await reader.readline():
+                method, target, _ = request_line.decode().split(" ", 2)
+                headers = {}
+                while (line := await reader.readline()).strip():
+                    name, _, value = line.decode().partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                length = int(headers.get("content-length", 0))
+                body = (await reader.readexactly(length)).decode()
+
+                status, payload = await self.dispatch(method, target, body)
+                if isinstance(payload, tuple):
+                    content_type, data = payload[0], payload[1].encode()
+                elif isinstance(payload, str):
+                    content_type, data = "application/x-ndjson", payload.encode()
+                else:
+                    content_type, data = (
+                        "application/json",
+                        json.dumps(payload).encode(),
+                    )
+                writer.write(
+                    f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+                    f"Content-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, socket_path=DAEMON_SOCKET_PATH, host=None, port=None):
+        """
+        Serves until cancelled, on ``host:port`` if a port is given and on
+        ``socket_path`` otherwise.
+        """
+        if port is not None:
+            server = await asyncio.start_server(self.handle, host or "127.0.0.1", port)
+            logging.info(f"Serving on {host or '127.0.0.1'}:{port}")
+        else:
+            os.makedirs(os.path.dirname(socket_path) or ".", exist_ok=True)
+            if os.path.exists(socket_path):
+                os.remove(socket_path)
+            server = await asyncio.start_unix_server(self.handle, socket_path)
+            logging.info(f"Serving on {socket_path}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            if port is None and os.path.exists(socket_path):
+                os.remove(socket_path)
@@ -49,6 +49,64 @@ def flatten_json(nested_json):
     return out
 
 
+def compile_flat_schema(records, sep="_"):
+    """
+    Compile the flat field paths of bulk json records.
+    The schema comes from the first record; paths that are null there are
+    resolved from the first later record where they are set. Lists are kept
+    as values.
+    Args:
+        records: A list of nested json objects sharing one shape.
+        sep: The separator joining nested keys into column names.
+    Returns:
+        A list of (column name, key path) pairs.
+    """
+    schema = []
+    stack = [((), records[0])] if records else []
+    while stack:
+        path, node = stack.pop()
+        if node is None and path:
+            node = next(
+                (v for v in (_get_path(r, path) for r in records) if v is not None),
+                None,
+            )
+        if type(node) is dict:
+            stack.extend((path + (key,), node[key]) for key in reversed(node))
+        else:
+            schema.append((sep.join(path), path))
+    return schema
+
+
+def _get_path(record, path):
+    for key in path:
+        if type(record) is not dict:
+            return None
+        record = record.get(key)
+    return record
+
+
+def flatten_records(records, sep="_", schema=None):
+    """
+    Flatten bulk json records into columns, without a dict per record.
+    Missing or null paths give None.
+    Args:
+        records: A list of nested json objects sharing one shape.
+        sep: The separator joining nested keys into column names.
+        schema: A schema from compile_flat_schema, compiled from records if omitted.
+    Returns:
+        A dict mapping column names to lists of values, ready for pd.DataFrame.
+    """
+    schema = compile_flat_schema(records, sep) if schema is None else schema
+    columns = {}
+    for name, path in schema:
+        if len(path) == 1:
+            key = path[0]
+            columns[name] = [record.get(key) for record in records]
+        else:
+            columns[name] = [_get_path(record, path) for record in records]
+    return columns
+
+
 class CaseInsensitiveDict(dict):
     @classmethod
     def _k(cls, key):
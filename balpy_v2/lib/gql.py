@@ -1,6 +1,6 @@
 import json
 
-import httpx
+from balpy_v2.lib.metrics import http_client
 
 
 class GraphQLError(Exception):
@@ -14,7 +14,7 @@ async def gql(url, query, variables={}):
     logging.debug(f"Executing query: {query[:15]}")
     logging.debug(f"URL: {url}")
     logging.debug(f"Variables: {variables}")
-    async with httpx.AsyncClient() as client:
+    async with http_client() as client:
         r = await client.post(
             url,
             json=dict(query=query, variables=variables),
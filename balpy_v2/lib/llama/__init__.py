@@ -1,10 +1,10 @@
-import httpx
+from balpy_v2.lib.metrics import http_client
 
 API_BASE_URL = "https://coins.llama.fi"
 
 
 async def base_request(path):
-    async with httpx.AsyncClient() as client:
+    async with http_client() as client:
         r = await client.get(API_BASE_URL + path)
     return r.json()
 
@@ -0,0 +1,152 @@
+import json
+import os
+import time
+
+from balpy_v2.lib import Chain
+from balpy_v2.lib.time import WEEK_IN_SECONDS
+
+# https://defillama.com/docs/api - coins are keyed as "{chain}:{address}"
+LLAMA_CHAIN_PREFIX_MAP = {
+    Chain.mainnet: "ethereum",
+    Chain.polygon: "polygon",
+    Chain.arbitrum: "arbitrum",
+    Chain.gnosis: "xdai",
+    Chain.optimism: "optimism",
+}
+
+# Llama backfills prices, so a coin found missing is asked for again after this
+MISSING_TTL = 4 * WEEK_IN_SECONDS
+
+
+class CoinKeyIndex:
+    """
+    Maps (Chain, address) pairs to canonical Llama coin keys and remembers
+    when coins Llama has no price for.
+
+    Keys are normalized once per token and reused by every price request, so
+    the same token is never requested under two different spellings. Missing
+    prices are recorded per coin and timestamp range, since a coin not listed
+    yet at some timestamps is priced at later ones, and expire after
+    ``ttl`` seconds.
+
+    :ivar _keys: A dictionary of (Chain, address) to canonical coin key.
+    :ivar missing: A dictionary of coin key to the (start, end, recorded at)
+        timestamp ranges it's known to have no price in.
+    """
+
+    def __init__(self, path=None, ttl=MISSING_TTL):
+        """
+        Initializes the index, loading previously recorded missing ranges.
+
+        :param path: A JSON file to persist missing ranges to, optional
+        :param ttl: The seconds a missing range is trusted for
+        """
+        self.path = path
+        self.ttl = ttl
+        self._keys = {}
+        self.missing = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                missing = json.load(f)["missing"]
+            # coins recorded without a range are asked for again
+            if isinstance(missing, dict):
+                self.missing = {
+                    coin_key: [tuple(r) for r in ranges]
+                    for coin_key, ranges in missing.items()
+                }
+
+    def key(self, chain, address):
+        """
+        Returns the canonical Llama coin key for a token.
+
+        :param chain: The Chain (or chain name) the token lives on
+        :param address: The token address, or an already prefixed coin key
+        :return: A coin key such as "ethereum:0x..."
+        """
+        if isinstance(chain, str):
+            chain = Chain[chain]
+        cache_key = (chain, address)
+        if cache_key not in self._keys:
+            if ":" in address:
+                coin_key = address.lower()
+            else:
+                prefix = LLAMA_CHAIN_PREFIX_MAP.get(chain)
+                if prefix is None:
+                    raise ValueError(f"Chain {chain.name} is not supported by Llama")
+                coin_key = f"{prefix}:{address.lower()}"
+            self._keys[cache_key] = coin_key
+        return self._keys[cache_key]
+
+    def keys(self, chain, addresses):
+        return [self.key(chain, address) for address in addresses]
+
+    def _ranges(self, coin_key, now=None):
+        now = time.time() if now is None else now
+        return [
+            (start, end)
+            for start, end, recorded_at in self.missing.get(coin_key, [])
+            if now - recorded_at < self.ttl
+        ]
+
+    def is_missing(self, coin_key, timestamp, now=None):
+        return any(
+            start <= timestamp <= end for start, end in self._ranges(coin_key, now)
+        )
+
+    def without_missing(self, coins_dict, now=None):
+        """
+        Drops the timestamps known to have no price from a coin key ->
+        timestamps dict, and the coins left without any.
+        """
+        kept = {}
+        for coin_key, timestamps in coins_dict.items():
+            ranges = self._ranges(coin_key, now)
+            if ranges:
+                timestamps = [
+                    t
+                    for t in timestamps
+                    if not any(start <= t <= end for start, end in ranges)
+                ]
+            if timestamps:
+                kept[coin_key] = timestamps
+        return kept
+
+    def record_responses(self, requested, responses, now=None):
+        """
+        Records the timestamp range of every requested coin that no response
+        returned a price for.
+
+        :param requested: A dictionary of the coin keys requested to the
+            timestamps they were requested at
+        :param responses: The batchHistorical responses received for them
+        :return: The set of coin keys newly marked as missing
+        """
+        now = time.time() if now is None else now
+        priced = {
+            coin_key
+            for response in responses
+            for coin_key, data in response.get("coins", {}).items()
+            if data.get("prices")
+        }
+        newly_missing = set()
+        for coin_key, timestamps in requested.items():
+            if coin_key in priced or not timestamps:
+                continue
+            ranges = [
+                r for r in self.missing.get(coin_key, []) if now - r[2] < self.ttl
+            ]
+            ranges.append((min(timestamps), max(timestamps), now))
+            self.missing[coin_key] = ranges
+            newly_missing.add(coin_key)
+        if newly_missing:
+            self.save()
+        return newly_missing
+
+    def save(self):
+        if not self.path:
+            return
+        with open(self.path, "w") as f:
+            json.dump({"missing": self.missing}, f)
+
+
+coin_key_index = CoinKeyIndex()
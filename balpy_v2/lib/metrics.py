@@ -0,0 +1,278 @@
+import json
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+import httpx
+
+from balpy_v2.cache import cache_manager
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PROMETHEUS_PREFIX = "balpy_"
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in labels)
+    return f"{{{pairs}}}"
+
+
+class Histogram:
+    """
+    Cumulative bucket counts, sum and count of observed values.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        total, cumulative = 0, []
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+    def as_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return dict(
+            count=self.count,
+            sum=self.sum,
+            buckets=dict(zip(bounds, self.cumulative())),
+        )
+
+
+class MetricsRegistry:
+    """
+    Counters, histograms and gauges of the process, labelled by e.g. host,
+    stage or cache namespace.
+
+    Gauges are read from collectors when a summary is taken, so sources that
+    already count (like cache namespaces) aren't double bookkept.
+
+    :ivar counters: A dictionary of name to labels to value.
+    :ivar histograms: A dictionary of name to labels to Histogram.
+    :ivar collectors: Callables returning a dictionary of gauge name to a
+        list of (labels dict, value).
+    :ivar listeners: Objects whose ``enter_stage`` and ``exit_stage`` are
+        called with the name of every stage, e.g. a Profiler.
+    :ivar active_stage: The name of the stage running, if any.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.histograms = {}
+        self.collectors = []
+        self.listeners = []
+        self.active_stage = None
+
+    def inc(self, name, value=1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _labels_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _labels_key(labels)
+        if key not in series:
+            series[key] = Histogram(buckets)
+        series[key].observe(value)
+
+    def rows(self, stage, count):
+        self.inc("stage_rows", count, stage=stage)
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Adds the wall and CPU time of a block to a pipeline stage.
+
+        CPU time is the thread's, so it's only the stage's own when the block
+        doesn't await.
+        """
+        outer, self.active_stage = self.active_stage, name
+        for listener in self.listeners:
+            listener.enter_stage(name)
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.inc("stage_wall_seconds", time.perf_counter() - wall, stage=name)
+            self.inc("stage_cpu_seconds", time.thread_time() - cpu, stage=name)
+            self.inc("stage_calls", stage=name)
+            for listener in self.listeners:
+                listener.exit_stage(name)
+            self.active_stage = outer
+
+    @contextmanager
+    def wall_time(self, name):
+        """
+        Adds the wall time of a block that awaits to a pipeline stage.
+
+        Other tasks run while the block is suspended, so neither CPU time nor
+        the active stage are tracked, and concurrent workers' times add up.
+        """
+        wall = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.inc("stage_wall_seconds", time.perf_counter() - wall, stage=name)
+            self.inc("stage_calls", stage=name)
+
+    def gauges(self):
+        gauges = {}
+        for collector in self.collectors:
+            for name, series in collector().items():
+                gauges.setdefault(name, []).extend(series)
+        return gauges
+
+    def summary(self):
+        """
+        Returns every metric as JSON-serializable data.
+        """
+
+        def rows(series, value):
+            return [dict(labels, **value(v)) for labels, v in series]
+
+        return dict(
+            counters={
+                name: rows(
+                    ((dict(k), v) for k, v in series.items()), lambda v: dict(value=v)
+                )
+                for name, series in self.counters.items()
+            },
+            histograms={
+                name: rows(((dict(k), v) for k, v in series.items()), Histogram.as_dict)
+                for name, series in self.histograms.items()
+            },
+            gauges={
+                name: rows(series, lambda v: dict(value=v))
+                for name, series in self.gauges().items()
+            },
+        )
+
+    def write_summary(self, path):
+        with open(path, "w") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def prometheus(self):
+        """
+        Renders every metric in the Prometheus text exposition format.
+        """
+        lines = []
+        for name, series in self.counters.items():
+            metric = f"{PROMETHEUS_PREFIX}{name}_total"
+            lines.append(f"# TYPE {metric} counter")
+            for labels, value in series.items():
+                lines.append(f"{metric}{_format_labels(labels)} {value}")
+        for name, series in self.histograms.items():
+            metric = f"{PROMETHEUS_PREFIX}{name}"
+            lines.append(f"# TYPE {metric} histogram")
+            for labels, histogram in series.items():
+                bounds = [str(b) for b in histogram.buckets] + ["+Inf"]
+                for bound, count in zip(bounds, histogram.cumulative()):
+                    le = _format_labels(labels + (("le", bound),))
+                    lines.append(f"{metric}_bucket{le} {count}")
+                lines.append(f"{metric}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(
+                    f"{metric}_count{_format_labels(labels)} {histogram.count}"
+                )
+        for name, series in self.gauges().items():
+            metric = f"{PROMETHEUS_PREFIX}{name}"
+            lines.append(f"# TYPE {metric} gauge")
+            for labels, value in series:
+                lines.append(f"{metric}{_format_labels(_labels_key(labels))} {value}")
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+
+
+def cache_gauges():
+    """
+    Reads the hits, misses and hit ratio of every cache namespace used.
+    """
+    gauges = dict(cache_hits=[], cache_misses=[], cache_hit_ratio=[])
+    for name, backend in cache_manager.backends.items():
+        labels = dict(namespace=name)
+        gauges["cache_hits"].append((labels, backend.stats.hits))
+        gauges["cache_misses"].append((labels, backend.stats.misses))
+        gauges["cache_hit_ratio"].append((labels, backend.stats.hit_ratio()))
+    return gauges
+
+
+metrics = MetricsRegistry()
+metrics.collectors.append(cache_gauges)
+
+
+async def _on_request(request):
+    request.extensions["started"] = time.perf_counter()
+    metrics.inc("http_requests", host=request.url.host)
+
+
+async def _on_response(response):
+    host = response.request.url.host
+    await response.aread()
+    elapsed = time.perf_counter() - response.request.extensions["started"]
+    metrics.observe("http_request_seconds", elapsed, host=host)
+    metrics.inc("http_bytes_in", len(response.content), host=host)
+    if response.status_code == httpx.codes.TOO_MANY_REQUESTS:
+        metrics.inc("http_rate_limited", host=host)
+    elif response.is_error:
+        metrics.inc("http_errors", host=host, status=response.status_code)
+
+
+def http_client(**kwargs):
+    """
+    Returns an httpx AsyncClient recording requests, latency, bytes in and
+    rate limiting per host.
+    """
+    return httpx.AsyncClient(
+        event_hooks=dict(request=[_on_request], response=[_on_response]), **kwargs
+    )
+
+
+def record_retry(url):
+    metrics.inc("http_retries", host=urlsplit(str(url)).hostname)
+
+
+def rpc_middleware(chain):
+    """
+    Returns a web3 async middleware recording the JSON-RPC requests, latency
+    and errors of a chain per method.
+    """
+
+    async def factory(make_request, async_w3):
+        async def middleware(method, params):
+            labels = dict(chain=chain.name, method=method)
+            metrics.inc("rpc_requests", **labels)
+            started = time.perf_counter()
+            try:
+                response = await make_request(method, params)
+            except Exception:
+                metrics.inc("rpc_errors", **labels)
+                raise
+            finally:
+                metrics.observe(
+                    "rpc_request_seconds", time.perf_counter() - started, **labels
+                )
+            if "error" in response:
+                metrics.inc("rpc_errors", **labels)
+            return response
+
+        return middleware
+
+    return factory
@@ -0,0 +1,200 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from balpy_v2.lib.metrics import metrics
+
+SAMPLE_INTERVAL = 0.005
+TOP_N = 25
+COLLAPSED_FILE_NAME = "profile.collapsed"
+HOTSPOTS_FILE_NAME = "hotspots.txt"
+
+
+def _task_group(name):
+    # stage workers are named <stage>-<i> and others Task-<i>, count them together
+    group, _, index = name.rpartition("-")
+    return group if group and index.isdigit() else name
+
+
+def _frame_name(code):
+    return (
+        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    )
+
+
+class Profiler:
+    """
+    A sampling profiler of the event loop thread.
+
+    A background thread records the stack of the profiled thread every
+    ``interval`` seconds, tagged with the event loop task running and the
+    metrics stage it's in, so awaiting stages show up under their worker
+    tasks and synchronous ones under their stage name. tracemalloc tracks the
+    peak memory of every stage on the side.
+
+    :ivar samples: A Counter of (task, stage, frames from the outermost) stacks.
+    :ivar stage_peaks: A dictionary of stage name to peak traced bytes.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL, memory=True):
+        """
+        :param interval: The seconds between two samples
+        :param memory: Whether to trace allocations, which slows Python down
+        """
+        self.interval = interval
+        self.memory = memory
+        self.samples = Counter()
+        self.stage_peaks = {}
+        self.peak = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = None
+        self._snapshot = None
+        self._started_tracing = False
+
+    def start(self):
+        self._target = threading.get_ident()
+        try:
+            self._loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._loop = None
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        metrics.listeners.append(self)
+        self._started = time.perf_counter()
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._sample_until_stopped, name="balpy-profiler", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+        metrics.listeners.remove(self)
+        if tracemalloc.is_tracing():
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            # leave out the samples of this profiler
+            self._snapshot = tracemalloc.take_snapshot().filter_traces(
+                [tracemalloc.Filter(False, __file__)]
+            )
+            if self._started_tracing:
+                tracemalloc.stop()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def enter_stage(self, name):
+        if tracemalloc.is_tracing():
+            # the peak is global, keep the run's before measuring the stage's
+            self.peak = max(self.peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+    def exit_stage(self, name):
+        if tracemalloc.is_tracing():
+            peak = tracemalloc.get_traced_memory()[1]
+            self.peak = max(self.peak, peak)
+            self.stage_peaks[name] = max(self.stage_peaks.get(name, 0), peak)
+
+    def _sample_until_stopped(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is None:
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            task = asyncio.current_task(self._loop) if self._loop else None
+            self.samples[
+                (
+                    task.get_name() if task is not None else "-",
+                    metrics.active_stage or "-",
+                    tuple(reversed(frames)),
+                )
+            ] += 1
+
+    def collapsed(self):
+        """
+        Returns the samples as collapsed stacks, one ``task;stage;frames count``
+        line per stack, as read by flamegraph.pl, speedscope or inferno.
+        """
+        return "".join(
+            f"{';'.join((task, f'stage={stage}') + frames)} {count}\n"
+            for (task, stage, frames), count in self.samples.most_common()
+        )
+
+    def hotspots(self, top=TOP_N):
+        """
+        Returns a summary of the ``top`` functions by own and total samples,
+        samples per task and stage, and peak memory per stage.
+        """
+        total = sum(self.samples.values()) or 1
+        own, inclusive, tags = Counter(), Counter(), Counter()
+        for (task, stage, frames), count in self.samples.items():
+            own[frames[-1]] += count
+            for frame in set(frames):
+                inclusive[frame] += count
+            tags[(_task_group(task), stage)] += count
+
+        lines = [
+            f"{sum(self.samples.values())} samples over {self.duration:.2f}s, "
+            f"every {self.interval * 1000:g}ms",
+            "",
+            f"Top {top} functions by own samples",
+            f"{'own%':>7} {'total%':>7}  function",
+        ]
+        lines += [
+            f"{100 * count / total:7.2f} {100 * inclusive[frame] / total:7.2f}  {frame}"
+            for frame, count in own.most_common(top)
+        ]
+        lines += ["", f"Top {top} functions by total samples"]
+        lines += [
+            f"{100 * count / total:7.2f}  {frame}"
+            for frame, count in inclusive.most_common(top)
+        ]
+        lines += ["", "Samples per task and stage", f"{'%':>7}  task / stage"]
+        lines += [
+            f"{100 * count / total:7.2f}  {task} / {stage}"
+            for (task, stage), count in tags.most_common()
+        ]
+        if self._snapshot is not None:
+            lines += ["", f"Peak traced memory: {self.peak / 1024**2:.1f} MiB"]
+            lines += [
+                f"{peak / 1024**2:9.1f} MiB  {stage}"
+                for stage, peak in sorted(
+                    self.stage_peaks.items(), key=lambda item: -item[1]
+                )
+            ]
+            lines += ["", f"Top {top} allocation sites still traced at exit"]
+            lines += [
+                f"{stat.size / 1024**2:9.1f} MiB  {stat.traceback}"
+                for stat in self._snapshot.statistics("lineno")[:top]
+            ]
+        return "\n".join(lines) + "\n"
+
+    def write(self, output_dir, top=TOP_N):
+        """
+        Writes the collapsed stacks and the hotspot summary to ``output_dir``.
+
+        :return: The paths written to
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = [
+            os.path.join(output_dir, COLLAPSED_FILE_NAME),
+            os.path.join(output_dir, HOTSPOTS_FILE_NAME),
+        ]
+        for path, text in zip(paths, [self.collapsed(), self.hotspots(top)]):
+            with open(path, "w") as f:
+                f.write(text)
+        return paths
@@ -4,6 +4,7 @@ import web3
 from balpy_v2.config import DEFAULT_PROVIDER_NETWORK_MAPPING
 
 from balpy_v2.lib import Chain
+from balpy_v2.lib.metrics import rpc_middleware
 
 
 class Web3Provider:
@@ -24,7 +25,9 @@ class Web3Provider:
         :return: An AsyncWeb3 instance for the specified chain.
         """
         if chain not in cls._instances:
-            cls._instances[chain] = web3.AsyncWeb3(
+            instance = web3.AsyncWeb3(
                 web3.AsyncHTTPProvider(DEFAULT_PROVIDER_NETWORK_MAPPING[chain])
             )
+            instance.middleware_onion.add(rpc_middleware(chain), "metrics")
+            cls._instances[chain] = instance
         return cls._instances[chain]
@@ -1,11 +1,11 @@
 # balpy_v2/lib/blocks/subgraph.py
 import os
 
-import httpx
-
+from balpy_v2.cache import cache_manager
 from balpy_v2.lib import Chain
 from balpy_v2.lib.gql import gql
-from balpy_v2.lib.time import get_time_24h_ago, get_timestamps
+from balpy_v2.lib.metrics import http_client
+from balpy_v2.lib.time import WEEK_IN_SECONDS, get_time_24h_ago, get_timestamps
 
 BLOCKS_SUBGRAPH_URL_MAP = {
     Chain.mainnet: "https://api.thegraph.com/subgraphs/name/blocklytics/ethereum-blocks",
@@ -35,6 +35,13 @@ query($timestamp_gte: BigInt, $timestamp_lt: BigInt) {
 """
 
 
+# the first block at or after a timestamp never changes once it exists, but
+# explorer guesses can, so entries are looked up again after four weeks
+blocks_cache = cache_manager.namespace(
+    "blocks", max_entries=100_000, ttl=4 * WEEK_IN_SECONDS
+)
+
+
 CHAIN_AVG_BLOCK_TIME = {
     Chain.mainnet: 13,
     Chain.polygon: 2,
@@ -43,13 +50,21 @@ CHAIN_AVG_BLOCK_TIME = {
 }
 
 
+def has_block_source(chain) -> bool:
+    """
+    Tells whether blocks can be looked up by timestamp on a chain.
+    """
+    return chain in BLOCKS_SUBGRAPH_URL_MAP or chain in CHAIN_BLOCK_EXPLORER_FN_MAP
+
+
 async def best_guess(chain=Chain.gnosis, t=get_time_24h_ago()) -> int:
-    async with httpx.AsyncClient() as client:
+    async with http_client() as client:
         r = await client.get(CHAIN_BLOCK_EXPLORER_FN_MAP[chain](t))
 
     return int(r.json()["result"])
 
 
+@blocks_cache.cache
 async def get_block_number_by_timestamp(
     chain=Chain.mainnet, timestamp=get_time_24h_ago()
 ) -> int:
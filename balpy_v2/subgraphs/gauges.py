@@ -1,3 +1,9 @@
+import asyncio
+import json
+import logging
+import os
+
+from balpy_v2.cache import CACHE_DIR
 from balpy_v2.subgraphs.client import GraphQLClient
 from balpy_v2.subgraphs.query import GraphQLQuery
 from balpy_v2.lib import Chain
@@ -22,3 +28,193 @@ class GaugesSubgraph(GraphQLClient):
 class GaugesSubgraphQuery(GraphQLQuery):
     def get_client(self):
         return GaugesSubgraph(self.chain)
+
+
+GAUGE_UNIVERSE_PATH = os.path.join(CACHE_DIR, "gauge_universe.json")
+GAUGES_PAGE_SIZE = 1000
+
+
+class GaugesQuery(GaugesSubgraphQuery):
+    def get_query(self):
+        return """query Gauges ($first: Int!, $lastId: ID!, $block: Int!) {
+  _meta { block { number } }
+  liquidityGauges(
+    first: $first,
+    orderBy: id,
+    where: {id_gt: $lastId, _change_block: {number_gte: $block}}
+  ) {
+    id
+    symbol
+    poolId
+    poolAddress
+    isKilled
+  }
+}"""
+
+
+class Gauge:
+    """
+    A liquidity gauge and the pool it rewards.
+
+    :ivar address: The gauge address
+    :ivar chain: The Chain the gauge is deployed on
+    :ivar pool_id: The id of the gauge's pool, None if the subgraph doesn't know it
+    :ivar pool_address: The address of the gauge's pool
+    :ivar symbol: The gauge symbol
+    :ivar is_killed: Whether the gauge was killed
+    """
+
+    def __init__(self, address, chain, pool_id, pool_address, symbol, is_killed):
+        self.address = address
+        self.chain = chain
+        self.pool_id = pool_id
+        self.pool_address = pool_address
+        self.symbol = symbol
+        self.is_killed = is_killed
+
+    @classmethod
+    def from_subgraph(cls, chain, item):
+        return cls(
+            item["id"],
+            chain,
+            item.get("poolId"),
+            item.get("poolAddress"),
+            item.get("symbol"),
+            bool(item.get("isKilled")),
+        )
+
+    def __repr__(self):
+        killed = ", killed" if self.is_killed else ""
+        return f"Gauge({self.chain.name}:{self.address} -> {self.pool_id}{killed})"
+
+
+class GaugeUniverse:
+    """
+    Every known gauge across chains.
+
+    :ivar gauges: A list of Gauge
+    """
+
+    def __init__(self, gauges):
+        self.gauges = gauges
+
+    def __len__(self):
+        return len(self.gauges)
+
+    def __iter__(self):
+        return iter(self.gauges)
+
+    def select(self, chains=None, include_killed=False):
+        return GaugeUniverse(
+            [
+                gauge
+                for gauge in self.gauges
+                if (not chains or gauge.chain in chains)
+                and (include_killed or not gauge.is_killed)
+            ]
+        )
+
+    def pool_ids_chains(self):
+        """
+        Returns the distinct (pool id, Chain) pairs of the gauges, as taken by
+        ``generate_reports``.
+        """
+        pools = {}
+        for gauge in self.gauges:
+            if gauge.pool_id:
+                pools.setdefault((gauge.pool_id, gauge.chain), None)
+        return list(pools)
+
+
+async def fetch_gauge_changes(chain, since_block=0, page_size=GAUGES_PAGE_SIZE):
+    """
+    Fetches the gauges of a chain changed since a block, paginating on ids.
+
+    :return: The subgraph block the changes are complete up to, and the
+        changed gauge items
+    """
+    items, last_id, indexed_block = [], "", None
+    while True:
+        variables = dict(first=page_size, lastId=last_id, block=since_block)
+        response = await GaugesQuery(chain, variables).execute()
+        if indexed_block is None:
+            # changes indexed while paginating are fetched again next refresh
+            indexed_block = response["_meta"]["block"]["number"]
+        page = response["liquidityGauges"]
+        items += page
+        if len(page) < page_size:
+            return indexed_block, items
+        last_id = page[-1]["id"]
+
+
+class GaugeUniverseCache:
+    """
+    A JSON file of the gauges of every chain, refreshed incrementally.
+
+    Each chain's entry records the subgraph block it's complete up to, so a
+    refresh only fetches the gauges created, killed or otherwise changed
+    since then.
+
+    :ivar path: The JSON file the gauges are stored in.
+    :ivar page_size: The number of gauges fetched per request.
+    """
+
+    def __init__(self, path=GAUGE_UNIVERSE_PATH, page_size=GAUGES_PAGE_SIZE):
+        self.path = path
+        self.page_size = page_size
+        self._entries = None
+
+    @property
+    def entries(self):
+        if self._entries is None:
+            try:
+                with open(self.path) as f:
+                    self._entries = json.load(f)
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_path, self.path)
+
+    async def _refresh_chain(self, chain):
+        entry = self.entries.get(chain.name, dict(block=0, gauges={}))
+        block, items = await fetch_gauge_changes(chain, entry["block"], self.page_size)
+        gauges = dict(entry["gauges"])
+        gauges.update({item["id"]: item for item in items})
+        self.entries[chain.name] = dict(block=block, gauges=gauges)
+        logging.info(
+            f"{len(items)} gauges changed on {chain.name} since {entry['block']}"
+        )
+
+    async def refresh(self, chains=DEPLOYED_CHAINS):
+        await asyncio.gather(*[self._refresh_chain(chain) for chain in chains])
+        self.save()
+
+    def universe(self, chains=DEPLOYED_CHAINS):
+        return GaugeUniverse(
+            [
+                Gauge.from_subgraph(chain, item)
+                for chain in chains
+                for item in self.entries.get(chain.name, {}).get("gauges", {}).values()
+            ]
+        )
+
+
+gauge_universe_cache = GaugeUniverseCache()
+
+
+async def get_gauge_universe(chains=DEPLOYED_CHAINS, refresh=True):
+    """
+    Returns the gauges of every chain, refreshing the cache concurrently.
+
+    :param chains: The Chains to discover gauges on
+    :param refresh: Whether to fetch the changes since the last refresh
+    """
+    if refresh:
+        await gauge_universe_cache.refresh(chains)
+    return gauge_universe_cache.universe(chains)
@@ -0,0 +1,132 @@
+import os
+
+import pandas as pd
+
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.event_store import EVENT_STORE_DIR
+
+AGGREGATE_STORE_DIR = os.path.join(EVENT_STORE_DIR, "aggregates")
+
+KEY = ["cycle", "chain", "poolId", "token"]
+MEASURES = [
+    "swapFeeUSD",
+    "swapFeeTokenAmount",
+    "joinExitFeeUSD",
+    "joinExitFeeTokenAmount",
+    "totalUSD",
+    "totalToken",
+]
+
+
+class FeeAggregateStore:
+    """
+    Materialized per-cycle fee aggregates keyed by (cycle, chain, pool, token).
+
+    Rows are kept in memory sorted by cycle, so cycle-range queries are index
+    slices, and persisted as one Parquet file per chain. Upserting a
+    ``per_cycle`` frame replaces the rows of every (cycle, chain, pool) it
+    covers, and of every recomputed partition it has no rows for.
+
+    :ivar root: The directory the per-chain files are written to.
+    """
+
+    def __init__(self, root=AGGREGATE_STORE_DIR):
+        self.root = root
+        self._frame = None
+
+    def _path(self, chain):
+        return os.path.join(self.root, f"chain={chain}.parquet")
+
+    @property
+    def frame(self):
+        if self._frame is None:
+            frames = []
+            if os.path.isdir(self.root):
+                frames = [
+                    pd.read_parquet(os.path.join(self.root, file))
+                    for file in sorted(os.listdir(self.root))
+                    if file.endswith(".parquet")
+                ]
+            self._frame = self._normalize(
+                pd.concat(frames) if frames else pd.DataFrame(columns=KEY + MEASURES)
+            )
+        return self._frame
+
+    @staticmethod
+    def _normalize(df):
+        for column in MEASURES:
+            if column not in df:
+                df[column] = 0.0
+        df[MEASURES] = df[MEASURES].fillna(0.0).astype(float)
+        df["cycle"] = df["cycle"].astype(int)
+        return df[KEY + MEASURES].set_index(KEY).sort_index()
+
+    def upsert(self, per_cycle, chain=None, units=None):
+        """
+        Stores a ``per_cycle`` frame, replacing previous rows of the same
+        (cycle, chain, pool).
+
+        :param per_cycle: A frame indexed or keyed by cycle, poolId and token
+        :param chain: The Chain of every row, when the frame has no chain column
+        :param units: The ((pool id, Chain), Cycle) partitions the frame was
+            computed for, optional; their previous rows are removed even when
+            the frame has none, e.g. once a pool's events are gone
+        """
+        calendar = get_cycle_calendar()
+        recomputed = {
+            (calendar.number(cycle), pool_chain.name, pool_id)
+            for (pool_id, pool_chain), cycle in units or []
+        }
+        if per_cycle.empty and not recomputed:
+            return
+        rows = (
+            per_cycle.reset_index()
+            if not per_cycle.empty
+            else pd.DataFrame(columns=KEY + MEASURES)
+        )
+        if chain is not None:
+            rows["chain"] = chain.name
+        rows = self._normalize(rows)
+
+        replaced = set(rows.index.droplevel("token")) | recomputed
+        current = self.frame
+        keep = ~current.index.droplevel("token").isin(list(replaced))
+        self._frame = pd.concat([current[keep], rows]).sort_index()
+
+        os.makedirs(self.root, exist_ok=True)
+        for chain_name in {chain_name for _, chain_name, _ in replaced}:
+            chain_rows = self._frame[
+                self._frame.index.get_level_values("chain") == chain_name
+            ]
+            tmp_path = f"{self._path(chain_name)}.{os.getpid()}.tmp"
+            chain_rows.reset_index().to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self._path(chain_name))
+
+    def select(self, start_cycle=None, end_cycle=None, chain=None):
+        """
+        Returns the rows of cycles ``start_cycle..end_cycle`` (inclusive).
+        """
+        df = self.frame.loc[start_cycle:end_cycle]
+        if chain is not None:
+            df = df[df.index.get_level_values("chain") == chain.name]
+        return df
+
+    def fees_per_pool(self, start_cycle=None, end_cycle=None, chain=None):
+        return (
+            self.select(start_cycle, end_cycle, chain)
+            .groupby(level=["chain", "poolId"])[MEASURES]
+            .sum()
+        )
+
+    def top_pools(
+        self, n=10, start_cycle=None, end_cycle=None, chain=None, by="totalUSD"
+    ):
+        return self.fees_per_pool(start_cycle, end_cycle, chain).nlargest(n, by)
+
+    def chain_totals(self, start_cycle=None, end_cycle=None):
+        return (
+            self.select(start_cycle, end_cycle).groupby(level="chain")[MEASURES].sum()
+        )
+
+
+aggregate_store = FeeAggregateStore()
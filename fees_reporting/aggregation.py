@@ -0,0 +1,97 @@
+import numpy as np
+import pandas as pd
+
+from fees_reporting.aggregate_store import MEASURES
+from fees_reporting.amounts import fixed_point_columns, limbs_to_float, normalize_limbs
+from fees_reporting.encoding import identifiers
+
+GROUP_KEYS = ["cycle", "poolId", "token"]
+
+# measure name -> source column, per event type; token amounts are read from
+# and summed on the source's fixed-point limb columns
+SWAP_MEASURES = {"swapFeeUSD": "swapFees", "swapFeeTokenAmount": "swapFeeTokenAmount"}
+JOIN_EXIT_MEASURES = {
+    "joinExitFeeUSD": "protocolFeeAmountsUSD_tokens",
+    "joinExitFeeTokenAmount": "joinExitFeeTokenAmount",
+}
+FEE_MEASURES = [*SWAP_MEASURES, *JOIN_EXIT_MEASURES]
+TOKEN_MEASURES = ["swapFeeTokenAmount", "joinExitFeeTokenAmount"]
+
+
+def _fee_rows(df, measures):
+    rows = {
+        "cycle": df["cycle"].to_numpy(dtype=np.int64),
+        "poolId": identifiers.categorical(df["poolId"]).codes,
+        "token": identifiers.categorical(df["token"]).codes,
+    }
+    for measure in FEE_MEASURES:
+        if measure in TOKEN_MEASURES:
+            limbs = (
+                df[fixed_point_columns(measures[measure])].to_numpy(dtype=np.int64)
+                if measure in measures
+                else np.zeros((len(df), 3), dtype=np.int64)
+            )
+            rows.update(zip(fixed_point_columns(measure), limbs.T))
+        else:
+            rows[measure] = (
+                df[measures[measure]].to_numpy(dtype=float)
+                if measure in measures
+                else np.zeros(len(df))
+            )
+    return pd.DataFrame(rows)
+
+
+def _with_totals(per_cycle):
+    per_cycle["totalUSD"] = per_cycle["swapFeeUSD"] + per_cycle["joinExitFeeUSD"]
+    per_cycle["totalToken"] = (
+        per_cycle["swapFeeTokenAmount"] + per_cycle["joinExitFeeTokenAmount"]
+    )
+    return per_cycle[MEASURES]
+
+
+def aggregate_fees(swaps, joins):
+    """
+    Aggregates every fee measure of a chunk of processed swaps and joins in a
+    single grouped reduction over the encoded (cycle, pool, token) keys.
+    Token amounts are summed exactly on their limbs and converted to float
+    once per group.
+
+    The result is a ``per_cycle`` frame indexed by cycle, poolId and token;
+    frames of several chunks are combined with :func:`merge_partials`.
+
+    :param swaps: Processed swaps, as returned by ``process_swaps``
+    :param joins: Processed joinExits, as returned by ``process_joins``
+    :return: A frame of fee measures with decoded identifiers in the index
+    """
+    rows = [
+        _fee_rows(df, measures)
+        for df, measures in ((swaps, SWAP_MEASURES), (joins, JOIN_EXIT_MEASURES))
+        if not df.empty
+    ]
+    if not rows:
+        return _empty()
+    per_cycle = pd.concat(rows, ignore_index=True).groupby(GROUP_KEYS).sum()
+    per_cycle.index = per_cycle.index.set_levels(
+        [identifiers.decode(per_cycle.index.levels[level]) for level in (1, 2)],
+        level=[1, 2],
+    )
+    for measure in TOKEN_MEASURES:
+        limbs = normalize_limbs(per_cycle[fixed_point_columns(measure)].to_numpy())
+        per_cycle[measure] = limbs_to_float(limbs)
+    return _with_totals(per_cycle)
+
+
+def merge_partials(partials):
+    """
+    Merges ``per_cycle`` frames of disjoint or overlapping chunks.
+    """
+    partials = [partial for partial in partials if not partial.empty]
+    if not partials:
+        return _empty()
+    per_cycle = pd.concat(partials)[FEE_MEASURES].groupby(level=GROUP_KEYS).sum()
+    return _with_totals(per_cycle)
+
+
+def _empty():
+    index = pd.MultiIndex.from_arrays([[], [], []], names=GROUP_KEYS)
+    return pd.DataFrame(columns=MEASURES, index=index, dtype=float)
@@ -0,0 +1,122 @@
+from decimal import Decimal
+from fractions import Fraction
+
+import numpy as np
+import pandas as pd
+
+# Amounts are stored as three int64 limbs: the whole part, fractional digits
+# 1-9 and fractional digits 10-18. Each fractional limb stays below 1e9, so
+# millions of rows can be summed limb-wise in int64 without overflow and with
+# no precision loss on 18-decimal tokens.
+#
+# Fee token amounts are multiplied and summed per group on the limbs and only
+# converted to float once per (cycle, pool, token) group. USD measures are
+# float from the row on, since Llama prices are floats.
+DECIMALS = 18
+LIMB_DIGITS = 9
+LIMB = 10**LIMB_DIGITS
+FIXED_POINT_SUFFIXES = ("_int", "_e9", "_e18")
+
+
+def _expand_exponents(values):
+    # The Graph renders tiny or huge BigDecimals in scientific notation
+    return np.array([format(Decimal(v), "f") for v in values], dtype=str)
+
+
+def parse_decimal_strings(values):
+    """
+    Parses decimal strings into fixed-point limbs in a vectorized pass.
+
+    :param values: An array-like of decimal strings, e.g. "12.000000000000000001"
+    :return: An (n, 3) int64 array of whole, 1e-9 and 1e-18 limbs
+    """
+    values = np.asarray(values, dtype=str)
+    if values.size == 0:
+        return np.zeros((0, 3), dtype=np.int64)
+
+    scientific = np.char.find(np.char.lower(values), "e") >= 0
+    if scientific.any():
+        values = values.copy().astype(object)
+        values[scientific] = _expand_exponents(values[scientific])
+        values = values.astype(str)
+
+    negative = np.char.startswith(values, "-")
+    parts = np.char.partition(np.char.lstrip(values, "-+"), ".")
+    whole = np.where(parts[:, 0] == "", "0", parts[:, 0]).astype(np.int64)
+    fraction = np.char.ljust(parts[:, 2], DECIMALS, "0").astype(f"<U{DECIMALS}")
+    fraction = np.ascontiguousarray(fraction).view(f"<U{LIMB_DIGITS}").reshape(-1, 2)
+
+    limbs = np.empty((len(values), 3), dtype=np.int64)
+    limbs[:, 0] = whole
+    limbs[:, 1:] = fraction.astype(np.int64)
+    limbs[negative] *= -1
+    return limbs
+
+
+def limbs_to_float(limbs):
+    limbs = np.asarray(limbs, dtype=np.int64)
+    # dividing by the exact LIMB rounds once, unlike scaling by 1e-9
+    return limbs[:, 0] + (limbs[:, 1] + limbs[:, 2] / LIMB) / LIMB
+
+
+def normalize_limbs(limbs):
+    """
+    Carries overflowing fractional limbs (e.g. after a sum) into higher limbs.
+    """
+    limbs = np.array(limbs, dtype=np.int64)
+    carry, limbs[:, 2] = np.divmod(limbs[:, 2], LIMB)
+    limbs[:, 1] += carry
+    carry, limbs[:, 1] = np.divmod(limbs[:, 1], LIMB)
+    limbs[:, 0] += carry
+    return limbs
+
+
+def multiply_limbs(limbs, rate):
+    """
+    Multiplies fixed-point limbs by a decimal rate, rounding down to the last
+    limb digit the way contracts round fees down to the wei.
+
+    :param limbs: An (n, 3) array of limbs
+    :param rate: The rate, e.g. 0.0004, whose numerator and denominator must
+        stay below ``LIMB``
+    :return: An (n, 3) int64 array of limbs, negated as a whole on
+        negative rows like parsed ones
+    """
+    rate = Fraction(str(rate))
+    if not (0 <= rate.numerator < LIMB and 0 < rate.denominator < LIMB):
+        raise ValueError(f"Rate {rate} is too precise to multiply limbs by")
+    limbs = normalize_limbs(limbs)
+    # rows are negated as a whole, so long-divide their magnitudes
+    sign = np.where((limbs < 0).any(axis=1), -1, 1)[:, None]
+    limbs = normalize_limbs(limbs * sign) * rate.numerator
+    result = np.empty_like(limbs)
+    remainder = np.zeros(len(limbs), dtype=np.int64)
+    for limb in range(3):
+        result[:, limb], remainder = np.divmod(
+            limbs[:, limb] + remainder * (LIMB if limb else 1), rate.denominator
+        )
+    return normalize_limbs(result) * sign
+
+
+def fixed_point_columns(column, suffix=""):
+    return [f"{column}{limb}{suffix}" for limb in FIXED_POINT_SUFFIXES]
+
+
+def to_fixed_point(df, columns):
+    """
+    Replaces decimal string columns by their int64 limb columns, in place.
+    """
+    for column in columns:
+        if column not in df:
+            continue
+        limbs = parse_decimal_strings(df[column].to_numpy())
+        df[fixed_point_columns(column)] = limbs
+        df.drop(columns=column, inplace=True)
+    return df
+
+
+def fixed_point_to_float(df, column, suffix=""):
+    return pd.Series(
+        limbs_to_float(df[fixed_point_columns(column, suffix)].to_numpy()),
+        index=df.index,
+    )
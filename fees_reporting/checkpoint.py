@@ -0,0 +1,84 @@
+import json
+import os
+
+import pandas as pd
+
+from fees_reporting.aggregation import GROUP_KEYS, merge_partials
+from fees_reporting.event_store import MANIFEST_FILE_NAME, is_closed
+
+
+class ReportCheckpoint:
+    """
+    The completed (pool, cycle) units of a fees report run, so an interrupted
+    run resumes where it stopped.
+
+    Each unit's partial ``per_cycle`` frame is a Parquet file, recorded in an
+    append-only manifest once written. Like the event store, only units of
+    closed cycles are recorded; the open cycle is recomputed on every run.
+
+    :ivar root: The directory partials and the manifest are written under.
+    :ivar completed: A dictionary of completed unit key to row count.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.completed = {}
+        self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_FILE_NAME)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.completed[entry["unit"]] = entry["rows"]
+
+    @staticmethod
+    def unit_key(pool_id_chain, cycle):
+        pool_id, chain = pool_id_chain
+        return f"chain={chain.name}/pool={pool_id}/cycle={cycle.name}"
+
+    def unit_path(self, pool_id_chain, cycle):
+        key = self.unit_key(pool_id_chain, cycle)
+        return os.path.join(self.root, "units", f"{key}.parquet")
+
+    def is_complete(self, pool_id_chain, cycle):
+        return self.unit_key(pool_id_chain, cycle) in self.completed
+
+    def write(self, pool_id_chain, cycle, partial):
+        """
+        Stores the partial ``per_cycle`` frame of a unit, marking the unit
+        complete when its cycle is closed.
+        """
+        if not is_closed(cycle):
+            return
+        key = self.unit_key(pool_id_chain, cycle)
+        if not partial.empty:
+            path = self.unit_path(pool_id_chain, cycle)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            partial.reset_index().to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, path)
+
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.manifest_path, "a") as f:
+            f.write(json.dumps(dict(unit=key, rows=len(partial))) + "\n")
+        self.completed[key] = len(partial)
+
+    def load(self, units):
+        """
+        Merges the stored partials of completed units.
+
+        :param units: A list of ((pool id, Chain), Cycle) pairs
+        """
+        partials = [
+            pd.read_parquet(self.unit_path(*unit)).set_index(GROUP_KEYS)
+            for unit in units
+            if self.completed.get(self.unit_key(*unit))
+        ]
+        return merge_partials(partials)
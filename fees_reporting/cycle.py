@@ -2,6 +2,9 @@ import asyncio
 import datetime
 import math
 
+import numpy as np
+
+from balpy_v2.lib import Chain
 from balpy_v2.subgraphs.blocks import get_block_number_by_timestamp
 
 
@@ -56,15 +59,112 @@ class Cycle:
         return f"Cycle {self.cycle_iteration()}: {self.name}"
 
 
-def generate_cycles_until_now():
-    now = datetime.datetime.utcnow().timestamp()
-    cycles_until_now = math.ceil(
-        (now - REPORT_PERIOD_START_DATE) / REPORT_PERIOD_DURATION
-    )
-    return [
-        Cycle(
-            REPORT_PERIOD_START_DATE + REPORT_PERIOD_DURATION * i,
-            REPORT_PERIOD_DURATION,
+class CycleCalendar:
+    """
+    The reporting cycles from REPORT_PERIOD_START_DATE until now, with their
+    boundaries precomputed so timestamps can be assigned to cycles in bulk.
+
+    Cycles are half-open intervals ``[start, end)`` numbered from 1, so an
+    event on a boundary belongs to exactly one cycle.
+
+    :ivar boundaries: An int64 array of the cycles' starts followed by the last end.
+    :ivar cycles: The Cycle objects, in order.
+    :ivar _blocks: A dictionary of Chain to boundary index to block number.
+    """
+
+    def __init__(
+        self,
+        start=REPORT_PERIOD_START_DATE,
+        duration=REPORT_PERIOD_DURATION,
+        until=None,
+    ):
+        until = until or datetime.datetime.utcnow().timestamp()
+        count = math.ceil((until - start) / duration)
+        self.duration = duration
+        self.boundaries = (start + duration * np.arange(count + 1)).astype(np.int64)
+        self.cycles = [Cycle(boundary, duration) for boundary in self.boundaries[:-1]]
+        self._blocks = {}
+
+    def __len__(self):
+        return len(self.cycles)
+
+    def __iter__(self):
+        return iter(self.cycles)
+
+    def __getitem__(self, idx):
+        return self.cycles[idx]
+
+    @property
+    def starts(self):
+        return self.boundaries[:-1]
+
+    @property
+    def ends(self):
+        return self.boundaries[1:]
+
+    def number(self, cycle):
+        return int(np.searchsorted(self.boundaries, cycle.start, side="right"))
+
+    def assign(self, timestamps):
+        """
+        Assigns cycle numbers to timestamps in a single searchsorted pass.
+
+        :param timestamps: An array-like of unix timestamps
+        :return: An int64 array of cycle numbers, 0 for timestamps outside the calendar
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        numbers = np.searchsorted(self.boundaries, timestamps, side="right")
+        numbers[numbers > len(self.cycles)] = 0
+        return numbers.astype(np.int64)
+
+    async def boundary_blocks(self, chain=Chain.mainnet, cycles=None):
+        """
+        Retrieves the block numbers at the start and end of ``cycles``.
+
+        Blocks are looked up once per chain and boundary, and only for the
+        boundaries of the requested cycles already in the past.
+
+        :param chain: The Chain to look blocks up on
+        :param cycles: The Cycles whose boundaries are needed, every cycle by default
+        :return: An int64 array aligned with ``boundaries``, -1 for boundaries
+            in the future or not looked up
+        """
+        if cycles is None:
+            indices = range(len(self.boundaries))
+        else:
+            numbers = [self.number(cycle) for cycle in cycles]
+            indices = sorted({i for number in numbers for i in (number - 1, number)})
+        now = datetime.datetime.utcnow().timestamp()
+        known = self._blocks.setdefault(chain, {})
+        missing = [i for i in indices if i not in known and self.boundaries[i] <= now]
+        blocks = await asyncio.gather(
+            *[
+                get_block_number_by_timestamp(
+                    chain=chain, timestamp=int(self.boundaries[i])
+                )
+                for i in missing
+            ]
         )
-        for i in range(cycles_until_now)
-    ]
+        known.update(zip(missing, blocks))
+        result = np.full(len(self.boundaries), -1, dtype=np.int64)
+        for i, block in known.items():
+            result[i] = block
+        return result
+
+
+_calendar = None
+
+
+def get_cycle_calendar():
+    """
+    Returns the shared calendar, rebuilding it once its last cycle has ended.
+    """
+    global _calendar
+    now = datetime.datetime.utcnow().timestamp()
+    if _calendar is None or _calendar.boundaries[-1] <= now:
+        _calendar = CycleCalendar(until=now)
+    return _calendar
+
+
+def generate_cycles_until_now():
+    return list(get_cycle_calendar())
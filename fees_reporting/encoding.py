@@ -0,0 +1,95 @@
+import numpy as np
+import pandas as pd
+
+
+class Dictionary:
+    """
+    An append-only mapping of identifiers (addresses, pool ids, coin keys) to
+    stable int32 codes, shared by every frame of the process.
+
+    Frames hold identifiers as categoricals over this dictionary, so groupbys
+    and price joins hash small integers instead of 42-66 character strings,
+    and strings are only materialized again at output.
+    """
+
+    def __init__(self):
+        self._codes = {}
+        self._values = []
+        self._categories = pd.Index([], dtype=object)
+
+    def __len__(self):
+        return len(self._values)
+
+    def _code(self, value):
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self._values)
+            self._values.append(value)
+        return code
+
+    def encode(self, values):
+        """
+        Encodes an array-like of identifiers, factorizing it first so each
+        distinct value is looked up once.
+
+        :return: An int32 array of codes, -1 for missing values
+        """
+        inverse, uniques = pd.factorize(np.asarray(values, dtype=object))
+        lookup = np.fromiter(
+            (self._code(value) for value in uniques), dtype=np.int32, count=len(uniques)
+        )
+        return np.where(inverse >= 0, lookup[inverse], -1).astype(np.int32)
+
+    def categories(self):
+        if len(self._categories) != len(self._values):
+            self._categories = pd.Index(self._values, dtype=object)
+        return self._categories
+
+    def decode(self, codes):
+        codes = np.asarray(codes)
+        values = self.categories().to_numpy()[codes]
+        values[codes < 0] = None
+        return values
+
+    def categorical(self, values):
+        """
+        Encodes identifiers into a categorical over the whole dictionary.
+        """
+        if isinstance(getattr(values, "dtype", None), pd.CategoricalDtype):
+            return self.align(values)
+        return pd.Categorical.from_codes(self.encode(values), self.categories())
+
+    def align(self, values):
+        """
+        Re-expresses a categorical over the current dictionary, so categoricals
+        built at different times (or in other processes) can be merged,
+        grouped and concatenated together.
+        """
+        values = pd.Categorical(values)
+        lookup = self.encode(values.categories)
+        codes = np.where(values.codes >= 0, lookup[values.codes], -1)
+        return pd.Categorical.from_codes(codes, self.categories())
+
+    def encode_columns(self, df, columns):
+        for column in columns:
+            if column in df:
+                df[column] = self.categorical(df[column])
+        return df
+
+    def decode_index(self, df):
+        """
+        Turns categorical index levels back into plain identifier strings.
+        """
+        if isinstance(df.index, pd.MultiIndex):
+            df.index = df.index.set_levels(
+                [
+                    level.astype(object)
+                    if isinstance(level, pd.CategoricalIndex)
+                    else level
+                    for level in df.index.levels
+                ]
+            )
+        return df
+
+
+identifiers = Dictionary()
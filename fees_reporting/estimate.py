@@ -0,0 +1,230 @@
+import asyncio
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+from balpy_v2.lib.gql import gql
+from balpy_v2.subgraphs.blocks import has_block_source
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.fees_report import BLOCKS_PER_QUERY
+from fees_reporting.fees_report_v2 import BALANCER_MAINNET_SUBGRAPH_URL_MAP
+from fees_reporting.fees_report_v3 import SWAP_FEE
+from fees_reporting.pipeline import stream_analyze_pool
+
+POOL_FEE_FIELDS = "id totalSwapVolume totalProtocolFee swapsCount"
+POOLS_PER_QUERY = 1000
+LATEST = -1
+ESTIMATE_KEYS = ["cycle", "poolId"]
+# the measures both sources of an estimate compute, with the events' meaning
+ESTIMATE_MEASURES = ["swapFeeUSD", "joinExitFeeUSD", "totalUSD"]
+
+
+def _alias(block):
+    return "latest" if block == LATEST else f"b{block}"
+
+
+def pool_snapshots_query(blocks, pool_ids):
+    """
+    Builds one query fetching the cumulative fee fields of pools at every
+    block, each aliased as ``b<block>`` (or ``latest``, for LATEST).
+    """
+    where = f"first: {POOLS_PER_QUERY}, where: {{id_in: {json.dumps(pool_ids)}}}"
+    selections = "".join(
+        f"\n  {_alias(block)}: pools("
+        + ("" if block == LATEST else f"block: {{number: {block}}}, ")
+        + f"{where}) {{ {POOL_FEE_FIELDS} }}"
+        for block in blocks
+    )
+    return f"query poolSnapshots {{{selections}\n}}"
+
+
+async def fetch_pool_snapshots(chain, blocks, pool_ids):
+    """
+    Fetches the cumulative fee fields of pools at many blocks in few requests.
+
+    :return: A long table of id, block, totalSwapVolume, totalProtocolFee
+        and swapsCount, null fields being NaN
+    """
+    url = BALANCER_MAINNET_SUBGRAPH_URL_MAP[chain]
+    requests = [
+        (block_batch, pool_ids[j : j + POOLS_PER_QUERY])
+        for i in range(0, len(blocks), BLOCKS_PER_QUERY)
+        for block_batch in [blocks[i : i + BLOCKS_PER_QUERY]]
+        for j in range(0, len(pool_ids), POOLS_PER_QUERY)
+    ]
+    results = await asyncio.gather(
+        *[gql(url, pool_snapshots_query(b, p)) for b, p in requests]
+    )
+    records = [
+        dict(pool, block=block)
+        for (block_batch, _), result in zip(requests, results)
+        for block in block_batch
+        for pool in result[_alias(block)]
+    ]
+    table = pd.DataFrame(records, columns=POOL_FEE_FIELDS.split() + ["block"])
+    for column in ("totalSwapVolume", "totalProtocolFee", "swapsCount"):
+        table[column] = pd.to_numeric(table[column], errors="coerce")
+    return table
+
+
+def snapshot_deltas(snapshots, cycle_blocks, pool_ids):
+    """
+    Computes every pool's fees in every cycle from its cumulative fields at
+    the cycle's boundary blocks, and checks that each delta can be trusted.
+
+    Fees are measured as the events measure them: swap fees are ``SWAP_FEE``
+    of the swapped volume, and join/exit fees the protocol fees paid, so
+    only the prices (the subgraph's rather than Llama's) differ.
+
+    A delta is rejected when the pool is missing at the end boundary only,
+    its protocol fee total isn't indexed, a total decreases, or it swapped
+    without any USD volume (tokens the subgraph can't price). Pools
+    missing at the start boundary were created during the cycle and start
+    from zero, and pools missing at both didn't exist yet.
+
+    :param snapshots: A table as returned by ``fetch_pool_snapshots``
+    :param cycle_blocks: A list of (cycle number, start block, end block)
+    :param pool_ids: The pool ids
+    :return: A frame indexed by cycle and poolId with ``ESTIMATE_MEASURES``,
+        ``swaps`` and a boolean ``ok``
+    """
+    values = snapshots.set_index(["block", "id"])[
+        ["totalSwapVolume", "totalProtocolFee", "swapsCount"]
+    ]
+    numbers = np.repeat([number for number, _, _ in cycle_blocks], len(pool_ids))
+    ids = np.tile(np.asarray(pool_ids, dtype=object), len(cycle_blocks))
+    starts = pd.MultiIndex.from_arrays(
+        [np.repeat([start for _, start, _ in cycle_blocks], len(pool_ids)), ids]
+    )
+    ends = pd.MultiIndex.from_arrays(
+        [np.repeat([end for _, _, end in cycle_blocks], len(pool_ids)), ids]
+    )
+    start = values.reindex(starts).to_numpy()
+    end = values.reindex(ends).to_numpy()
+
+    created = np.isnan(start).all(axis=1)
+    start[created] = 0.0
+    # pools that didn't exist yet at the end of the cycle
+    end[created & np.isnan(end).all(axis=1)] = 0.0
+    delta = end - start
+    volume, protocol_fees, swaps = delta.T
+    ok = (
+        ~np.isnan(delta).any(axis=1)
+        & (delta >= 0).all(axis=1)
+        & ~((swaps > 0) & (volume == 0))
+    )
+    swap_fees = volume * SWAP_FEE
+    return pd.DataFrame(
+        dict(
+            swapFeeUSD=swap_fees,
+            joinExitFeeUSD=protocol_fees,
+            totalUSD=swap_fees + protocol_fees,
+            swaps=swaps,
+            ok=ok,
+        ),
+        index=pd.MultiIndex.from_arrays([numbers, ids], names=ESTIMATE_KEYS),
+    )
+
+
+def rejected_deltas(numbers, pool_ids):
+    """
+    Returns deltas failing their checks for every cycle and pool, so all of
+    their units are escalated to events.
+    """
+    index = pd.MultiIndex.from_product([numbers, pool_ids], names=ESTIMATE_KEYS)
+    deltas = pd.DataFrame(np.nan, index=index, columns=[*ESTIMATE_MEASURES, "swaps"])
+    deltas["ok"] = False
+    return deltas
+
+
+async def snapshot_estimates(pool_ids_chains, cycles):
+    """
+    Estimates the fees of pools per cycle from subgraph snapshots of their
+    cumulative fee fields at cycle boundaries, fetched per chain concurrently.
+
+    Boundary blocks can't be looked up on chains without a block source, so
+    the deltas of their pools are all rejected.
+    """
+    calendar = get_cycle_calendar()
+    numbers = [calendar.number(cycle) for cycle in cycles]
+    pools_per_chain = {}
+    for pool_id, chain in pool_ids_chains:
+        pools_per_chain.setdefault(chain, []).append(pool_id)
+
+    async def estimate_chain(chain, pool_ids):
+        if not has_block_source(chain):
+            logging.info(f"No block source on {chain.name}, escalating its pools")
+            return rejected_deltas(numbers, pool_ids)
+        boundaries = await calendar.boundary_blocks(chain, cycles)
+        # the open cycle ends at the subgraph's latest block
+        cycle_blocks = [
+            (
+                number,
+                int(boundaries[number - 1]),
+                int(boundaries[number]) if boundaries[number] >= 0 else LATEST,
+            )
+            for number in numbers
+        ]
+        blocks = sorted(
+            {block for _, start, end in cycle_blocks for block in (start, end)}
+        )
+        snapshots = await fetch_pool_snapshots(chain, blocks, pool_ids)
+        return snapshot_deltas(snapshots, cycle_blocks, pool_ids)
+
+    deltas = await asyncio.gather(
+        *[estimate_chain(chain, ids) for chain, ids in pools_per_chain.items()]
+    )
+    return pd.concat(deltas).sort_index()
+
+
+def escalated_units(deltas, pool_ids_chains, cycles):
+    """
+    Returns the ((pool id, Chain), Cycle) units whose snapshot check failed.
+    """
+    calendar = get_cycle_calendar()
+    chains = dict(pool_ids_chains)
+    cycles_by_number = {calendar.number(cycle): cycle for cycle in cycles}
+    return [
+        ((pool_id, chains[pool_id]), cycles_by_number[number])
+        for number, pool_id in deltas.index[~deltas["ok"].to_numpy()]
+    ]
+
+
+def combine_estimates(deltas, per_cycle):
+    """
+    Replaces the rejected snapshot deltas by the fees of the events.
+
+    :param deltas: A frame as returned by ``snapshot_estimates``
+    :param per_cycle: The ``per_cycle`` frame of the escalated units
+    :return: A frame indexed by cycle and poolId with ``ESTIMATE_MEASURES``
+        and the ``source`` of each row, "snapshot" or "events"
+    """
+    estimates = deltas.loc[deltas["ok"], ESTIMATE_MEASURES].assign(source="snapshot")
+    events = per_cycle.groupby(level=ESTIMATE_KEYS)[ESTIMATE_MEASURES].sum()
+    escalated = deltas.index[~deltas["ok"].to_numpy()]
+    events = events.reindex(escalated, fill_value=0.0).assign(source="events")
+    return pd.concat([estimates, events]).sort_index()
+
+
+async def estimate_fees(pool_ids_chains, cycles, token_level=False, **kwargs):
+    """
+    Estimates the fees of pools per cycle aggregate-first: from snapshot
+    deltas where they pass their checks, from events elsewhere.
+
+    :param pool_ids_chains: A list of (pool id, Chain) pairs
+    :param cycles: The cycles to estimate
+    :param token_level: Whether per-token fees are needed, in which case
+        every unit is escalated to events
+    :param kwargs: Passed on to ``stream_analyze_pool``
+    :return: The estimates, as returned by ``combine_estimates``, and the
+        ``per_cycle`` frame of the escalated units
+    """
+    deltas = await snapshot_estimates(pool_ids_chains, cycles)
+    if token_level:
+        deltas["ok"] = False
+    units = escalated_units(deltas, pool_ids_chains, cycles)
+    logging.info(f"Escalating {len(units)} of {len(deltas)} units to events")
+    per_cycle = await stream_analyze_pool(pool_ids_chains, units=units, **kwargs)
+    return combine_estimates(deltas, per_cycle), per_cycle
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import time
+
+import pandas as pd
+
+from balpy_v2.lib import flatten_records
+from balpy_v2.lib.time import HOUR_IN_SECONDS
+
+EVENT_STORE_DIR = os.getenv("BALPY_EVENT_STORE_DIR", ".balpy_events")
+MANIFEST_FILE_NAME = "manifest.jsonl"
+
+# Subgraphs index with a delay, so a cycle is only considered closed (and never
+# refetched) once its end is this far in the past.
+CLOSED_CYCLE_LAG = HOUR_IN_SECONDS
+
+
+def is_closed(cycle, now=None):
+    return cycle.end + CLOSED_CYCLE_LAG <= (now or time.time())
+
+
+class EventStore:
+    """
+    A local store of raw subgraph events partitioned by (kind, chain, pool, cycle).
+
+    Each partition is a Parquet file. Partitions of closed cycles are recorded
+    in an append-only manifest once fully fetched and are never fetched again;
+    the open cycle is rewritten on every refresh.
+
+    :ivar root: The directory partitions are written under.
+    :ivar completed: A dictionary of completed partition key to row count.
+    """
+
+    def __init__(self, root=EVENT_STORE_DIR):
+        self.root = root
+        self.completed = {}
+        self._load_manifest()
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.root, MANIFEST_FILE_NAME)
+
+    def _load_manifest(self):
+        if not os.path.exists(self.manifest_path):
+            return
+        with open(self.manifest_path) as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    self.completed[entry["partition"]] = entry["rows"]
+
+    @staticmethod
+    def partition_key(kind, chain, pool_id, cycle):
+        return f"{kind}/chain={chain.name}/pool={pool_id}/cycle={cycle.name}"
+
+    def partition_path(self, kind, chain, pool_id, cycle):
+        key = self.partition_key(kind, chain, pool_id, cycle)
+        return os.path.join(self.root, f"{key}.parquet")
+
+    def is_complete(self, kind, chain, pool_id, cycle):
+        return self.partition_key(kind, chain, pool_id, cycle) in self.completed
+
+    def write(self, kind, chain, pool_id, cycle, items):
+        """
+        Writes the raw events of one partition, marking it complete when its
+        cycle is closed.
+
+        :param kind: The event kind, e.g. "swaps" or "joinExits"
+        :param chain: The Chain of the pool
+        :param pool_id: The pool id
+        :param cycle: The Cycle the events belong to
+        :param items: The raw subgraph items
+        """
+        key = self.partition_key(kind, chain, pool_id, cycle)
+        path = self.partition_path(kind, chain, pool_id, cycle)
+        if items:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            pd.DataFrame(flatten_records(items, sep=".")).to_parquet(
+                tmp_path, index=False
+            )
+            os.replace(tmp_path, path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+        if is_closed(cycle):
+            os.makedirs(self.root, exist_ok=True)
+            with open(self.manifest_path, "a") as f:
+                f.write(json.dumps(dict(partition=key, rows=len(items))) + "\n")
+            self.completed[key] = len(items)
+        logging.debug(f"Stored {len(items)} {kind} for {key}")
+
+    def read(self, kind, chain, pool_id, cycle, columns=None):
+        path = self.partition_path(kind, chain, pool_id, cycle)
+        if not os.path.exists(path):
+            return pd.DataFrame()
+        return pd.read_parquet(path, columns=columns)
+
+    def scan(self, kind, chain, pool_id, cycles, columns=None):
+        """
+        Lazily yields the non-empty partitions of a pool, one cycle at a time.
+        """
+        for cycle in cycles:
+            df = self.read(kind, chain, pool_id, cycle, columns)
+            if not df.empty:
+                yield df
+
+    def load(self, kind, chain, pool_id, cycles, columns=None):
+        frames = list(self.scan(kind, chain, pool_id, cycles, columns))
+        if not frames:
+            return pd.DataFrame()
+        return pd.concat(frames, ignore_index=True)
+
+
+event_store = EventStore()
@@ -1,11 +1,12 @@
+import numpy as np
 import pandas as pd
 
-from balpy_v2.lib import flatten_json
+from balpy_v2.lib import flatten_records
 from balpy_v2.lib.gql import gql
+from fees_reporting.amounts import limbs_to_float, parse_decimal_strings
 
 GRAPH_URL = "https://api.thegraph.com/subgraphs/name/bleu-studio/balancer-mainnet-v2"
-QUERY = """
-query token($block: Int!) {
+POOL_TOKENS_SELECTION = """
     poolTokens(block: {number: $block},
                first: 1000,
                where:{
@@ -27,49 +28,24 @@ query token($block: Int!) {
       address
       symbol
     }
-  }
-}
+  }"""
+QUERY = f"""
+query token($block: Int!) {{{POOL_TOKENS_SELECTION}
+}}
 """
+# blocks fetched per aliased snapshot query
+BLOCKS_PER_QUERY = 25
 
 import asyncio
-import datetime
 
-from balpy_v2.subgraphs.blocks import get_block_number_by_timestamp
-
-REPORT_PERIOD_START_DATE = datetime.datetime(2022, 7, 11, 0, 0, 0).timestamp()
-
-# 2 weeks in seconds
-NOW = datetime.datetime.utcnow().timestamp()
-REPORT_PERIOD_DURATION = datetime.timedelta(weeks=2).total_seconds()
-
-import math
-
-REPORT_CYCLES_UNTIL_NOW = math.ceil(
-    (NOW - REPORT_PERIOD_START_DATE) / REPORT_PERIOD_DURATION
-)
-
-REPORT_CYCLES_START_DATES = [
-    REPORT_PERIOD_START_DATE + REPORT_PERIOD_DURATION * i
-    for i in range(REPORT_CYCLES_UNTIL_NOW)
-]
-
-CYCLES_NAMES_FROM_DATES = [
-    f"""{datetime.datetime.fromtimestamp(REPORT_PERIOD_START_DATE + REPORT_PERIOD_DURATION * i).strftime('%Y.%m.%d')}\
-    -\
-    {datetime.datetime.fromtimestamp(REPORT_PERIOD_START_DATE + REPORT_PERIOD_DURATION * (i + 1)).strftime('%Y.%m.%d')}""".replace(
-        " ", ""
-    )
-    for i in range(REPORT_CYCLES_UNTIL_NOW)
-]
+from balpy_v2.lib import Chain
+from fees_reporting.cycle import get_cycle_calendar
 
 
 async def report_cycles_block_numbers():
-    return await asyncio.gather(
-        *[
-            get_block_number_by_timestamp(timestamp=int(ts))
-            for ts in REPORT_CYCLES_START_DATES
-        ]
-    )
+    calendar = get_cycle_calendar()
+    blocks = await calendar.boundary_blocks(Chain.mainnet)
+    return [int(block) for block in blocks[: len(calendar)]]
 
 
 async def report_cycles_data():
@@ -86,9 +62,9 @@ async def report_cycles_data():
         ]
     )
 
+    starts = get_cycle_calendar().starts
     return [
-        (result, blocks[idx], REPORT_CYCLES_START_DATES[idx])
-        for idx, result in enumerate(results)
+        (result, blocks[idx], int(starts[idx])) for idx, result in enumerate(results)
     ]
 
 
@@ -96,14 +72,14 @@ def period_analysis(start, end):
     period_start_data, start_block, start_date = start
     period_end_data, end_block, end_date = end
     period_start_df = (
-        pd.DataFrame([flatten_json(x) for x in period_start_data["poolTokens"]])
+        pd.DataFrame(flatten_records(period_start_data["poolTokens"]))
         .set_index(["id"])
         .add_suffix("_start")
     )
     period_start_df["block_start"] = start_block
     period_start_df["date_start"] = start_date
     period_end_df = (
-        pd.DataFrame([flatten_json(x) for x in period_end_data["poolTokens"]])
+        pd.DataFrame(flatten_records(period_end_data["poolTokens"]))
         .set_index("id")
         .add_suffix("_end")
     )
@@ -117,26 +93,15 @@ def period_analysis(start, end):
         .set_index("date_start", append=True)
     )
     merged["address_start"] = "ethereum:" + merged["address_start"]
-    merged[
-        [
-            "token_latestUSDPrice_end",
-            "token_latestUSDPrice_start",
-            "paidProtocolFees_end",
-            "paidProtocolFees_start",
-        ]
-    ] = merged[
-        [
-            "token_latestUSDPrice_end",
-            "token_latestUSDPrice_start",
-            "paidProtocolFees_end",
-            "paidProtocolFees_start",
-        ]
-    ].astype(
-        float
-    )
-    merged["paidProtocolFees_diff"] = (
-        merged["paidProtocolFees_end"] - merged["paidProtocolFees_start"]
-    )
+    merged[["token_latestUSDPrice_end", "token_latestUSDPrice_start"]] = merged[
+        ["token_latestUSDPrice_end", "token_latestUSDPrice_start"]
+    ].apply(pd.to_numeric)
+    # diff the cumulative fees exactly before converting to float
+    fees_end = parse_decimal_strings(merged["paidProtocolFees_end"])
+    fees_start = parse_decimal_strings(merged["paidProtocolFees_start"])
+    merged["paidProtocolFees_end"] = limbs_to_float(fees_end)
+    merged["paidProtocolFees_start"] = limbs_to_float(fees_start)
+    merged["paidProtocolFees_diff"] = limbs_to_float(fees_end - fees_start)
     paid_fees = merged[merged["paidProtocolFees_diff"] != 0].sort_values(
         "paidProtocolFees_diff", ascending=False
     )
@@ -150,6 +115,102 @@ def period_analysis(start, end):
 
 
 async def full_analysis():
-    data = await report_cycles_data()
-    cycles_data = list(zip(data, data[1:] + data[:1]))[:-1]
-    return pd.concat([period_analysis(*x) for x in cycles_data])
+    blocks = await report_cycles_block_numbers()
+    starts = get_cycle_calendar().starts[: len(blocks)]
+    return fee_deltas(await fetch_snapshots(blocks, starts))
+
+
+def snapshots_query(blocks):
+    """
+    Builds one query fetching the poolTokens snapshot of every block, each
+    aliased as ``b<block>``.
+    """
+    selections = "".join(
+        f"\n  b{block}: " + POOL_TOKENS_SELECTION.replace("$block", str(block)).strip()
+        for block in blocks
+    )
+    return f"query snapshots {{{selections}\n}}"
+
+
+def snapshot_table(responses, blocks, dates):
+    """
+    Stacks the snapshots of all blocks into one long table keyed by
+    (poolToken id, block), with the ordinal of each block.
+    """
+    records, ordinals = [], []
+    for ordinal, block in enumerate(blocks):
+        tokens = responses[f"b{block}"]
+        records.extend(tokens)
+        ordinals.extend([ordinal] * len(tokens))
+    table = pd.DataFrame(flatten_records(records))
+    ordinals = np.asarray(ordinals, dtype=np.int64)
+    table["ordinal"] = ordinals
+    table["block"] = np.asarray(blocks, dtype=np.int64)[ordinals]
+    table["date"] = np.asarray(dates, dtype=np.int64)[ordinals]
+    return table
+
+
+async def fetch_snapshots(blocks, dates, blocks_per_query=BLOCKS_PER_QUERY):
+    batches = [
+        blocks[i : i + blocks_per_query]
+        for i in range(0, len(blocks), blocks_per_query)
+    ]
+    results = await asyncio.gather(
+        *[gql(GRAPH_URL, snapshots_query(batch)) for batch in batches]
+    )
+    responses = {
+        alias: tokens for result in results for alias, tokens in result.items()
+    }
+    return snapshot_table(responses, blocks, dates)
+
+
+def fee_deltas(snapshots):
+    """
+    Computes the ``paidProtocolFees`` paid by every poolToken between each
+    pair of consecutive snapshots with one sort and a grouped diff, in the
+    layout of ``period_analysis``.
+    """
+    table = snapshots.sort_values(["id", "ordinal"], kind="stable").reset_index(
+        drop=True
+    )
+    ids = table["id"].to_numpy()
+    ordinals = table["ordinal"].to_numpy()
+    # a delta only exists where the token is in two consecutive snapshots
+    end = (
+        np.flatnonzero((ids[1:] == ids[:-1]) & (ordinals[1:] == ordinals[:-1] + 1)) + 1
+    )
+    start = end - 1
+
+    fields = [c for c in table.columns if c not in ("id", "ordinal")]
+    merged = pd.concat(
+        [
+            table[["id"]].iloc[end].reset_index(drop=True),
+            table[fields].iloc[start].reset_index(drop=True).add_suffix("_start"),
+            table[fields].iloc[end].reset_index(drop=True).add_suffix("_end"),
+        ],
+        axis=1,
+    ).set_index(["id", "date_start"])
+    merged["address_start"] = "ethereum:" + merged["address_start"]
+    merged[["token_latestUSDPrice_end", "token_latestUSDPrice_start"]] = merged[
+        ["token_latestUSDPrice_end", "token_latestUSDPrice_start"]
+    ].apply(pd.to_numeric)
+
+    fees = parse_decimal_strings(table["paidProtocolFees"])
+    merged["paidProtocolFees_end"] = limbs_to_float(fees[end])
+    merged["paidProtocolFees_start"] = limbs_to_float(fees[start])
+    merged["paidProtocolFees_diff"] = limbs_to_float(fees[end] - fees[start])
+    paid_fees = merged[merged["paidProtocolFees_diff"] != 0]
+    order = np.lexsort(
+        (
+            -paid_fees["paidProtocolFees_diff"].to_numpy(),
+            paid_fees["block_start"].to_numpy(),
+        )
+    )
+    paid_fees = paid_fees.iloc[order].copy()
+    paid_fees["paidProtocolFees_inUSD_end"] = (
+        paid_fees["paidProtocolFees_diff"] * paid_fees["token_latestUSDPrice_end"]
+    )
+    paid_fees["paidProtocolFees_inUSD_start"] = (
+        paid_fees["paidProtocolFees_diff"] * paid_fees["token_latestUSDPrice_start"]
+    )
+    return paid_fees
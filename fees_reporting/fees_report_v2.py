@@ -8,19 +8,20 @@ from pprint import pprint
 
 
 import pandas as pd
-from balpy_v2.lib import flatten_json
+from balpy_v2.lib import flatten_json, flatten_records
 
 # Important assumption:
 # USD value here is considered form Balancer, not from Coingecko or Llama
 # A major improvement would be to use Coingecko or Llama to get instantaneous the USD value
 from balpy_v2.lib.gql import gql
+from balpy_v2.cache import cache_manager
+from balpy_v2.lib.time import HOUR_IN_SECONDS
 
-from joblib import Memory
-
-from fees_reporting.cycle import generate_cycles_until_now
-
-cachedir = ".balpy_cache"
-memory = Memory(cachedir, verbose=0)
+from fees_reporting.amounts import to_fixed_point
+from fees_reporting.cycle import generate_cycles_until_now, get_cycle_calendar
+from fees_reporting.encoding import identifiers
+from fees_reporting.event_store import event_store
+from fees_reporting.join_exits import JoinExits
 
 logging.basicConfig(level=logging.INFO)
 from balpy_v2.subgraphs.client import GraphQLClient
@@ -50,41 +51,58 @@ class BalancerSubgraphQuery(GraphQLQuery):
         return BalancerSubgraph(self.chain)
 
 
-class SwapsQuery(BalancerSubgraphQuery):
-    def get_query(self):
-        return """query MySwaps ($skip: Int, $block: Int, $after: Int, $before: Int, $poolId: ID!) {
-  swaps(first:1000, skip: $skip, where:{timestamp_lt: $before, timestamp_gt: $after, poolId: $poolId, swapFeesUSD_not: "0"}, orderBy: timestamp) {
-    id
-    valueUSD
-    swapFeesUSD
-    timestamp
+SWAPS_QUERY = """query MySwaps ($skip: Int, $block: Int, $after: Int, $before: Int, $poolId: ID!) {
+  swaps(first:1000, skip: $skip, %(block)swhere:{timestamp_lt: $before, timestamp_gt: $after, poolId: $poolId, swapFeesUSD_not: "0"}, orderBy: timestamp) {
+    %(id)stimestamp
     tokenAmountIn
     tokenAmountOut
     tokenIn
     tokenOut
-    tx
-    pool: poolId {
-      id
-    }
   }
 }"""
 
+JOINS_QUERY = """query JoinExits ($skip: Int, $block: Int, $after: Int, $before: Int, $poolId: ID!) {
+  joinExits(first: 1000, skip: $skip, %(block)swhere:{timestamp_lt: $before, timestamp_gt: $after, pool: $poolId, protocolFeeUSD_not: "0"}, orderBy: timestamp) {
+    %(id)sprotocolFeeAmounts
+    amounts
+    timestamp
+  }
+}"""
+
+
+def event_query(template, block=None):
+    """
+    Fills an event query template. With a ``block``, events are read as of
+    that block, so none indexed after it are returned, along with their ids.
+    """
+    if block is None:
+        return template % dict(block="", id="")
+    return template % dict(block="block: {number: $block}, ", id="id\n    ")
+
+
+class SwapsQuery(BalancerSubgraphQuery):
+    def get_query(self):
+        return event_query(SWAPS_QUERY, self.variables.get("block"))
+
 
 class JoinsQuery(BalancerSubgraphQuery):
     def get_query(self):
-        return """query JoinExits ($skip: Int, $block: Int, $after: Int, $before: Int, $poolId: ID!) {
-  joinExits(first: 1000, skip: $skip, where:{timestamp_lt: $before, timestamp_gt: $after, pool: $poolId, protocolFeeUSD_not: "0"}, orderBy: timestamp) {
+        return event_query(JOINS_QUERY, self.variables.get("block"))
+
+
+class PoolQuery(BalancerSubgraphQuery):
+    def get_query(self):
+        if self.variables.get("block") is None:
+            return """query Pool ($poolId: ID!) {
+  pool(id: $poolId) {
     id
-    protocolFeeUSD
-    protocolFeeAmounts
-    amounts
-    valueUSD
-    timestamp
-    tx
-    pool {
-      id
-      tokensList
-    }
+    tokensList
+  }
+}"""
+        return """query Pool ($poolId: ID!, $block: Int!) {
+  pool(id: $poolId, block: {number: $block}) {
+    id
+    tokensList
   }
 }"""
 
@@ -92,11 +110,15 @@ class JoinsQuery(BalancerSubgraphQuery):
 import asyncio
 import datetime
 import math
-from balpy_v2.subgraphs.blocks import get_block_number_by_timestamp
+from balpy_v2.subgraphs.blocks import get_block_number_by_timestamp, has_block_source
 
 
 MAX_RETRIES = 3  # define a maximum number of retries
 
+# token lists only change when a pool is re-versioned, so refreshing them
+# daily is enough
+pool_metadata_cache = cache_manager.namespace("pool_metadata", ttl=HOUR_IN_SECONDS * 24)
+
 
 async def execute_query(query, chain, variables):
     if query == "JOINS_QUERY":
@@ -119,10 +141,12 @@ def extract_items_from_response(response):
         raise ValueError("Invalid query type")
 
 
-async def get_query_data(query, pool_id_chain, after, before, current_skip):
+async def get_query_data(query, pool_id_chain, after, before, current_skip, block=None):
     pool_id, chain = pool_id_chain
     while True:
-        variables = dict(after=after, before=before, skip=current_skip, poolId=pool_id)
+        variables = dict(
+            after=after, before=before, skip=current_skip, poolId=pool_id, block=block
+        )
         response = await execute_query(query, chain, variables)
         if "errors" in response:
             max_skip = check_skip_error(response)
@@ -132,6 +156,105 @@ async def get_query_data(query, pool_id_chain, after, before, current_skip):
             return None, extract_items_from_response(response)
 
 
+@pool_metadata_cache.cache
+async def get_pool_tokens(pool_id_chain, block=None):
+    """
+    Returns the token list of a pool, fetched once and shared by all of its
+    joinExits instead of being repeated on every row.
+
+    :param pool_id_chain: The (pool id, Chain) of the pool
+    :param block: The block to read the token list at, the latest by default
+    """
+    pool_id, chain = pool_id_chain
+    response = await PoolQuery(chain, dict(poolId=pool_id, block=block)).execute()
+    pool = response.get("pool")
+    if pool is None:
+        raise ValueError(f"Pool {pool_id} not found on {chain.name}")
+    return pool["tokensList"]
+
+
+async def get_join_exit_tokens(pool_id_chain, join_exits_df, swaps_df=None):
+    """
+    Returns the token list of every joinExit of a pool.
+
+    Rows whose amounts match the pool's current token list share it. The
+    others predate a change of the pool's tokens and get the token list the
+    pool had at their timestamp; consecutive rows reuse a fetched version
+    as long as their amounts match it. A change that keeps the number of
+    tokens is caught through the pool's swaps: rows up to the last swap of a
+    token missing from the current list are looked up too.
+
+    On chains without a block source, rows are given the current token list
+    (cut or padded with None to their number of amounts) with a warning.
+
+    :param pool_id_chain: The (pool id, Chain) of the pool
+    :param join_exits_df: The pool's raw joinExits
+    :param swaps_df: The pool's raw swaps over the same period, optional
+    :return: A list with one token list per row
+    """
+    if join_exits_df.empty:
+        return []
+    pool_id, chain = pool_id_chain
+    tokens = await get_pool_tokens(pool_id_chain)
+    lengths = join_exits_df["amounts"].map(len)
+    timestamps = join_exits_df["timestamp"].astype(int)
+    token_lists = [tokens] * len(join_exits_df)
+    stale = lengths != len(tokens)
+    if swaps_df is not None and not swaps_df.empty:
+        current = {token.lower() for token in tokens}
+        removed = ~(
+            swaps_df["tokenIn"].str.lower().isin(current)
+            & swaps_df["tokenOut"].str.lower().isin(current)
+        )
+        if removed.any():
+            stale |= timestamps <= swaps_df.loc[removed, "timestamp"].astype(int).max()
+    if not stale.any():
+        return token_lists
+
+    if not has_block_source(chain):
+        logging.warning(
+            f"{stale.sum()} joinExits of {pool_id} may predate a change of its "
+            f"tokens, but {chain.name} has no block source; using its current "
+            "token list"
+        )
+        for position, (n, is_stale) in enumerate(zip(lengths, stale)):
+            if is_stale:
+                token_lists[position] = (tokens + [None] * n)[:n]
+        return token_lists
+
+    version, checked = tokens, False
+    for row, timestamp in timestamps[stale].sort_values(kind="stable").items():
+        position = join_exits_df.index.get_loc(row)
+        if len(version) != lengths[row] or not checked:
+            block = await get_block_number_by_timestamp(
+                chain=chain, timestamp=timestamp
+            )
+            version, checked = await get_pool_tokens(pool_id_chain, block), True
+            if len(version) != lengths[row]:
+                raise ValueError(
+                    f"joinExit of {pool_id} at {timestamp} has {lengths[row]} "
+                    f"amounts, but the pool had {len(version)} tokens at block {block}"
+                )
+        token_lists[position] = version
+    return token_lists
+
+
+def attach_pool_metadata(swaps_df, join_exits_df, pool_id, token_lists):
+    """
+    Joins the pool id and token lists locally onto the slimmed event rows.
+
+    :param token_lists: One token list per joinExit, as returned by
+        ``get_join_exit_tokens``
+    """
+    for df in (swaps_df, join_exits_df):
+        if not df.empty:
+            df["pool.id"] = pool_id
+    if join_exits_df.empty:
+        return join_exits_df
+    join_exits_df["pool.tokensList"] = token_lists
+    return join_exits_df
+
+
 def check_skip_error(response):
     for error in response["errors"]:
         if "skip" in error["message"]:
@@ -150,6 +273,7 @@ async def get_paginated_data(
     page_size=1000,
     pages_per_group=1,
     max_pages=1000,
+    block=None,
 ):
     data = []
     skip = 0
@@ -165,7 +289,7 @@ async def get_paginated_data(
                 current_skip = max_skip
 
             max_skip_new, items = await get_query_data(
-                query, pool_id_chain, after, before, current_skip
+                query, pool_id_chain, after, before, current_skip, block
             )
             if max_skip_new is not None:
                 max_skip = max_skip_new
@@ -188,80 +312,113 @@ async def get_paginated_data(
     return data
 
 
-@memory.cache
-async def fetch_data(query, pool_id_chain, cycles):
-    data = await asyncio.gather(
-        *[
-            get_paginated_data(query, pool_id_chain, cycle.start, cycle.end)
-            for cycle in cycles
-        ]
+QUERY_EVENT_KINDS = {"SWAPS_QUERY": "swaps", "JOINS_QUERY": "joinExits"}
+QUERY_EVENT_TYPES = {"SWAPS_QUERY": "swap", "JOINS_QUERY": "joinExit"}
+SWAP_AMOUNT_COLUMNS = ["tokenAmountIn", "tokenAmountOut"]
+# Repeated identifiers held as categoricals over the shared dictionary; event
+# ids and tx hashes are unique per row, so they're left as strings
+IDENTIFIER_COLUMNS = ["tokenIn", "tokenOut", "pool.id"]
+
+
+async def fetch_partition(query, pool_id_chain, cycle, store=event_store):
+    pool_id, chain = pool_id_chain
+    kind = QUERY_EVENT_KINDS[query]
+    if store.is_complete(kind, chain, pool_id, cycle):
+        return
+    # timestamp_gt start - 1 and timestamp_lt end fetch the half-open cycle
+    items = await get_paginated_data(query, pool_id_chain, cycle.start - 1, cycle.end)
+    store.write(kind, chain, pool_id, cycle, items)
+
+
+async def fetch_data(query, pool_id_chain, cycles, store=event_store):
+    """
+    Makes sure the store holds the events of every cycle, only fetching
+    partitions that are missing or belong to the open cycle.
+    """
+    await asyncio.gather(
+        *[fetch_partition(query, pool_id_chain, cycle, store) for cycle in cycles]
     )
-    return data
+    pool_id, chain = pool_id_chain
+    return store.load(QUERY_EVENT_KINDS[query], chain, pool_id, cycles)
 
 
 def create_dataframes(swaps_data, join_exits_data):
-    swaps_df = pd.json_normalize(swaps_data)
-    join_exits_df = pd.json_normalize(join_exits_data)
+    swaps_df = pd.DataFrame(flatten_records(swaps_data, sep="."))
+    join_exits_df = pd.DataFrame(flatten_records(join_exits_data, sep="."))
     return swaps_df, join_exits_df
 
 
-def split_and_process_data(df, query_type, cycles):
+def split_and_process_data(df, query_type, calendar=None):
+    """
+    Tags every event with its cycle number and event type.
+
+    Cycles are half-open ``[start, end)``, so events on a boundary are counted
+    once; events outside the calendar are dropped.
+    """
     if df.empty:
         return df
-    result = []
-    for idx, cycle in enumerate(cycles):
-        cycle_data = df[
-            (df["timestamp"] >= cycle.start) & (df["timestamp"] <= cycle.end)
-        ].copy()
-        cycle_data["Cycle"] = idx + 1
+    calendar = calendar or get_cycle_calendar()
+    df = df.copy()
+    df["Cycle"] = calendar.assign(df["timestamp"])
+    df["type"] = QUERY_EVENT_TYPES[query_type]
+    return df[df["Cycle"] > 0].reset_index(drop=True)
 
-        if query_type == "SWAPS_QUERY":
-            cycle_data["type"] = "swap"
-        elif query_type == "JOINS_QUERY":
-            cycle_data["type"] = "joinExit"
 
-        result.append(cycle_data)
+async def load_pool_events(pool_id_chain, cycles, store=event_store):
+    swaps_df, join_exits_df = await asyncio.gather(
+        fetch_data("SWAPS_QUERY", pool_id_chain, cycles, store),
+        fetch_data("JOINS_QUERY", pool_id_chain, cycles, store),
+    )
+    token_lists = await get_join_exit_tokens(pool_id_chain, join_exits_df, swaps_df)
+    return swaps_df, join_exits_df, token_lists
 
-    result_df = pd.concat(result, ignore_index=True)
-    return result_df
 
+def prepare_pool_events(pool_id_chain, swaps_df, join_exits_df, token_lists):
+    """
+    Turns the raw events of a pool into encoded, cycle-tagged frames.
+    """
+    pool_id, chain = pool_id_chain
+    join_exits_df = attach_pool_metadata(swaps_df, join_exits_df, pool_id, token_lists)
+    for df in (swaps_df, join_exits_df):
+        if not df.empty:
+            df["chain"] = chain.name
+    to_fixed_point(swaps_df, SWAP_AMOUNT_COLUMNS)
+    identifiers.encode_columns(swaps_df, IDENTIFIER_COLUMNS)
+    identifiers.encode_columns(join_exits_df, IDENTIFIER_COLUMNS)
 
-@memory.cache
-async def fetch_data_for_pool(pool_id_chain, cycles):
-    swaps_data, join_exits_data = await asyncio.gather(
-        fetch_data("SWAPS_QUERY", pool_id_chain, cycles),
-        fetch_data("JOINS_QUERY", pool_id_chain, cycles),
-    )
-    swaps_data = [item for sublist in swaps_data for item in sublist]
-    join_exits_data = [item for sublist in join_exits_data for item in sublist]
+    swaps_result = split_and_process_data(swaps_df, "SWAPS_QUERY")
+    join_exits_result = split_and_process_data(join_exits_df, "JOINS_QUERY")
 
-    swaps_df, join_exits_df = create_dataframes(swaps_data, join_exits_data)
+    return swaps_result, JoinExits.from_events(join_exits_result)
 
-    cycles = generate_cycles_until_now()
-    swaps_result = split_and_process_data(swaps_df, "SWAPS_QUERY", cycles)
-    join_exits_result = split_and_process_data(join_exits_df, "JOINS_QUERY", cycles)
 
-    return swaps_result, join_exits_result
+async def fetch_data_for_pool(pool_id_chain, cycles, store=event_store):
+    swaps_df, join_exits_df, token_lists = await load_pool_events(
+        pool_id_chain, cycles, store
+    )
+    return prepare_pool_events(pool_id_chain, swaps_df, join_exits_df, token_lists)
 
 
-@memory.cache
-async def generate_reports(pool_ids_chains, cycles=None):
+async def generate_reports(pool_ids_chains, cycles=None, store=event_store):
     all_swaps = []
     all_join_exits = []
+    cycles = cycles or generate_cycles_until_now()
 
     results = await asyncio.gather(
         *[
-            fetch_data_for_pool(pool_id_chain, cycles)
+            fetch_data_for_pool(pool_id_chain, cycles, store)
             for pool_id_chain in pool_ids_chains
         ]
     )
 
     for idx, _ in enumerate(pool_ids_chains):
         swaps_result, join_exits_result = results[idx]
-        all_swaps.append(swaps_result)
+        # the dictionary grows while pools are fetched, so re-align every
+        # frame to its final state before concatenating
+        all_swaps.append(identifiers.encode_columns(swaps_result, IDENTIFIER_COLUMNS))
         all_join_exits.append(join_exits_result)
 
     all_swaps_df = pd.concat(all_swaps, ignore_index=True)
-    all_join_exits_df = pd.concat(all_join_exits, ignore_index=True)
+    all_join_exits_df = JoinExits.concat(all_join_exits)
 
     return all_swaps_df, all_join_exits_df
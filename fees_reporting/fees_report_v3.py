@@ -6,46 +6,65 @@ import httpx
 from pprint import pprint
 from fees_reporting.fees_report_v2 import generate_reports
 import logging
-from .fees_report_v2 import memory
 import asyncio
 import httpx
 import json
 import logging
-from joblib import Memory
 from typing import Dict, List
 
+import numpy as np
+from pandas.api.types import is_categorical_dtype, is_list_like
+
+from balpy_v2.cache import cache_manager
+from balpy_v2.lib.llama.coins import coin_key_index
+from balpy_v2.lib.metrics import http_client, metrics, record_retry
+from fees_reporting.aggregation import aggregate_fees
+from fees_reporting.amounts import (
+    fixed_point_columns,
+    fixed_point_to_float,
+    multiply_limbs,
+)
+from fees_reporting.cycle import generate_cycles_until_now
+from fees_reporting.encoding import identifiers
+from fees_reporting.parallel import process_in_workers
+
 MAX_CONCURRENT_REQUESTS = 10  # Define max number of concurrent requests
+SWAP_FEE = 0.0004
 
 logging.basicConfig(level=logging.INFO)
-memory = Memory(".cache", verbose=0)
 
 semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
+# Llama responses only: transforming them is cheaper than keying the frames
+prices_cache = cache_manager.namespace("prices", max_bytes=512 * 1024**2)
+
 LLAMA_API_URL = "https://coins.llama.fi/batchHistorical"
 
 
-@memory.cache
+@prices_cache.cache
 async def get(url, **kwargs):
     async with semaphore:
-        async with httpx.AsyncClient() as client:
-            try:
-                r = await client.get(url, **kwargs)
-                r.raise_for_status()
-            except httpx.HTTPStatusError as e:
-                if e.response.status_code == 429:
-                    retry_after = int(e.response.headers.get("Retry-After", 1))
-                    logging.info(
-                        f"Rate limit exceeded. Retrying after {retry_after} seconds."
-                    )
-                    await asyncio.sleep(retry_after)
-                    return await get(url, **kwargs)
-                else:
-                    print(e.response.text)
-                    raise e
-            return r.json()
-
-
-@memory.cache
+        async with http_client() as client:
+            while True:
+                try:
+                    r = await client.get(url, **kwargs)
+                    r.raise_for_status()
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code == 429:
+                        retry_after = int(e.response.headers.get("Retry-After", 1))
+                        logging.info(
+                            f"Rate limit exceeded. Retrying after {retry_after} seconds."
+                        )
+                        record_retry(url)
+                        await asyncio.sleep(retry_after)
+                        continue
+                    else:
+                        print(e.response.text)
+                        raise e
+                return r.json()
+
+
+@prices_cache.cache
 async def single_request(url, batch_coins, search_width):
     response = await get(
         url, params={"coins": json.dumps(batch_coins), "searchWidth": search_width}
@@ -53,7 +72,7 @@ async def single_request(url, batch_coins, search_width):
     return response
 
 
-@memory.cache
+@prices_cache.cache
 async def batch_request(url, coins_dict, search_width=300, batch_size=50):
     tasks = []
 
@@ -76,24 +95,47 @@ async def batch_request(url, coins_dict, search_width=300, batch_size=50):
     return results
 
 
-@memory.cache
-def process_tokens(df, col_name):
-    df[col_name] = df[col_name].apply(
-        lambda x: [t if ":" in t else t for t in x]
-        if isinstance(x, list)
-        else x
-        if ":" in x
-        else x
-    )
+def normalize_token_keys(df, col_name, index=coin_key_index, chains=None):
+    """
+    Rewrites a token (or token list) column into canonical Llama coin keys.
+
+    Dictionary-encoded columns are rewritten once per distinct (chain, token)
+    pair and stay encoded. ``chains`` holds the chain of every row when the
+    frame has no chain column.
+    """
+    chains = df["chain"] if chains is None else chains
+    if is_categorical_dtype(df[col_name]):
+        codes = df[col_name].cat.codes.to_numpy()
+        keys = np.full(len(df), -1, dtype=np.int32)
+        for chain, rows in df.groupby(chains).indices.items():
+            tokens, inverse = np.unique(codes[rows], return_inverse=True)
+            tokens = identifiers.decode(tokens)
+            tokens = [index.key(chain, t) if t is not None else None for t in tokens]
+            keys[rows] = identifiers.encode(tokens)[inverse]
+        df[col_name] = pd.Categorical.from_codes(keys, identifiers.categories())
+        return
+    df[col_name] = [
+        index.keys(chain, tokens) if is_list_like(tokens) else index.key(chain, tokens)
+        for chain, tokens in zip(chains, df[col_name])
+    ]
+
 
-    if df[col_name].apply(lambda x: isinstance(x, list)).any():
+def process_tokens(df, col_name):
+    """
+    Groups the timestamps each coin is needed at.
+    """
+    if df[col_name].apply(is_list_like).any():
         tokens_agg = (
-            df.explode(col_name).groupby(col_name).agg(list).to_dict(orient="index")
+            df[[col_name, "timestamp"]]
+            .explode(col_name)
+            .groupby(col_name)
+            .agg(list)
+            .to_dict(orient="index")
         )
     else:
         tokens_agg = (
             df[[col_name, "timestamp"]]
-            .groupby(col_name)
+            .groupby(col_name, observed=True)
             .agg(list)
             .to_dict(orient="index")
         )
@@ -101,7 +143,6 @@ def process_tokens(df, col_name):
     return {k: v["timestamp"] for k, v in tokens_agg.items()}
 
 
-@memory.cache
 def merge_results(results):
     merged_list = []
     for result in results:
@@ -115,7 +156,6 @@ def merge_results(results):
     return merged_list
 
 
-@memory.cache
 def find_closest_timestamp_and_price(swaps, df, key):
     swaps_copy = swaps.copy()
     df_copy = df.copy()
@@ -138,7 +178,6 @@ def find_closest_timestamp_and_price(swaps, df, key):
     return result
 
 
-@memory.cache
 async def get_all_tokens_rates(swaps, joins):
     # Process tokenIn and tokenOut columns
     all_tokens_dict = {}
@@ -147,13 +186,15 @@ async def get_all_tokens_rates(swaps, joins):
         all_tokens_dict.update(process_tokens(swaps, "tokenOut"))
 
     if not joins.empty:
-        pool_tokens_dict = process_tokens(joins, "pool.tokensList")
+        pool_tokens_dict = process_tokens(joins.token_timestamps(), "token")
         all_tokens_dict.update(
             (k, all_tokens_dict.get(k, []) + v) for k, v in pool_tokens_dict.items()
         )
 
-    # Perform batch requests for all tokens
+    # Perform batch requests for all tokens, but the prices known to be missing
+    all_tokens_dict = coin_key_index.without_missing(all_tokens_dict)
     all_tokens_response = await batch_request(LLAMA_API_URL, all_tokens_dict)
+    coin_key_index.record_responses(all_tokens_dict, all_tokens_response)
 
     # Merge results and create a DataFrame
     df = pd.DataFrame(
@@ -161,17 +202,45 @@ async def get_all_tokens_rates(swaps, joins):
         columns=["token", "timestamp", "price", "confidence"],
     )
     df = df.drop_duplicates()
+    df["token"] = identifiers.categorical(df["token"])
+    return df
+
+
+def normalize_event_tokens(swaps_df, joins_df):
+    """
+    Rewrites the token columns of events into canonical coin keys, in place.
+    """
+    if not swaps_df.empty:
+        normalize_token_keys(swaps_df, "tokenIn")
+        normalize_token_keys(swaps_df, "tokenOut")
+    if not joins_df.empty:
+        normalize_token_keys(joins_df.amounts, "token", chains=joins_df.gather("chain"))
+
+
+async def get_prices(swaps_df, joins_df, normalized=False):
+    """
+    Normalizes the token columns of events into coin keys and returns the
+    prices they need, with encoded tokens.
+
+    :param normalized: Whether the token columns already hold coin keys
+    """
+    if not normalized:
+        normalize_event_tokens(swaps_df, joins_df)
+    df = await get_all_tokens_rates(swaps_df, joins_df)
+    identifiers.encode_columns(df, ["token"])
     return df
 
 
 async def fetch_and_prepare_data(pool_ids_chains, cycles=None):
     logging.info("Fetching swaps and joins data...")
-    swaps_df, joins_df = await generate_reports(pool_ids_chains, cycles=cycles)
+    with metrics.wall_time("fetch"):
+        swaps_df, joins_df = await generate_reports(pool_ids_chains, cycles=cycles)
     logging.info("Fetching tokens rates data...")
     if swaps_df.empty and joins_df.empty:
         logging.info("No swaps or joins data found.")
         return swaps_df, joins_df, pd.DataFrame()
-    df = await get_all_tokens_rates(swaps_df, joins_df)
+    with metrics.wall_time("attach_prices"):
+        df = await get_prices(swaps_df, joins_df)
     return swaps_df, joins_df, df
 
 
@@ -180,12 +249,14 @@ def process_swaps(swaps_df, df):
     if swaps_df.empty:
         return pd.DataFrame()
     swaps = swaps_df.copy()
-    # swaps["tokenIn"] = "ethereum:" + swaps["tokenIn"].str.lower()
+    identifiers.encode_columns(swaps, ["tokenIn"])
+    identifiers.encode_columns(df, ["token"])
     swaps["timestamp"] = swaps["timestamp"].astype(int)
     df["timestamp"] = df["timestamp"].astype(int)
 
     logging.info("Finding closest timestamp and price for tokenIn...")
     df_tokenIn = find_closest_timestamp_and_price(swaps, df, "tokenIn")
+    identifiers.encode_columns(df_tokenIn, ["tokenIn", "token"])
     logging.info(f"df_tokenIn:\n{df_tokenIn.head()}")
 
     df_tokenIn = df_tokenIn.sort_values("timestamp")
@@ -200,10 +271,11 @@ def process_swaps(swaps_df, df):
     )
     logging.info(f"Swaps after merging:\n{swaps.head()}")
 
-    swaps["swapFeeTokenAmount"] = swaps["tokenAmountIn_tokenIn"].astype(float) * 0.0004
-    swaps["swapFees"] = swaps["swapFeeTokenAmount"].astype(float) * swaps[
-        "price"
-    ].astype(float)
+    swaps[fixed_point_columns("swapFeeTokenAmount")] = multiply_limbs(
+        swaps[fixed_point_columns("tokenAmountIn", "_tokenIn")].to_numpy(), SWAP_FEE
+    )
+    swaps["swapFeeTokenAmount"] = fixed_point_to_float(swaps, "swapFeeTokenAmount")
+    swaps["swapFees"] = swaps["swapFeeTokenAmount"] * swaps["price"].astype(float)
     swaps[["cycle", "poolId", "token"]] = swaps[
         ["Cycle_tokenIn", "pool.id_tokenIn", "tokenIn_tokenIn"]
     ]
@@ -211,118 +283,110 @@ def process_swaps(swaps_df, df):
 
 
 def process_joins(joins_df, df):
+    """
+    Prices the per-token amounts of the joinExits child table, gathering only
+    the parent columns needed rather than exploding the events.
+    """
     if joins_df.empty:
         return pd.DataFrame()
     logging.info("Processing joins data...")
-    joins = joins_df.copy()
-    joins = (
-        joins.explode(["pool.tokensList", "amounts", "protocolFeeAmounts"])
-        .reset_index(drop=True)
-        .sort_values("timestamp")
-    )
-    logging.info(f"Joins after exploding:\n{joins.head()}")
-
-    # joins["pool.tokensList"] = "ethereum:" + joins["pool.tokensList"].str.lower()
-    logging.info("Finding closest timestamp and price for pool tokensList...")
-    df_tokens = find_closest_timestamp_and_price(joins, df, "pool.tokensList")
+    joins = joins_df.amounts.copy()
+    for column in ("timestamp", "Cycle", "pool.id"):
+        joins[column] = joins_df.gather(column)
+    joins = joins.sort_values("timestamp")
+    identifiers.encode_columns(joins, ["token", "pool.id"])
+    identifiers.encode_columns(df, ["token"])
+    logging.info(f"Joins amounts:\n{joins.head()}")
+
+    logging.info("Finding closest timestamp and price for pool tokens...")
+    df_tokens = find_closest_timestamp_and_price(joins, df, "token")
+    identifiers.encode_columns(df_tokens, ["token", "pool.id"])
     logging.info(f"df_tokens:\n{df_tokens.head()}")
 
     df_tokens = df_tokens.sort_values("timestamp")
     joins = pd.merge_asof(
         joins,
         df_tokens,
-        left_on="timestamp",
-        right_on="timestamp",
-        left_by="pool.tokensList",
-        right_by="token",
+        on="timestamp",
+        by="token",
         suffixes=("_tokens", "_tokens_rate"),
     )
     logging.info(f"Joins after merging:\n{joins.head()}")
 
     joins["price"] = joins["price"].astype(float)
-    joins["protocolFeeAmounts_tokens"] = joins["protocolFeeAmounts_tokens"].astype(
-        float
+    joins["protocolFeeAmounts_tokens"] = fixed_point_to_float(
+        joins, "protocolFeeAmounts", "_tokens"
     )
     joins["protocolFeeAmountsUSD_tokens"] = (
         joins["protocolFeeAmounts_tokens"] * joins["price"]
     )
-    joins["amountsUSD"] = joins["amounts_tokens"].astype(float) * joins["price"]
-
-    joins[["cycle", "poolId", "token", "joinExitFeeTokenAmount"]] = joins[
-        [
-            "Cycle_tokens",
-            "pool.id_tokens",
-            "pool.tokensList_tokens",
-            "protocolFeeAmounts_tokens",
-        ]
+    joins["amountsUSD"] = (
+        fixed_point_to_float(joins, "amounts", "_tokens") * joins["price"]
+    )
+
+    joins[["cycle", "poolId", "joinExitFeeTokenAmount"]] = joins[
+        ["Cycle_tokens", "pool.id_tokens", "protocolFeeAmounts_tokens"]
+    ]
+    joins[fixed_point_columns("joinExitFeeTokenAmount")] = joins[
+        fixed_point_columns("protocolFeeAmounts", "_tokens")
     ]
     return joins
 
 
-async def analyze_pool(pool_ids_chains, cycles=None):
+def store_aggregates(aggregate_store, per_cycle, units):
+    """
+    Upserts a ``per_cycle`` frame into a FeeAggregateStore, replacing the
+    previous rows of every ((pool id, Chain), Cycle) unit it was computed for.
+    """
+    chains = {pool_id: chain.name for (pool_id, chain), _ in units}
+    if not per_cycle.empty:
+        pool_ids = per_cycle.index.get_level_values("poolId")
+        per_cycle = per_cycle.assign(chain=pool_ids.map(chains))
+    aggregate_store.upsert(per_cycle, units=units)
+
+
+async def analyze_pool(
+    pool_ids_chains, cycles=None, aggregate_store=None, workers=None, shard_by="pool"
+):
+    """
+    Computes the fees of pools per cycle, pool and token.
+
+    With ``workers``, processing and aggregation run in that many processes,
+    one shard of pools (or chains, see ``shard_by``) each, and the processed
+    swaps and joins are sent back and concatenated, sorted by timestamp.
+    """
     logging.info("Starting pool analysis...")
+    cycles = cycles or generate_cycles_until_now()
+    units = [
+        (pool_id_chain, cycle) for cycle in cycles for pool_id_chain in pool_ids_chains
+    ]
     swaps_df, joins_df, df = await fetch_and_prepare_data(pool_ids_chains, cycles)
     if swaps_df.empty and joins_df.empty:
+        if aggregate_store is not None:
+            store_aggregates(aggregate_store, pd.DataFrame(), units)
         return pd.DataFrame()
 
-    swaps = process_swaps(swaps_df, df)
-    joins = process_joins(joins_df, df)
-
-    logging.info("Aggregating fees per cycle and poolId...")
-
-    per_cycle = []
-    new_columns = []
-    if not swaps.empty:
-        new_columns.extend(
-            [
-                "swapFeeUSD",
-                "swapFeeTokenAmount",
-            ]
-        )
-        per_cycle.extend(
-            [
-                swaps.groupby(["cycle", "poolId", "token"])[["swapFees"]].sum(),
-                swaps.groupby(["cycle", "poolId", "token"])[
-                    ["swapFeeTokenAmount"]
-                ].sum(),
-            ]
+    if workers:
+        logging.info(f"Processing and aggregating fees in {workers} processes...")
+        per_cycle, swaps, joins = await process_in_workers(
+            swaps_df,
+            joins_df,
+            df,
+            workers=workers,
+            shard_by=shard_by,
+            return_events=True,
         )
-    if not joins.empty:
-        new_columns.extend(
-            [
-                "joinExitFeeUSD",
-                "joinExitFeeTokenAmount",
-            ]
-        )
-
-        per_cycle.extend(
-            [
-                joins.groupby(["cycle", "poolId", "token"])[
-                    ["protocolFeeAmountsUSD_tokens"]
-                ].sum(),
-                joins.groupby(["cycle", "poolId", "token"])[
-                    ["joinExitFeeTokenAmount"]
-                ].sum(),
-            ]
-        )
-
-    per_cycle = pd.concat(
-        per_cycle,
-        axis=1,
-    )
+    else:
+        with metrics.stage("aggregate"):
+            swaps = process_swaps(swaps_df, df)
+            joins = process_joins(joins_df, df)
 
-    per_cycle.columns = new_columns
-    # only add app when the columns exist
-    import numpy as np
+            logging.info("Aggregating fees per cycle and poolId...")
+            per_cycle = aggregate_fees(swaps, joins)
+    metrics.rows("aggregate", len(per_cycle))
 
-    per_cycle["totalUSD"] = np.zeros(per_cycle.shape[0])
-    per_cycle["totalToken"] = np.zeros(per_cycle.shape[0])
-    if not swaps.empty:
-        per_cycle["totalUSD"] += per_cycle["swapFeeUSD"]
-        per_cycle["totalToken"] += per_cycle["swapFeeTokenAmount"].astype(float)
-    if not joins.empty:
-        per_cycle["totalUSD"] += per_cycle["joinExitFeeUSD"]
-        per_cycle["totalToken"] += per_cycle["joinExitFeeTokenAmount"].astype(float)
+    if aggregate_store is not None:
+        store_aggregates(aggregate_store, per_cycle, units)
 
     logging.info("Pool analysis complete.")
     return (swaps, joins, df, per_cycle)
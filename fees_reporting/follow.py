@@ -0,0 +1,203 @@
+import asyncio
+import logging
+
+import pandas as pd
+
+from fees_reporting.aggregation import aggregate_fees, merge_partials
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.encoding import identifiers
+from fees_reporting.fees_report_v2 import (
+    IDENTIFIER_COLUMNS,
+    BalancerSubgraphQuery,
+    create_dataframes,
+    get_paginated_data,
+    get_join_exit_tokens,
+    prepare_pool_events,
+)
+from fees_reporting.fees_report_v3 import (
+    get_prices,
+    process_joins,
+    process_swaps,
+    store_aggregates,
+)
+from fees_reporting.join_exits import JoinExits
+
+POLL_INTERVAL = 60
+# blocks behind the subgraph head an event must be before it's counted
+REORG_DEPTH = 12
+
+
+class MetaQuery(BalancerSubgraphQuery):
+    def get_query(self):
+        if self.variables.get("block") is None:
+            return "query Meta { _meta { block { number timestamp } } }"
+        return """query Meta ($block: Int!) {
+  _meta(block: {number: $block}) { block { number timestamp } }
+}"""
+
+
+async def get_indexed_block(chain, block=None):
+    """
+    Returns the (number, timestamp) of the subgraph's head, or of ``block``.
+    """
+    response = await MetaQuery(chain, dict(block=block)).execute()
+    meta_block = response["_meta"]["block"]
+    return int(meta_block["number"]), int(meta_block["timestamp"])
+
+
+class FeeFollower:
+    """
+    Keeps running per-cycle fee aggregates of pools up to date by fetching,
+    on every poll, only the events indexed since the previous one.
+
+    Each chain has a cursor: the last block processed and its timestamp.
+    A poll moves it to the subgraph head minus ``reorg_depth`` blocks and
+    reads events as of that safe block, so events are counted only after
+    they're unlikely to be reorganized away. Several blocks can share a
+    timestamp, so a poll fetches from the cursor's timestamp on and skips
+    the events already counted at it, by id.
+
+    :ivar per_cycle: The running ``per_cycle`` frame.
+    :ivar cursors: A dictionary of Chain to (block number, timestamp) processed.
+    :ivar counted: A dictionary of Chain to the ids of the events counted at
+        or after its cursor's timestamp, to their timestamps.
+    """
+
+    def __init__(
+        self, pool_ids_chains, reorg_depth=REORG_DEPTH, since=None, aggregate_store=None
+    ):
+        """
+        :param pool_ids_chains: A list of (pool id, Chain) pairs
+        :param reorg_depth: The number of blocks an event must be behind the head
+        :param since: The timestamp to count events after, the start of the
+            current cycle by default
+        :param aggregate_store: A FeeAggregateStore to upsert the running
+            aggregates into after every poll, optional; they replace whole
+            (cycle, pool) rows, so ``since`` should then be a cycle start
+        """
+        self.pool_ids_chains = pool_ids_chains
+        self.reorg_depth = reorg_depth
+        self.aggregate_store = aggregate_store
+        since = since if since is not None else int(get_cycle_calendar()[-1].start) - 1
+        self.since = since
+        self.cursors = {chain: (None, since) for _, chain in pool_ids_chains}
+        self.counted = {chain: {} for _, chain in pool_ids_chains}
+        self.per_cycle = merge_partials([])
+
+    def _units(self):
+        # every pool in every cycle since ``since``, including those that
+        # have no events yet
+        return [
+            (pool_id_chain, cycle)
+            for cycle in get_cycle_calendar()
+            if cycle.end > self.since + 1
+            for pool_id_chain in self.pool_ids_chains
+        ]
+
+    async def _safe_block(self, chain):
+        head, _ = await get_indexed_block(chain)
+        safe = head - self.reorg_depth
+        last_block, _ = self.cursors[chain]
+        if last_block is not None and safe <= last_block:
+            return None
+        return await get_indexed_block(chain, safe)
+
+    async def _fetch_new_events(self, pool_id_chain, safe_block):
+        chain = pool_id_chain[1]
+        last_block, timestamp = self.cursors[chain]
+        # the first poll counts events after ``since``, later ones also
+        # those at the cursor's timestamp that weren't counted yet
+        after = timestamp if last_block is None else timestamp - 1
+        block, safe_timestamp = safe_block
+        swaps, join_exits = await asyncio.gather(
+            *[
+                get_paginated_data(
+                    query, pool_id_chain, after, safe_timestamp + 1, block=block
+                )
+                for query in ("SWAPS_QUERY", "JOINS_QUERY")
+            ]
+        )
+        counted = self.counted[chain]
+        new = {}
+        swaps, join_exits = [
+            [item for item in items if item["id"] not in counted]
+            for items in (swaps, join_exits)
+        ]
+        for item in swaps + join_exits:
+            new[item.pop("id")] = int(item["timestamp"])
+        swaps_df, join_exits_df = create_dataframes(swaps, join_exits)
+        token_lists = await get_join_exit_tokens(pool_id_chain, join_exits_df, swaps_df)
+        events = prepare_pool_events(
+            pool_id_chain, swaps_df, join_exits_df, token_lists
+        )
+        return new, events
+
+    async def poll(self):
+        """
+        Fetches, prices and aggregates the events indexed since the last poll.
+
+        :return: The number of new events
+        """
+        chains = list(self.cursors)
+        safe_blocks = dict(
+            zip(chains, await asyncio.gather(*map(self._safe_block, chains)))
+        )
+        pools = [p for p in self.pool_ids_chains if safe_blocks[p[1]] is not None]
+        results = await asyncio.gather(
+            *[
+                self._fetch_new_events(pool_id_chain, safe_blocks[pool_id_chain[1]])
+                for pool_id_chain in pools
+            ]
+        )
+        swaps_df = pd.concat(
+            [
+                identifiers.encode_columns(swaps, IDENTIFIER_COLUMNS)
+                for _, (swaps, _) in results
+            ]
+            or [pd.DataFrame()],
+            ignore_index=True,
+        )
+        joins_df = JoinExits.concat([joins for _, (_, joins) in results])
+
+        if not (swaps_df.empty and joins_df.empty):
+            df = await get_prices(swaps_df, joins_df)
+            partial = aggregate_fees(
+                process_swaps(swaps_df, df), process_joins(joins_df, df)
+            )
+            self.per_cycle = merge_partials([self.per_cycle, partial])
+            if self.aggregate_store is not None:
+                store_aggregates(self.aggregate_store, self.per_cycle, self._units())
+
+        for (_, chain), (new, _) in zip(pools, results):
+            self.counted[chain].update(new)
+        for chain, safe_block in safe_blocks.items():
+            if safe_block is not None:
+                self.cursors[chain] = safe_block
+                # only events at the new cursor's timestamp can be fetched again
+                self.counted[chain] = {
+                    event_id: t
+                    for event_id, t in self.counted[chain].items()
+                    if t >= safe_block[1]
+                }
+        return len(swaps_df) + len(joins_df)
+
+    async def follow(self, interval=POLL_INTERVAL, on_poll=None, polls=None):
+        """
+        Polls every ``interval`` seconds, forever or ``polls`` times.
+
+        :param on_poll: Called with the follower and the number of new
+            events after every poll
+        """
+        count = 0
+        while polls is None or count < polls:
+            try:
+                events = await self.poll()
+            except Exception as e:
+                # a failed poll leaves the cursors untouched, the next one retries
+                logging.warning(f"Poll failed: {e}")
+            else:
+                if on_poll is not None:
+                    on_poll(self, events)
+            count += 1
+            if polls is None or count < polls:
+                await asyncio.sleep(interval)
@@ -0,0 +1,106 @@
+import asyncio
+import math
+
+import pandas as pd
+from web3 import Web3
+
+from balpy_v2.cache import cache_manager
+from balpy_v2.cache.backends import MISSING
+from balpy_v2.contracts.base_contract import BalancerContractFactory
+from balpy_v2.contracts.multicall import BATCH_SIZE, multicall
+from balpy_v2.lib import Chain
+from balpy_v2.lib.time import WEEK_IN_SECONDS
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.event_store import is_closed
+
+# measure -> GaugeController function taking (gauge, timestamp)
+GAUGE_MEASURE_FUNCTIONS = {
+    "relative_weight": "gauge_relative_weight",
+    "votes": "points_weight",
+}
+WAD = 10**18
+
+# weights at the boundary of a closed cycle never change
+gauge_weights_cache = cache_manager.backend("gauge_weights")
+
+
+def _cache_key(measure, gauge, cycle):
+    return f"{measure}:{gauge.lower()}:{cycle.start}"
+
+
+def _week_start(timestamp):
+    # the controller keys points by week-aligned timestamps (Thursdays 00:00
+    # UTC), while cycles start on Mondays
+    return int(timestamp) // WEEK_IN_SECONDS * WEEK_IN_SECONDS
+
+
+def _to_float(measure, result):
+    # points_weight returns a (bias, slope) point, the bias being the votes
+    value = result[0] if measure == "votes" else result
+    return value / WAD
+
+
+async def gauge_weights(
+    gauges,
+    cycles,
+    measure="relative_weight",
+    chain=Chain.mainnet,
+    batch_size=BATCH_SIZE,
+):
+    """
+    Reads a GaugeController measure of every gauge at the start of every
+    cycle, in Multicall3 batches. The measure is read for the voting week the
+    cycle starts in.
+
+    The controller's functions take the timestamp as an argument, so every
+    boundary is read at the latest block rather than at a pinned one.
+    Values of closed cycles are cached permanently; failed reads are NaN.
+
+    :param gauges: The gauge addresses, as registered in the GaugeController
+    :param cycles: The Cycles to read the measure at
+    :param measure: Either "relative_weight" (a fraction of emissions) or
+        "votes" (the veBAL voting for the gauge)
+    :param chain: The Chain of the GaugeController
+    :param batch_size: The maximum number of reads per multicall
+    :return: A frame of cycle number by gauge address
+    """
+    function_name = GAUGE_MEASURE_FUNCTIONS[measure]
+    values, reads = {}, []
+    for cycle in cycles:
+        for gauge in gauges:
+            value = gauge_weights_cache.get(_cache_key(measure, gauge, cycle))
+            if value is MISSING:
+                reads.append((cycle, gauge))
+            else:
+                values[(cycle.start, gauge)] = value
+
+    if reads:
+        controller = BalancerContractFactory.create(chain, "GaugeController")
+        function = getattr(controller.web3_contract.functions, function_name)
+        functions = [
+            function(Web3.to_checksum_address(gauge), _week_start(cycle.start))
+            for cycle, gauge in reads
+        ]
+        batches = await asyncio.gather(
+            *[
+                multicall(chain, functions[i : i + batch_size])
+                for i in range(0, len(functions), batch_size)
+            ]
+        )
+        responses = [response for batch in batches for response in batch]
+        for (cycle, gauge), response in zip(reads, responses):
+            if "error" in response:
+                values[(cycle.start, gauge)] = math.nan
+                continue
+            value = _to_float(measure, response["result"])
+            values[(cycle.start, gauge)] = value
+            if is_closed(cycle):
+                gauge_weights_cache.set(_cache_key(measure, gauge, cycle), value)
+
+    calendar = get_cycle_calendar()
+    return pd.DataFrame(
+        [[values[(cycle.start, gauge)] for gauge in gauges] for cycle in cycles],
+        index=pd.Index([calendar.number(cycle) for cycle in cycles], name="cycle"),
+        columns=pd.Index(list(gauges), name="gauge"),
+        dtype=float,
+    )
@@ -0,0 +1,137 @@
+import numpy as np
+import pandas as pd
+
+from fees_reporting.amounts import fixed_point_columns, parse_decimal_strings
+from fees_reporting.encoding import identifiers
+
+TOKENS_COLUMN = "pool.tokensList"
+AMOUNT_COLUMNS = ["amounts", "protocolFeeAmounts"]
+
+
+def _flatten(lists, lengths):
+    if not lengths.sum():
+        return np.array([], dtype=object)
+    return np.concatenate([np.asarray(values, dtype=object) for values in lists])
+
+
+def _categorical_columns(df):
+    return [c for c in df if isinstance(df[c].dtype, pd.CategoricalDtype)]
+
+
+class JoinExits:
+    """
+    JoinExit events stored as a parent frame with one row per exit and a flat
+    child table with one row per (exit, token).
+
+    Per-token amounts live only in the child table, which references its
+    parent row by position, so multi-token exits never duplicate the parent
+    columns; the few parent columns pricing needs are gathered on demand.
+
+    :ivar events: The parent frame, one row per joinExit
+    :ivar amounts: The child table, with ``row``, ``tokenIndex``, an encoded
+        ``token`` and fixed-point limbs of ``amounts`` and ``protocolFeeAmounts``
+    """
+
+    def __init__(self, events=None, amounts=None):
+        self.events = events if events is not None else pd.DataFrame()
+        self.amounts = amounts if amounts is not None else self._empty_amounts()
+
+    @staticmethod
+    def _empty_amounts():
+        columns = {
+            "row": np.array([], dtype=np.int64),
+            "tokenIndex": np.array([], dtype=np.int32),
+            "token": identifiers.categorical([]),
+        }
+        for column in AMOUNT_COLUMNS:
+            for limb in fixed_point_columns(column):
+                columns[limb] = np.array([], dtype=np.int64)
+        return pd.DataFrame(columns)
+
+    @classmethod
+    def from_events(cls, df):
+        """
+        Splits joinExit rows with list columns (token list, amounts and fee
+        amounts) into a parent frame and a child table, in a vectorized pass.
+        """
+        if df.empty:
+            return cls(df)
+        events = df.drop(columns=[TOKENS_COLUMN, *AMOUNT_COLUMNS]).reset_index(
+            drop=True
+        )
+        lengths = df["amounts"].map(len).to_numpy()
+        offsets = np.concatenate([[0], np.cumsum(lengths)])
+        row = np.repeat(np.arange(len(df)), lengths)
+
+        amounts = pd.DataFrame(
+            {
+                "row": row,
+                "tokenIndex": (np.arange(offsets[-1]) - offsets[row]).astype(np.int32),
+                "token": identifiers.categorical(_flatten(df[TOKENS_COLUMN], lengths)),
+            }
+        )
+        for column in AMOUNT_COLUMNS:
+            limbs = parse_decimal_strings(_flatten(df[column], lengths).astype(str))
+            amounts[fixed_point_columns(column)] = limbs
+        return cls(events, amounts)
+
+    @classmethod
+    def concat(cls, parts):
+        parts = [part for part in parts if not part.empty]
+        if not parts:
+            return cls()
+        shifts = np.cumsum([0] + [len(part) for part in parts[:-1]])
+        for part in parts:
+            identifiers.encode_columns(part.events, _categorical_columns(part.events))
+            identifiers.encode_columns(part.amounts, ["token"])
+        events = pd.concat([part.events for part in parts], ignore_index=True)
+        amounts = pd.concat(
+            [
+                part.amounts.assign(row=part.amounts["row"] + shift)
+                for part, shift in zip(parts, shifts)
+            ],
+            ignore_index=True,
+        )
+        return cls(events, amounts)
+
+    @property
+    def empty(self):
+        return self.events.empty
+
+    def __len__(self):
+        return len(self.events)
+
+    @property
+    def offsets(self):
+        """
+        The start of every parent row's tokens in the child table, plus its end.
+        """
+        return np.searchsorted(self.amounts["row"].to_numpy(), np.arange(len(self) + 1))
+
+    def take(self, positions):
+        """
+        Selects parent rows by position, along with their child rows.
+        """
+        positions = np.asarray(positions, dtype=np.int64)
+        offsets = self.offsets
+        starts, lengths = offsets[positions], np.diff(offsets)[positions]
+        new_offsets = np.concatenate([[0], np.cumsum(lengths)])
+        new_rows = np.repeat(np.arange(len(positions)), lengths)
+        children = starts[new_rows] + np.arange(new_offsets[-1]) - new_offsets[new_rows]
+        amounts = self.amounts.iloc[children].reset_index(drop=True)
+        amounts["row"] = new_rows
+        return JoinExits(self.events.iloc[positions].reset_index(drop=True), amounts)
+
+    def gather(self, column):
+        """
+        Returns a parent column repeated along the child table.
+        """
+        values = self.events[column]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            return identifiers.categorical(values).take(self.amounts["row"])
+        return values.to_numpy()[self.amounts["row"].to_numpy()]
+
+    def token_timestamps(self):
+        return pd.DataFrame(
+            {"token": self.amounts["token"], "timestamp": self.gather("timestamp")}
+        )
@@ -7,6 +7,9 @@ import asyncio
 from functools import wraps
 import logging
 
+from balpy_v2.lib.llama.coins import coin_key_index
+from balpy_v2.lib.metrics import http_client, record_retry
+
 
 def retry_on_rate_limit(max_retries=5, rate_limit_status_code=429):
     def decorator(func):
@@ -18,6 +21,7 @@ def retry_on_rate_limit(max_retries=5, rate_limit_status_code=429):
                     return response
 
                 retry_after = int(response.headers.get("Retry-After", 1))
+                record_retry(response.request.url)
                 logging.info(
                     f"Rate limit exceeded. Retrying after {retry_after} seconds."
                 )
@@ -43,18 +47,22 @@ class LlamaAPIClient:
     semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
 
     def __init__(self):
-        self.client = httpx.AsyncClient()
+        self.client = http_client()
 
     @retry_on_rate_limit()
-    async def _get(self, url, **kwargs):
+    async def _request(self, url, **kwargs):
         async with self.semaphore:
-            try:
-                r = await self.client.get(url, **kwargs)
-                r.raise_for_status()
-            except HTTPStatusError as e:
-                print(e.response.text)
-                raise RequestError from e
-            return r.json()
+            return await self.client.get(url, **kwargs)
+
+    async def _get(self, url, **kwargs):
+        # rate limited responses are retried before raising
+        r = await self._request(url, **kwargs)
+        try:
+            r.raise_for_status()
+        except HTTPStatusError as e:
+            print(e.response.text)
+            raise RequestError from e
+        return r.json()
 
     async def single_request(self, batch_coins, search_width):
         response = await self._get(
@@ -65,6 +73,7 @@ class LlamaAPIClient:
 
     async def batch_request(self, coins_dict, search_width=300, batch_size=50):
         tasks = []
+        coins_dict = coin_key_index.without_missing(coins_dict)
 
         for token, timestamps in coins_dict.items():
             n = len(timestamps)
@@ -84,4 +93,5 @@ class LlamaAPIClient:
             raise e
 
         logging.info(f"Batch request finished. {len(results)} results received.")
+        coin_key_index.record_responses(coins_dict, results)
         return results
@@ -0,0 +1,189 @@
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from fees_reporting.aggregation import aggregate_fees, merge_partials
+from fees_reporting.encoding import identifiers
+from fees_reporting.join_exits import JoinExits
+
+WORKERS = os.cpu_count() or 1
+SHARD_KEYS = {"pool": "pool.id", "chain": "chain"}
+
+
+class SharedFrame:
+    """
+    A DataFrame written once as an Arrow IPC stream into shared memory.
+
+    Only the segment name travels to worker processes; they map the segment
+    and read the columns from it instead of unpickling a DataFrame.
+    Categoricals travel as Arrow dictionaries and are re-aligned to the
+    worker's own identifier dictionary on read.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+
+    @classmethod
+    def create(cls, df):
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        buffer = sink.getvalue()
+        segment = shared_memory.SharedMemory(create=True, size=max(buffer.size, 1))
+        view = np.frombuffer(segment.buf, dtype=np.uint8)
+        view[: buffer.size] = np.frombuffer(buffer, dtype=np.uint8)
+        del view
+        segment.close()
+        return cls(segment.name, buffer.size)
+
+    def read(self):
+        segment = shared_memory.SharedMemory(name=self.name)
+        try:
+            buffer = pa.py_buffer(segment.buf)[: self.size]
+            table = pa.ipc.open_stream(buffer).read_all()
+            # columns may still point into the segment, which is about to
+            # be unmapped
+            df = table.to_pandas().copy()
+            del table, buffer
+        finally:
+            segment.close()
+        categoricals = [c for c in df if isinstance(df[c].dtype, pd.CategoricalDtype)]
+        return identifiers.encode_columns(df, categoricals)
+
+    def unlink(self):
+        segment = shared_memory.SharedMemory(name=self.name)
+        segment.close()
+        segment.unlink()
+
+
+def _process_shard(swaps, events, amounts, prices, return_events=False):
+    # fees_report_v3 imports this module, so import it lazily
+    from fees_reporting.fees_report_v3 import process_joins, process_swaps
+
+    prices_df = prices.read()
+    swaps_df = swaps.read() if swaps is not None else pd.DataFrame()
+    joins = (
+        JoinExits(events.read(), amounts.read()) if events is not None else JoinExits()
+    )
+    swaps_df = process_swaps(swaps_df, prices_df)
+    joins = process_joins(joins, prices_df)
+    partial = aggregate_fees(swaps_df, joins)
+    return (partial, swaps_df, joins) if return_events else partial
+
+
+def _concat_processed(frames):
+    """
+    Concatenates processed frames of several workers, re-encoding their
+    categoricals, which come back over each worker's own dictionary.
+    """
+    frames = [frame for frame in frames if not frame.empty]
+    if not frames:
+        return pd.DataFrame()
+    categoricals = {
+        column
+        for frame in frames
+        for column in frame
+        if isinstance(frame[column].dtype, pd.CategoricalDtype)
+    }
+    for frame in frames:
+        for column in categoricals & set(frame):
+            frame[column] = frame[column].astype(object)
+    df = pd.concat(frames, ignore_index=True)
+    df = df.sort_values("timestamp", kind="stable", ignore_index=True)
+    return identifiers.encode_columns(df, sorted(categoricals))
+
+
+def _shard_codes(df, key, shards):
+    return identifiers.categorical(df[key]).codes % shards
+
+
+def shard_events(swaps_df, joins_df, shards, shard_by="pool"):
+    """
+    Splits swaps and joinExits into ``shards`` groups, keeping every pool (or
+    chain) in a single group.
+    """
+    key = SHARD_KEYS[shard_by]
+    swap_shards = (
+        _shard_codes(swaps_df, key, shards) if not swaps_df.empty else np.array([])
+    )
+    join_shards = (
+        _shard_codes(joins_df.events, key, shards)
+        if not joins_df.empty
+        else np.array([])
+    )
+    for shard in range(shards):
+        swaps = swaps_df[swap_shards == shard] if len(swap_shards) else swaps_df
+        joins = (
+            joins_df.take(np.flatnonzero(join_shards == shard))
+            if len(join_shards)
+            else joins_df
+        )
+        if not (swaps.empty and joins.empty):
+            yield swaps.reset_index(drop=True), joins
+
+
+async def process_in_workers(
+    swaps_df,
+    joins_df,
+    df,
+    executor=None,
+    workers=WORKERS,
+    shard_by="pool",
+    return_events=False,
+):
+    """
+    Runs the CPU-bound processing and aggregation of events in a process
+    pool, one shard of pools (or chains) per task, and merges the partial
+    aggregates into one ``per_cycle`` frame.
+
+    :param swaps_df: Swaps, as returned by ``generate_reports``
+    :param joins_df: JoinExits, as returned by ``generate_reports``
+    :param df: The token prices of the events
+    :param executor: A ProcessPoolExecutor to reuse, optional
+    :param workers: The number of shards, and of processes when no executor is given
+    :param shard_by: Either "pool" or "chain"
+    :param return_events: Whether to also send the processed swaps and joins
+        back from the workers
+    :return: The ``per_cycle`` frame, or with ``return_events`` the
+        (``per_cycle``, swaps, joins) frames
+    """
+    loop = asyncio.get_running_loop()
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(max_workers=workers)
+    frames = [SharedFrame.create(df)]
+    try:
+        tasks = []
+        for swaps, joins in shard_events(swaps_df, joins_df, workers, shard_by):
+            handles = [None, None, None]
+            if not swaps.empty:
+                handles[0] = SharedFrame.create(swaps)
+            if not joins.empty:
+                handles[1] = SharedFrame.create(joins.events)
+                handles[2] = SharedFrame.create(joins.amounts)
+            frames.extend(handle for handle in handles if handle is not None)
+            tasks.append(
+                loop.run_in_executor(
+                    executor, _process_shard, *handles, frames[0], return_events
+                )
+            )
+        partials = await asyncio.gather(*tasks)
+    finally:
+        for frame in frames:
+            frame.unlink()
+        if own_executor:
+            executor.shutdown(wait=False)
+    if not return_events:
+        return merge_partials(partials)
+    return (
+        merge_partials([partial for partial, _, _ in partials]),
+        _concat_processed([swaps for _, swaps, _ in partials]),
+        _concat_processed([joins for _, _, joins in partials]),
+    )
@@ -0,0 +1,242 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from balpy_v2.lib.metrics import metrics
+from fees_reporting.aggregation import aggregate_fees, merge_partials
+from fees_reporting.cycle import generate_cycles_until_now
+from fees_reporting.event_store import event_store
+from fees_reporting.fees_report_v2 import load_pool_events, prepare_pool_events
+from fees_reporting.fees_report_v3 import (
+    get_prices,
+    normalize_event_tokens,
+    process_joins,
+    process_swaps,
+    store_aggregates,
+)
+from fees_reporting.join_exits import JoinExits
+from fees_reporting.parallel import process_in_workers
+
+QUEUE_SIZE = 8
+FETCH_WORKERS = 8
+PRICE_WORKERS = 4
+PRICE_BATCH = 8
+
+DONE = object()
+
+
+async def _produce(items, outbox):
+    for item in items:
+        await outbox.put(item)
+    await outbox.put(DONE)
+
+
+async def _run_stage(func, inbox, outbox, workers=1, batch_size=None):
+    """
+    Applies ``func`` to every item of ``inbox`` with ``workers`` concurrent
+    workers, forwarding non-empty results to ``outbox``.
+
+    Queues are bounded, so a slow stage holds back the ones feeding it instead
+    of letting their output pile up in memory. Workers are tasks named after
+    the stage, so profiles tell them apart.
+
+    With ``batch_size``, ``func`` is called with a list of up to that many
+    items, those already waiting when a worker takes the first one, and
+    returns a list of results.
+    """
+
+    async def take():
+        item = await inbox.get()
+        if item is DONE:
+            # let sibling workers see the end of the stream too
+            await inbox.put(DONE)
+            return None
+        if batch_size is None:
+            return item
+        batch = [item]
+        while len(batch) < batch_size and not inbox.empty():
+            item = inbox.get_nowait()
+            if item is DONE:
+                await inbox.put(DONE)
+                break
+            batch.append(item)
+        return batch
+
+    async def work():
+        while (item := await take()) is not None:
+            result = await func(item)
+            results = result if batch_size is not None else [result]
+            for result in results:
+                if result is not None:
+                    await outbox.put(result)
+
+    await asyncio.gather(
+        *[
+            asyncio.create_task(work(), name=f"{func.__name__}-{i}")
+            for i in range(workers)
+        ]
+    )
+    await outbox.put(DONE)
+
+
+async def _collect(inbox, results):
+    while (item := await inbox.get()) is not DONE:
+        results.append(item)
+
+
+async def stream_analyze_pool(
+    pool_ids_chains,
+    cycles=None,
+    aggregate_store=None,
+    store=event_store,
+    queue_size=QUEUE_SIZE,
+    fetch_workers=FETCH_WORKERS,
+    price_workers=PRICE_WORKERS,
+    price_batch=PRICE_BATCH,
+    workers=None,
+    checkpoint=None,
+    on_unit=None,
+    units=None,
+):
+    """
+    Computes the same ``per_cycle`` frame as ``analyze_pool`` in bounded
+    memory.
+
+    Every (pool, cycle) partition flows through fetch, encode, price attach
+    and partial aggregation stages connected by bounded queues, so early
+    partitions are priced while later ones are still being fetched and only
+    small per-partition aggregates are kept until the final merge.
+
+    :param pool_ids_chains: A list of (pool id, Chain) pairs
+    :param cycles: The cycles to analyze, all cycles until now by default
+    :param aggregate_store: A FeeAggregateStore to upsert the result into, optional
+    :param queue_size: The number of partitions buffered between two stages
+    :param fetch_workers: The number of partitions fetched concurrently
+    :param price_workers: The number of price requests made concurrently
+    :param price_batch: The most partitions priced by a single request; the
+        partitions already encoded when a request starts share it
+    :param workers: The number of processes partitions are processed and
+        aggregated in, in the event loop thread by default
+    :param checkpoint: A ReportCheckpoint; its completed partitions are read
+        back instead of being recomputed, and new ones are recorded as they finish
+    :param on_unit: Called with every finished partition and its number of
+        events, e.g. to report progress
+    :param units: The ((pool id, Chain), Cycle) partitions to analyze, instead
+        of every pool in every cycle
+    :return: The ``per_cycle`` frame
+    """
+    if units is None:
+        cycles = cycles or generate_cycles_until_now()
+        units = [
+            (pool_id_chain, cycle)
+            for cycle in cycles
+            for pool_id_chain in pool_ids_chains
+        ]
+    pending, done = units, []
+    if checkpoint is not None:
+        pending, done = [], []
+        for unit in units:
+            (done if checkpoint.is_complete(*unit) else pending).append(unit)
+
+    async def fetch(unit):
+        pool_id_chain, cycle = unit
+        with metrics.wall_time("fetch"):
+            events = await load_pool_events(pool_id_chain, [cycle], store)
+        swaps_df, join_exits_df, _ = events
+        metrics.rows("fetch", len(swaps_df) + len(join_exits_df))
+        return unit, events
+
+    async def encode(item):
+        unit, events = item
+        with metrics.stage("encode"):
+            swaps_df, joins_df = prepare_pool_events(unit[0], *events)
+        metrics.rows("encode", len(swaps_df) + len(joins_df))
+        return unit, swaps_df, joins_df
+
+    async def attach_prices(items):
+        priced = [item for item in items if not (item[1].empty and item[2].empty)]
+        if not priced:
+            return [
+                (unit, swaps_df, joins_df, None) for unit, swaps_df, joins_df in items
+            ]
+        # one price request for every partition of the batch
+        for _, swaps_df, joins_df in priced:
+            normalize_event_tokens(swaps_df, joins_df)
+        swaps = [swaps_df for _, swaps_df, _ in priced if not swaps_df.empty]
+        with metrics.wall_time("attach_prices"):
+            df = await get_prices(
+                pd.concat(swaps, ignore_index=True) if swaps else pd.DataFrame(),
+                JoinExits.concat([joins_df for _, _, joins_df in priced]),
+                normalized=True,
+            )
+        metrics.rows("attach_prices", len(df))
+        return [
+            (
+                unit,
+                swaps_df,
+                joins_df,
+                None if swaps_df.empty and joins_df.empty else df,
+            )
+            for unit, swaps_df, joins_df in items
+        ]
+
+    async def aggregate(item):
+        unit, swaps_df, joins_df, df = item
+        rows = len(swaps_df) + len(joins_df)
+        if df is None:
+            return unit, rows, merge_partials([])
+        if executor is not None:
+            return (
+                unit,
+                rows,
+                await process_in_workers(
+                    swaps_df, joins_df, df, executor=executor, workers=1
+                ),
+            )
+        with metrics.stage("aggregate"):
+            partial = aggregate_fees(
+                process_swaps(swaps_df, df), process_joins(joins_df, df)
+            )
+        metrics.rows("aggregate", len(partial))
+        return unit, rows, partial
+
+    async def record(item):
+        unit, rows, partial = item
+        if checkpoint is not None:
+            with metrics.stage("record"):
+                checkpoint.write(*unit, partial)
+        if on_unit is not None:
+            on_unit(unit, rows)
+        return None if partial.empty else partial
+
+    queues = [asyncio.Queue(maxsize=queue_size) for _ in range(6)]
+    partials = []
+    executor = ProcessPoolExecutor(max_workers=workers) if workers else None
+    logging.info(
+        f"Streaming {len(pending)} partitions, {len(done)} already complete..."
+    )
+    try:
+        async with asyncio.TaskGroup() as group:
+            group.create_task(_produce(pending, queues[0]))
+            group.create_task(_run_stage(fetch, queues[0], queues[1], fetch_workers))
+            group.create_task(_run_stage(encode, queues[1], queues[2]))
+            group.create_task(
+                _run_stage(
+                    attach_prices, queues[2], queues[3], price_workers, price_batch
+                )
+            )
+            group.create_task(_run_stage(aggregate, queues[3], queues[4], workers or 1))
+            group.create_task(_run_stage(record, queues[4], queues[5]))
+            group.create_task(_collect(queues[5], partials))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if done:
+        partials.append(checkpoint.load(done))
+    per_cycle = merge_partials(partials)
+    if aggregate_store is not None:
+        store_aggregates(aggregate_store, per_cycle, units)
+    return per_cycle
@@ -0,0 +1,208 @@
+import json
+import logging
+import os
+import shutil
+import time
+from collections import Counter
+
+from balpy_v2.lib import Chain
+from balpy_v2.lib.llama.coins import LLAMA_CHAIN_PREFIX_MAP
+from balpy_v2.lib.metrics import metrics
+from balpy_v2.lib.profiling import Profiler
+from fees_reporting.checkpoint import ReportCheckpoint
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.estimate import (
+    combine_estimates,
+    escalated_units,
+    snapshot_estimates,
+)
+from fees_reporting.event_store import event_store
+from fees_reporting.fees_report_v2 import BALANCER_MAINNET_SUBGRAPH_URL_MAP
+from fees_reporting.pipeline import stream_analyze_pool
+
+OUTPUT_FORMATS = ["parquet", "csv"]
+CHECKPOINT_DIR_NAME = "checkpoint"
+METRICS_FILE_NAME = "metrics.json"
+PROGRESS_INTERVAL = 5
+
+
+def pools_from_gauges(path, chains=None):
+    """
+    Reads the (pool id, Chain) pairs of a gauges file, as exported by the
+    Balancer API, keeping the first gauge of every pool.
+
+    Gauges of networks fees can't be reported on (no Balancer subgraph or
+    Llama prices, e.g. testnets) are dropped with a warning.
+
+    :param path: The path of the JSON file
+    :param chains: The Chains to keep, all by default
+    """
+    with open(path) as f:
+        gauges = json.load(f)
+    pools = {}
+    unsupported = Counter()
+    for gauge in gauges:
+        try:
+            chain = Chain(gauge["network"])
+        except ValueError:
+            chain = None
+        if not is_supported_chain(chain):
+            unsupported[gauge["network"]] += 1
+        elif not chains or chain in chains:
+            pools.setdefault((gauge["pool"]["id"], chain), None)
+    for network, count in unsupported.items():
+        logging.warning(f"Skipping {count} gauges of unsupported network {network}")
+    return list(pools)
+
+
+def is_supported_chain(chain):
+    """
+    Tells whether fees can be reported on a Chain.
+    """
+    return (
+        chain in BALANCER_MAINNET_SUBGRAPH_URL_MAP and chain in LLAMA_CHAIN_PREFIX_MAP
+    )
+
+
+def parse_pool(value, default_chain=Chain.mainnet):
+    """
+    Parses a pool given as ``<pool id>`` or ``<chain>:<pool id>``.
+    """
+    chain_name, _, pool_id = value.rpartition(":")
+    return pool_id, Chain[chain_name] if chain_name else default_chain
+
+
+def select_cycles(start=None, end=None):
+    """
+    Returns cycles ``start..end`` (inclusive, numbered from 1) of the calendar.
+    """
+    return get_cycle_calendar().cycles[(start or 1) - 1 : end]
+
+
+class Progress:
+    """
+    Reports completed (pool, cycle) units and event throughput, at most once
+    every ``interval`` seconds and when the last unit completes.
+
+    :ivar total: The number of units still to process.
+    :ivar echo: Called with every progress line.
+    """
+
+    def __init__(self, total, echo=logging.info, interval=PROGRESS_INTERVAL):
+        self.total = total
+        self.echo = echo
+        self.interval = interval
+        self.units = 0
+        self.rows = 0
+        self.started = time.monotonic()
+        self._reported = self.started
+
+    def __call__(self, unit, rows):
+        self.units += 1
+        self.rows += rows
+        now = time.monotonic()
+        if self.units == self.total or now - self._reported >= self.interval:
+            self._reported = now
+            self.echo(self.line(now))
+
+    def line(self, now=None):
+        elapsed = max((now or time.monotonic()) - self.started, 1e-9)
+        return (
+            f"{self.units}/{self.total} units, {self.rows} events, "
+            f"{self.units / elapsed:.2f} units/s, {self.rows / elapsed:.0f} events/s"
+        )
+
+
+def write_report(per_cycle, pool_ids_chains, output_dir, output_format="parquet"):
+    """
+    Writes a ``per_cycle`` frame, with a chain column, as ``fees.<format>``.
+
+    :return: The path written to
+    """
+    chains = {pool_id: chain.name for pool_id, chain in pool_ids_chains}
+    rows = per_cycle.reset_index()
+    rows.insert(1, "chain", rows["poolId"].map(chains))
+    os.makedirs(output_dir, exist_ok=True)
+    path = os.path.join(output_dir, f"fees.{output_format}")
+    if output_format == "csv":
+        rows.to_csv(path, index=False)
+    else:
+        rows.to_parquet(path, index=False)
+    return path
+
+
+async def run_report(
+    pool_ids_chains,
+    cycles,
+    output_dir,
+    output_format="parquet",
+    jobs=None,
+    store=event_store,
+    aggregate_store=None,
+    restart=False,
+    aggregate_first=False,
+    echo=logging.info,
+    profile_dir=None,
+):
+    """
+    Runs the fees pipeline over every (pool, cycle) unit and writes the
+    ``per_cycle`` report, checkpointing finished units under ``output_dir``
+    so a rerun with the same output directory resumes where it stopped.
+    A summary of the run's metrics is written next to the report.
+
+    :param pool_ids_chains: A list of (pool id, Chain) pairs
+    :param cycles: The cycles to report on
+    :param output_dir: The directory of the report and its checkpoint
+    :param output_format: Either "parquet" or "csv"
+    :param jobs: The number of processes to aggregate in, optional
+    :param store: The EventStore raw events are cached in
+    :param aggregate_store: A FeeAggregateStore to upsert the result into, optional
+    :param restart: Whether to discard the checkpoint of a previous run
+    :param aggregate_first: Whether to estimate per-pool totals from subgraph
+        snapshots, only analyzing the events of units failing their checks.
+        The report then has one row per cycle and pool rather than per token:
+        cycle, chain, poolId, swapFeeUSD, joinExitFeeUSD, totalUSD and the
+        ``source`` of the row, "snapshot" or "events"
+    :param echo: Called with progress lines
+    :param profile_dir: A directory to write a sampling profile of the run to,
+        with collapsed stacks and a hotspot summary, optional
+    :return: The path of the report
+    """
+    profiler = Profiler().start() if profile_dir else None
+    try:
+        checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIR_NAME)
+        if restart and os.path.isdir(checkpoint_dir):
+            shutil.rmtree(checkpoint_dir)
+        checkpoint = ReportCheckpoint(checkpoint_dir)
+
+        units = [
+            (pool_id_chain, cycle)
+            for cycle in cycles
+            for pool_id_chain in pool_ids_chains
+        ]
+        if aggregate_first:
+            deltas = await snapshot_estimates(pool_ids_chains, cycles)
+            total, units = len(units), escalated_units(deltas, pool_ids_chains, cycles)
+            echo(f"{total - len(units)} of {total} units estimated from snapshots")
+        pending = len(units) - sum(checkpoint.is_complete(*unit) for unit in units)
+        echo(f"{len(units)} units, {len(units) - pending} already complete")
+        progress = Progress(pending, echo)
+
+        per_cycle = await stream_analyze_pool(
+            pool_ids_chains,
+            aggregate_store=aggregate_store,
+            store=store,
+            workers=jobs,
+            checkpoint=checkpoint,
+            on_unit=progress,
+            units=units,
+        )
+        if aggregate_first:
+            per_cycle = combine_estimates(deltas, per_cycle)
+        path = write_report(per_cycle, pool_ids_chains, output_dir, output_format)
+        metrics.write_summary(os.path.join(output_dir, METRICS_FILE_NAME))
+    finally:
+        if profiler is not None:
+            profiler.stop()
+            profiler.write(profile_dir)
+    return path
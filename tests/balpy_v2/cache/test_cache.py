@@ -0,0 +1,71 @@
+import asyncio
+
+import pandas as pd
+import pytest
+
+from balpy_v2.cache.memoize import Cache
+from balpy_v2.cache.backends import DiskBackend, MemoryBackend
+from balpy_v2.cache.keys import fingerprint
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_task():
+    memory = Cache(MemoryBackend())
+    calls = []
+
+    @memory.cache
+    async def fetch(x):
+        calls.append(x)
+        await asyncio.sleep(0.01)
+        return x * 2
+
+    results = await asyncio.gather(fetch(1), fetch(1), fetch(x=1), fetch(2))
+
+    assert results == [2, 2, 2, 4]
+    assert calls == [1, 2]
+    assert await fetch(1) == 2
+    assert calls == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_failed_calls_are_not_cached():
+    memory = Cache(MemoryBackend())
+    attempts = []
+
+    @memory.cache
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("boom")
+        return "ok"
+
+    with pytest.raises(ValueError):
+        await flaky()
+    assert await flaky() == "ok"
+
+
+def test_disk_backend_persists_sync_results(tmp_path):
+    calls = []
+
+    def build():
+        @Cache(DiskBackend(str(tmp_path))).cache
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        return square
+
+    assert build()(3) == 9
+    assert build()(3) == 9
+    assert calls == [3]
+
+    build().cache_clear()
+    assert build()(3) == 9
+    assert calls == [3, 3]
+
+
+def test_dataframes_are_fingerprinted_by_content():
+    df = pd.DataFrame({"token": ["0xa", "0xb"], "amount": [1.0, 2.0]})
+
+    assert fingerprint(df) == fingerprint(df.copy())
+    assert fingerprint(df) != fingerprint(df.assign(amount=[1.0, 3.0]))
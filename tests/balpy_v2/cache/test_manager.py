@@ -0,0 +1,50 @@
+import os
+import time
+
+from balpy_v2.cache.backends import MISSING, MemoryBackend
+from balpy_v2.cache.manager import CacheManager
+
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    backend.get("a")
+    backend.set("c", 3)
+
+    assert backend.get("b") is MISSING
+    assert backend.get("a") == 1
+    assert backend.stats.evictions == 1
+
+
+def test_memory_backend_expires_entries_after_ttl():
+    backend = MemoryBackend(ttl=60)
+    backend.set("a", 1)
+    backend._store["a"] = (1, 0, time.time() - 120)
+
+    assert backend.get("a") is MISSING
+
+
+def test_disk_namespace_budget_stats_and_prune(tmp_path):
+    manager = CacheManager(str(tmp_path))
+    prices = manager.namespace("prices", max_entries=2)
+    calls = []
+
+    @prices.cache
+    def price(token):
+        calls.append(token)
+        return 1.0
+
+    for token in ["0xa", "0xb", "0xc", "0xc"]:
+        price(token)
+
+    stats = manager.stats()["prices"]
+    assert calls == ["0xa", "0xb", "0xc"]
+    assert stats["entries"] == 2
+    assert stats["hits"] == 1 and stats["misses"] == 3
+
+    manager.flush_stats()
+    assert CacheManager(str(tmp_path)).stats()["prices"]["hits"] == 1
+
+    assert manager.prune("prices", max_entries=0) == {"prices": 2}
+    assert not any(f.endswith(".pkl") for _, _, fs in os.walk(tmp_path) for f in fs)
@@ -0,0 +1,42 @@
+import json
+import os
+
+from balpy_v2.cli.completion import CompletionIndex
+
+VAULT = "0xBA12222222228d8Ba445958a75a0704d566BF2C8"
+
+
+def write_json(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump(data, f)
+
+
+def test_index_lists_contracts_and_functions(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    deployments = os.path.join("balpy_v2", "deployments")
+    write_json(
+        os.path.join(deployments, "addresses", "mainnet.json"),
+        {VAULT: {"name": "Vault", "task": "20210418-vault"}},
+    )
+    write_json(
+        os.path.join(deployments, "tasks", "20210418-vault", "artifact", "Vault.json"),
+        {
+            "abi": [
+                {"type": "function", "name": "getPool"},
+                {"type": "event", "name": "Swap"},
+                {"type": "function", "name": "WETH"},
+            ]
+        },
+    )
+    path = str(tmp_path / "index.json")
+
+    index = CompletionIndex(path)
+
+    assert index.contract_names("mainnet") == ["Vault"]
+    assert index.function_names("mainnet", VAULT.lower()) == ["WETH", "getPool"]
+    # served from disk by the next process
+    assert CompletionIndex(path).index["mainnet"]["contracts"] == {
+        "Vault": ["WETH", "getPool"]
+    }
+    assert index.function_names("polygon", "vault") == []
@@ -0,0 +1,78 @@
+import asyncio
+import json
+
+import pytest
+
+from balpy_v2.contracts import multicall
+from balpy_v2.contracts.multicall import CallSpec, run_batch
+
+
+async def _collect_lines(lines):
+    return [json.loads(line) async for line in lines]
+
+
+@pytest.mark.asyncio
+async def test_run_batch_groups_calls_and_keeps_input_order(monkeypatch):
+    batches = []
+
+    async def fake_multicall(chain, functions, block="latest"):
+        batches.append((chain.name, block, functions))
+        # later blocks answer first
+        await asyncio.sleep(0.01 if block == "latest" else 0)
+        return [
+            dict(error="execution reverted") if f == "bad" else dict(result=b"\x01")
+            for f in functions
+        ]
+
+    monkeypatch.setattr(multicall, "multicall", fake_multicall)
+    monkeypatch.setattr(CallSpec, "contract_function", lambda self: self.function)
+    specs = [
+        CallSpec.from_json(line)
+        for line in [
+            '{"contract": "Vault", "function": "WETH"}',
+            '{"contract": "Vault", "function": "bad", "block": 1}',
+            '{"chain": "polygon", "contract": "Vault", "function": "WETH"}',
+            '{"contract": "Vault", "function": "getPool", "args": ["0x01"]}',
+        ]
+    ]
+
+    results = [json.loads(line) async for line in run_batch(specs, batch_size=1)]
+
+    assert [r["function"] for r in results] == ["WETH", "bad", "WETH", "getPool"]
+    assert results[0] == dict(
+        chain="mainnet",
+        contract="Vault",
+        function="WETH",
+        args=[],
+        block="latest",
+        result="0x01",
+    )
+    assert results[1]["error"] == "execution reverted" and "result" not in results[1]
+    assert results[3]["args"] == ["0x01"]
+    assert len(batches) == 4
+
+
+@pytest.mark.asyncio
+async def test_run_batch_reports_failed_batches_instead_of_hanging(monkeypatch):
+    async def fake_multicall(chain, functions, block="latest"):
+        if chain.name == "polygon":
+            raise ConnectionError("no provider")
+        return [dict(result=b"\x01") for _ in functions]
+
+    monkeypatch.setattr(multicall, "multicall", fake_multicall)
+    monkeypatch.setattr(CallSpec, "contract_function", lambda self: self.function)
+    specs = [
+        CallSpec.from_json(line)
+        for line in [
+            '{"chain": "polygon", "contract": "Vault", "function": "WETH"}',
+            '{"chain": "polygon", "contract": "Vault", "function": "getPool"}',
+            '{"contract": "Vault", "function": "WETH"}',
+        ]
+    ]
+
+    results = await asyncio.wait_for(
+        _collect_lines(run_batch(specs, batch_size=2)), timeout=1
+    )
+
+    assert [r.get("error") for r in results] == ["no provider", "no provider", None]
+    assert results[2]["result"] == "0x01"
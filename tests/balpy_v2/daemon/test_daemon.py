@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pandas as pd
+import pytest
+
+from balpy_v2.contracts import multicall
+from balpy_v2.contracts.multicall import CallSpec
+from balpy_v2.daemon.client import get_daemon_client
+from balpy_v2.daemon.server import Daemon
+from fees_reporting import aggregate_store as aggregate_store_module
+from fees_reporting.aggregate_store import FeeAggregateStore
+
+
+@pytest.mark.asyncio
+async def test_daemon_answers_calls_and_fee_queries(tmp_path, monkeypatch):
+    async def fake_multicall(chain, functions, block="latest"):
+        return [dict(result=function) for function in functions]
+
+    monkeypatch.setattr(multicall, "multicall", fake_multicall)
+    monkeypatch.setattr(CallSpec, "contract_function", lambda self: self.function)
+    store = FeeAggregateStore(str(tmp_path / "aggregates"))
+    monkeypatch.setattr(aggregate_store_module, "aggregate_store", store)
+    socket_path = str(tmp_path / "balpy.sock")
+
+    assert await get_daemon_client(socket_path) is None
+    server = asyncio.create_task(Daemon().serve(socket_path))
+    while (client := await get_daemon_client(socket_path)) is None:
+        await asyncio.sleep(0.01)
+    try:
+        lines = await client.batch(
+            [
+                json.dumps(dict(contract="Vault", function="WETH")),
+                json.dumps(dict(contract="Vault", function="getPool")),
+            ]
+        )
+        assert [json.loads(line)["result"] for line in lines] == ["WETH", "getPool"]
+
+        assert await client.fees() == []
+        # an upsert from another process is picked up
+        FeeAggregateStore(store.root).upsert(
+            pd.DataFrame(
+                dict(cycle=[1], chain=["mainnet"], poolId=["0xpool"], token=["t"])
+            ).assign(swapFeeUSD=2.0)
+        )
+        assert await client.fees(by="chain") == [
+            dict(
+                chain="mainnet",
+                swapFeeUSD=2.0,
+                swapFeeTokenAmount=0.0,
+                joinExitFeeUSD=0.0,
+                joinExitFeeTokenAmount=0.0,
+                totalUSD=0.0,
+                totalToken=0.0,
+            )
+        ]
+        with pytest.raises(RuntimeError, match="Unknown grouping"):
+            await client.fees(by="token")
+    finally:
+        await client.aclose()
+        server.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await server
@@ -0,0 +1,43 @@
+from balpy_v2.lib import Chain
+from balpy_v2.lib.llama.coins import CoinKeyIndex
+
+
+def test_key_is_chain_prefixed_and_lowercased():
+    index = CoinKeyIndex()
+
+    assert index.key(Chain.mainnet, "0xABC") == "ethereum:0xabc"
+    assert index.key("gnosis", "0xabc") == "xdai:0xabc"
+    assert index.key(Chain.polygon, "coingecko:usd-coin") == "coingecko:usd-coin"
+
+
+def test_record_responses_marks_unpriced_coins_missing_in_their_range(tmp_path):
+    path = tmp_path / "coins.json"
+    index = CoinKeyIndex(path)
+    responses = [
+        {"coins": {"ethereum:0xa": {"prices": [{"timestamp": 1, "price": 1.0}]}}},
+        {"coins": {"ethereum:0xb": {"prices": []}}},
+    ]
+
+    missing = index.record_responses(
+        {"ethereum:0xa": [1], "ethereum:0xb": [1, 5], "ethereum:0xc": [3]},
+        responses,
+        now=100,
+    )
+
+    assert missing == {"ethereum:0xb", "ethereum:0xc"}
+    # a coin not listed yet is still asked for at later timestamps
+    assert index.without_missing(
+        {"ethereum:0xa": [1], "ethereum:0xb": [2, 6], "ethereum:0xc": [3]}, now=100
+    ) == {"ethereum:0xa": [1], "ethereum:0xb": [6]}
+    assert CoinKeyIndex(path).is_missing("ethereum:0xc", 3, now=100)
+    assert not CoinKeyIndex(path).is_missing("ethereum:0xc", 4, now=100)
+
+
+def test_missing_ranges_expire():
+    index = CoinKeyIndex(ttl=10)
+    index.record_responses({"ethereum:0xb": [1]}, [], now=100)
+
+    assert index.without_missing({"ethereum:0xb": [1]}, now=105) == {}
+    assert index.without_missing({"ethereum:0xb": [1]}, now=111) == {
+        "ethereum:0xb": [1]
+    }
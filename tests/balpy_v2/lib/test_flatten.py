@@ -0,0 +1,30 @@
+from balpy_v2.lib import flatten_json, flatten_records
+
+
+def test_flatten_records_matches_flatten_json_columns():
+    records = [
+        {"id": "a", "token": {"latestUSDPrice": "1"}, "pool": {"id": "p"}},
+        {"id": "b", "token": {"latestUSDPrice": "2"}, "pool": {"id": "q"}},
+    ]
+
+    columns = flatten_records(records)
+
+    assert columns == {
+        key: [flatten_json(record)[key] for record in records]
+        for key in flatten_json(records[0])
+    }
+
+
+def test_missing_and_optional_paths_are_none():
+    records = [
+        {"id": "a", "pool": None, "tokensList": ["0x1"]},
+        {"id": "b", "pool": {"id": "p", "meta": {"symbol": "P"}}},
+        {"id": "c"},
+    ]
+
+    assert flatten_records(records, sep=".") == {
+        "id": ["a", "b", "c"],
+        "pool.id": [None, "p", None],
+        "pool.meta.symbol": [None, "P", None],
+        "tokensList": [["0x1"], None, None],
+    }
@@ -0,0 +1,130 @@
+import asyncio
+
+import httpx
+import pytest
+
+from balpy_v2.cache import cache_manager
+from balpy_v2.lib import Chain
+from balpy_v2.lib import metrics as metrics_module
+from balpy_v2.lib.metrics import (
+    MetricsRegistry,
+    cache_gauges,
+    http_client,
+    rpc_middleware,
+)
+from fees_reporting import llama
+
+
+def test_summary_and_prometheus_agree():
+    registry = MetricsRegistry()
+    registry.inc("http_requests", host="a.io")
+    registry.inc("http_requests", 2, host="a.io")
+    registry.observe("http_request_seconds", 0.2, host="a.io")
+    registry.observe("http_request_seconds", 40, host="a.io")
+    with registry.stage("encode"):
+        registry.rows("encode", 10)
+    registry.collectors.append(lambda: dict(cache_hit_ratio=[(dict(ns="x"), 0.5)]))
+
+    summary = registry.summary()
+    assert summary["counters"]["http_requests"] == [dict(host="a.io", value=3)]
+    assert summary["counters"]["stage_rows"] == [dict(stage="encode", value=10)]
+    assert summary["counters"]["stage_calls"] == [dict(stage="encode", value=1)]
+    (latency,) = summary["histograms"]["http_request_seconds"]
+    assert latency["count"] == 2
+    assert latency["buckets"]["0.25"] == 1
+    assert latency["buckets"]["+Inf"] == 2
+    assert summary["gauges"]["cache_hit_ratio"] == [dict(ns="x", value=0.5)]
+
+    text = registry.prometheus()
+    assert 'balpy_http_requests_total{host="a.io"} 3' in text
+    assert 'balpy_http_request_seconds_bucket{host="a.io",le="0.25"} 1' in text
+    assert 'balpy_http_request_seconds_count{host="a.io"} 2' in text
+    assert 'balpy_cache_hit_ratio{ns="x"} 0.5' in text
+
+
+def test_cache_gauges_read_namespace_stats():
+    backend = cache_manager.backend("test_metrics_gauges", disk=False)
+    backend.stats.hits, backend.stats.misses = 3, 1
+
+    gauges = cache_gauges()
+
+    assert (dict(namespace="test_metrics_gauges"), 0.75) in gauges["cache_hit_ratio"]
+
+
+@pytest.mark.asyncio
+async def test_http_client_records_requests_per_host(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "metrics", registry)
+
+    def respond(request):
+        if request.url.path == "/limited":
+            return httpx.Response(429)
+        return httpx.Response(200, content=b"12345")
+
+    async with http_client(transport=httpx.MockTransport(respond)) as client:
+        await client.get("https://coins.llama.fi/prices")
+        await client.get("https://coins.llama.fi/limited")
+
+    counters = registry.summary()["counters"]
+    assert counters["http_requests"] == [dict(host="coins.llama.fi", value=2)]
+    assert counters["http_bytes_in"] == [dict(host="coins.llama.fi", value=5)]
+    assert counters["http_rate_limited"] == [dict(host="coins.llama.fi", value=1)]
+    (latency,) = registry.summary()["histograms"]["http_request_seconds"]
+    assert latency["count"] == 2
+
+
+@pytest.mark.asyncio
+async def test_awaited_sections_record_wall_time_only():
+    registry = MetricsRegistry()
+
+    with registry.wall_time("fetch"):
+        await asyncio.sleep(0.01)
+
+    counters = registry.summary()["counters"]
+    (wall,) = counters["stage_wall_seconds"]
+    assert wall["stage"] == "fetch" and wall["value"] >= 0.01
+    assert counters["stage_calls"] == [dict(stage="fetch", value=1)]
+    assert "stage_cpu_seconds" not in counters
+    assert registry.active_stage is None
+
+
+@pytest.mark.asyncio
+async def test_rpc_middleware_records_requests_per_method(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "metrics", registry)
+
+    async def make_request(method, params):
+        if method == "eth_call":
+            return dict(error=dict(message="execution reverted"))
+        return dict(result="0x1")
+
+    middleware = await rpc_middleware(Chain.gnosis)(make_request, None)
+    await middleware("eth_blockNumber", [])
+    await middleware("eth_call", [])
+
+    counters = registry.summary()["counters"]
+    assert counters["rpc_requests"] == [
+        dict(chain="gnosis", method="eth_blockNumber", value=1),
+        dict(chain="gnosis", method="eth_call", value=1),
+    ]
+    assert counters["rpc_errors"] == [dict(chain="gnosis", method="eth_call", value=1)]
+
+
+@pytest.mark.asyncio
+async def test_llama_client_records_rate_limited_retries(monkeypatch):
+    registry = MetricsRegistry()
+    monkeypatch.setattr(metrics_module, "metrics", registry)
+    sleep = asyncio.sleep
+    monkeypatch.setattr(llama.asyncio, "sleep", lambda seconds: sleep(0))
+    responses = iter([429, 200])
+
+    def respond(request):
+        return httpx.Response(next(responses), json={}, headers={"Retry-After": "1"})
+
+    client = llama.LlamaAPIClient()
+    client.client = http_client(transport=httpx.MockTransport(respond))
+
+    assert await client._get("https://coins.llama.fi/batchHistorical") == {}
+    assert registry.summary()["counters"]["http_retries"] == [
+        dict(host="coins.llama.fi", value=1)
+    ]
@@ -0,0 +1,46 @@
+import asyncio
+import time
+
+import pytest
+
+from balpy_v2.lib.metrics import metrics
+from balpy_v2.lib.profiling import COLLAPSED_FILE_NAME, HOTSPOTS_FILE_NAME, Profiler
+
+
+def busy_allocating(seconds):
+    blocks = []
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        blocks.append(bytearray(1024))
+    return blocks
+
+
+@pytest.mark.asyncio
+async def test_samples_are_tagged_with_task_and_stage(tmp_path):
+    async def work():
+        with metrics.stage("busy"):
+            busy_allocating(0.2)
+
+    with Profiler(interval=0.001) as profiler:
+        await asyncio.create_task(work(), name="busy-0")
+
+    tags = {(task, stage) for task, stage, _ in profiler.samples}
+    assert ("busy-0", "busy") in tags
+    assert any(
+        frames[-1].startswith("busy_allocating")
+        for task, stage, frames in profiler.samples
+    )
+    assert profiler.stage_peaks["busy"] > 1024**2
+    assert metrics.listeners == []
+
+    collapsed, hotspots = profiler.write(str(tmp_path))
+    assert collapsed.endswith(COLLAPSED_FILE_NAME)
+    assert hotspots.endswith(HOTSPOTS_FILE_NAME)
+    with open(collapsed) as f:
+        line = f.readline()
+    stack, count = line.rsplit(" ", 1)
+    assert stack.startswith("busy-0;stage=busy;") and int(count) > 0
+    with open(hotspots) as f:
+        summary = f.read()
+    assert "busy_allocating" in summary
+    assert "busy / busy" in summary
@@ -0,0 +1,74 @@
+import pytest
+
+from balpy_v2.lib import Chain
+from balpy_v2.subgraphs import gauges
+from balpy_v2.subgraphs.gauges import GaugeUniverseCache
+
+
+def gauge(id, pool_id, killed=False, changed=0):
+    return dict(
+        id=id,
+        symbol=f"{id}-gauge",
+        poolId=pool_id,
+        poolAddress=pool_id and pool_id[:6],
+        isKilled=killed,
+        changed=changed,
+    )
+
+
+@pytest.mark.asyncio
+async def test_refresh_paginates_and_only_fetches_changes(tmp_path, monkeypatch):
+    subgraphs = {
+        Chain.mainnet: [gauge("0x1", "0xaa"), gauge("0x2", "0xbb"), gauge("0x3", None)],
+        Chain.gnosis: [gauge("0x4", "0xcc")],
+    }
+    head = {Chain.mainnet: 10, Chain.gnosis: 10}
+    requests = []
+
+    async def execute(self):
+        variables = self.variables
+        requests.append((self.chain, variables["lastId"], variables["block"]))
+        items = sorted(
+            (
+                item
+                for item in subgraphs[self.chain]
+                if item["id"] > variables["lastId"]
+                and item["changed"] >= variables["block"]
+            ),
+            key=lambda item: item["id"],
+        )
+        return dict(
+            _meta=dict(block=dict(number=head[self.chain])),
+            liquidityGauges=items[: variables["first"]],
+        )
+
+    monkeypatch.setattr(gauges.GaugesQuery, "execute", execute)
+    path = str(tmp_path / "universe.json")
+    chains = [Chain.mainnet, Chain.gnosis]
+
+    cache = GaugeUniverseCache(path, page_size=2)
+    await cache.refresh(chains)
+    assert sorted(requests, key=str) == sorted(
+        [(Chain.mainnet, "", 0), (Chain.mainnet, "0x2", 0), (Chain.gnosis, "", 0)],
+        key=str,
+    )
+    assert cache.universe(chains).pool_ids_chains() == [
+        ("0xaa", Chain.mainnet),
+        ("0xbb", Chain.mainnet),
+        ("0xcc", Chain.gnosis),
+    ]
+
+    # a killed gauge is picked up by the next, incremental, refresh
+    subgraphs[Chain.mainnet][1] = gauge("0x2", "0xbb", killed=True, changed=12)
+    head[Chain.mainnet] = 15
+    requests.clear()
+    cache = GaugeUniverseCache(path, page_size=2)
+    await cache.refresh(chains)
+
+    assert (Chain.mainnet, "", 10) in requests
+    universe = cache.universe(chains)
+    assert len(universe) == 4
+    assert universe.select([Chain.mainnet]).pool_ids_chains() == [
+        ("0xaa", Chain.mainnet)
+    ]
+    assert len(universe.select(include_killed=True).pool_ids_chains()) == 3
@@ -0,0 +1,121 @@
+import random
+
+import pandas as pd
+import pytest
+
+from balpy_v2.cache import cache_manager
+from balpy_v2.cache.backends import DiskBackend
+from balpy_v2.lib import Chain
+from fees_reporting import fees_report_v2, fees_report_v3
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.encoding import identifiers
+from fees_reporting.event_store import event_store
+
+TOKENS = ["0x" + f"{i:040x}" for i in range(1, 4)]
+POOLS = [
+    ("0x" + "1" * 64, Chain.mainnet),
+    ("0x" + "2" * 64, Chain.mainnet),
+    ("0x" + "9" * 64, Chain.gnosis),
+]
+
+
+def _amount(rng):
+    return f"{rng.randint(0, 1000)}.{rng.randint(0, 10**18 - 1):018d}"
+
+
+def _events(cycles, seed=0):
+    rng = random.Random(seed)
+    events = {}
+    for pool_id, _ in POOLS:
+        for cycle in cycles:
+            swaps = [
+                dict(
+                    # the first swap sits on the cycle boundary
+                    timestamp=cycle.start
+                    if k == 0
+                    else rng.randint(cycle.start, cycle.end - 1),
+                    tokenIn=rng.choice(TOKENS),
+                    tokenOut=rng.choice(TOKENS),
+                    tokenAmountIn=_amount(rng),
+                    tokenAmountOut=_amount(rng),
+                )
+                for k in range(rng.randint(3, 8))
+            ]
+            joins = [
+                dict(
+                    timestamp=rng.randint(cycle.start, cycle.end - 1),
+                    amounts=[_amount(rng) for _ in TOKENS],
+                    protocolFeeAmounts=[_amount(rng) for _ in TOKENS],
+                )
+                for _ in range(rng.randint(1, 4))
+            ]
+            events[(pool_id, cycle.start)] = dict(SWAPS_QUERY=swaps, JOINS_QUERY=joins)
+    return events
+
+
+@pytest.fixture
+def fee_events(monkeypatch, tmp_path):
+    """
+    Serves random swaps and joinExits of three pools over the first three
+    cycles, with stubbed token lists and prices, through an empty event store
+    and empty disk caches.
+
+    :return: The (pool id, Chain) pairs and the cycles
+    """
+    cycles = list(get_cycle_calendar())[:3]
+    events = _events(cycles)
+
+    async def get_paginated_data(query, pool_id_chain, after, before, *args, **kwargs):
+        return [dict(e) for e in events[(pool_id_chain[0], after + 1)][query]]
+
+    async def get_pool_tokens(pool_id_chain, block=None):
+        return TOKENS
+
+    async def batch_request(url, coins_dict, search_width=300, batch_size=50):
+        return [
+            {
+                "coins": {
+                    coin: {
+                        "prices": [
+                            {
+                                "timestamp": int(t) + 7,
+                                "price": 1.0 + int(coin[-1], 16) * 0.5,
+                                "confidence": 0.99,
+                            }
+                            for t in timestamps
+                        ]
+                    }
+                }
+            }
+            for coin, timestamps in coins_dict.items()
+        ]
+
+    monkeypatch.setattr(fees_report_v2, "get_paginated_data", get_paginated_data)
+    monkeypatch.setattr(fees_report_v2, "get_pool_tokens", get_pool_tokens)
+    monkeypatch.setattr(fees_report_v3, "batch_request", batch_request)
+    monkeypatch.setattr(event_store, "root", str(tmp_path / "events"))
+    monkeypatch.setattr(event_store, "completed", {})
+    monkeypatch.setattr(cache_manager, "directory", str(tmp_path / "cache"))
+    for name, backend in cache_manager.backends.items():
+        if isinstance(backend, DiskBackend):
+            monkeypatch.setattr(backend, "directory", str(tmp_path / "cache" / name))
+            monkeypatch.setattr(backend, "_nbytes", None)
+            monkeypatch.setattr(backend, "_nentries", None)
+    return POOLS, cycles
+
+
+def comparable(per_cycle):
+    """
+    Returns a ``per_cycle`` frame with plain index levels, in index order.
+    """
+    return identifiers.decode_index(per_cycle.copy()).sort_index()
+
+
+@pytest.fixture
+def assert_same_per_cycle():
+    def assert_same(left, right):
+        pd.testing.assert_frame_equal(
+            comparable(left), comparable(right), check_exact=False, rtol=1e-9
+        )
+
+    return assert_same
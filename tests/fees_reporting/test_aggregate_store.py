@@ -0,0 +1,53 @@
+import pandas as pd
+
+from balpy_v2.lib import Chain
+from fees_reporting.aggregate_store import FeeAggregateStore
+from fees_reporting.cycle import get_cycle_calendar
+
+
+def per_cycle(rows):
+    return pd.DataFrame(
+        rows, columns=["cycle", "poolId", "token", "swapFeeUSD", "totalUSD"]
+    ).set_index(["cycle", "poolId", "token"])
+
+
+def test_upsert_replaces_recomputed_pools_and_persists(tmp_path):
+    store = FeeAggregateStore(str(tmp_path))
+    store.upsert(
+        per_cycle([(1, "0xp1", "0xa", 10.0, 10.0), (2, "0xp1", "0xa", 5.0, 5.0)]),
+        Chain.mainnet,
+    )
+    store.upsert(per_cycle([(2, "0xp1", "0xb", 7.0, 7.0)]), Chain.mainnet)
+    store.upsert(per_cycle([(2, "0xp2", "0xc", 1.0, 1.0)]), Chain.gnosis)
+
+    reloaded = FeeAggregateStore(str(tmp_path))
+    assert len(reloaded.frame) == 3
+    assert reloaded.fees_per_pool(2, 2)["totalUSD"].to_dict() == {
+        ("gnosis", "0xp2"): 1.0,
+        ("mainnet", "0xp1"): 7.0,
+    }
+    assert reloaded.top_pools(1).index[0] == ("mainnet", "0xp1")
+    assert reloaded.chain_totals()["totalUSD"].to_dict() == {
+        "gnosis": 1.0,
+        "mainnet": 17.0,
+    }
+
+
+def test_upsert_removes_recomputed_units_without_rows(tmp_path):
+    cycles = list(get_cycle_calendar())[:2]
+    store = FeeAggregateStore(str(tmp_path))
+    number = get_cycle_calendar().number
+    store.upsert(
+        per_cycle(
+            [
+                (number(cycles[0]), "0xp1", "0xa", 10.0, 10.0),
+                (number(cycles[1]), "0xp1", "0xa", 5.0, 5.0),
+            ]
+        ),
+        Chain.mainnet,
+    )
+
+    store.upsert(pd.DataFrame(), units=[(("0xp1", Chain.mainnet), cycles[1])])
+
+    reloaded = FeeAggregateStore(str(tmp_path))
+    assert reloaded.frame.index.unique("cycle").tolist() == [number(cycles[0])]
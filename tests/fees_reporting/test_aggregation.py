@@ -0,0 +1,69 @@
+import pandas as pd
+
+from fees_reporting.aggregation import aggregate_fees, merge_partials
+from fees_reporting.amounts import to_fixed_point
+
+SWAPS = to_fixed_point(
+    pd.DataFrame(
+        {
+            "cycle": [1, 1, 2],
+            "poolId": ["0xp", "0xp", "0xp"],
+            "token": ["0xa", "0xb", "0xa"],
+            "swapFees": [1.0, 2.0, 3.0],
+            "swapFeeTokenAmount": ["0.5", "1.0", "1.5"],
+        }
+    ),
+    ["swapFeeTokenAmount"],
+)
+JOINS = to_fixed_point(
+    pd.DataFrame(
+        {
+            "cycle": [1, 2],
+            "poolId": ["0xp", "0xp"],
+            "token": ["0xa", "0xc"],
+            "protocolFeeAmountsUSD_tokens": [10.0, 20.0],
+            "joinExitFeeTokenAmount": ["5.0", "10.0"],
+        }
+    ),
+    ["joinExitFeeTokenAmount"],
+)
+
+
+def test_aggregate_fees_fills_missing_measures_with_zero():
+    per_cycle = aggregate_fees(SWAPS, JOINS)
+
+    assert per_cycle.loc[(1, "0xp", "0xa"), "totalUSD"] == 11.0
+    assert per_cycle.loc[(1, "0xp", "0xb"), "totalUSD"] == 2.0
+    assert per_cycle.loc[(2, "0xp", "0xc"), "swapFeeUSD"] == 0.0
+    assert per_cycle.loc[(2, "0xp", "0xc"), "totalToken"] == 10.0
+
+
+def test_chunk_partials_merge_to_the_whole():
+    partials = [
+        aggregate_fees(SWAPS.iloc[:2], JOINS.iloc[:0]),
+        aggregate_fees(SWAPS.iloc[2:], JOINS),
+    ]
+
+    pd.testing.assert_frame_equal(
+        merge_partials(partials), aggregate_fees(SWAPS, JOINS)
+    )
+
+
+def test_token_amounts_are_summed_exactly():
+    swaps = to_fixed_point(
+        pd.DataFrame(
+            {
+                "cycle": [1] * 3,
+                "poolId": ["0xp"] * 3,
+                "token": ["0xa"] * 3,
+                "swapFees": [0.0] * 3,
+                "swapFeeTokenAmount": ["0.1"] * 3,
+            }
+        ),
+        ["swapFeeTokenAmount"],
+    )
+
+    per_cycle = aggregate_fees(swaps, pd.DataFrame())
+
+    # 0.1 + 0.1 + 0.1 == 0.30000000000000004 in float64
+    assert per_cycle.loc[(1, "0xp", "0xa"), "swapFeeTokenAmount"] == 0.3
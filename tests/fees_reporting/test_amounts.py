@@ -0,0 +1,49 @@
+import numpy as np
+import pandas as pd
+
+from fees_reporting.amounts import (
+    fixed_point_to_float,
+    multiply_limbs,
+    normalize_limbs,
+    parse_decimal_strings,
+    to_fixed_point,
+)
+
+
+def test_parse_decimal_strings_keeps_all_18_decimals():
+    limbs = parse_decimal_strings(["12.000000000000000001", "-0.5", ".25", "1e-7"])
+
+    assert limbs.tolist() == [
+        [12, 0, 1],
+        [0, -500000000, 0],
+        [0, 250000000, 0],
+        [0, 100, 0],
+    ]
+
+
+def test_limb_sums_are_exact():
+    limbs = parse_decimal_strings(["0.999999999999999999"] * 3)
+
+    assert normalize_limbs(limbs.sum(axis=0, keepdims=True)).tolist() == [
+        [2, 999999999, 999999997]
+    ]
+
+
+def test_multiply_limbs_rounds_down_to_the_last_digit():
+    limbs = parse_decimal_strings(["1", "12.345678901234567891", "0.000000000000001"])
+
+    assert multiply_limbs(limbs, 0.0004).tolist() == [
+        [0, 400000, 0],
+        [0, 4938271, 560493827],
+        [0, 0, 0],
+    ]
+    assert multiply_limbs(-limbs[:1], 0.0004).tolist() == [[0, -400000, 0]]
+
+
+def test_to_fixed_point_replaces_string_columns():
+    df = pd.DataFrame({"tokenAmountIn": ["1.5", "2.25"]})
+
+    to_fixed_point(df, ["tokenAmountIn"])
+
+    assert "tokenAmountIn" not in df
+    assert np.allclose(fixed_point_to_float(df, "tokenAmountIn"), [1.5, 2.25])
@@ -0,0 +1,50 @@
+import pandas as pd
+import pytest
+
+from balpy_v2.lib import Chain
+from fees_reporting import cycle, fees_report_v2
+from fees_reporting.cycle import REPORT_PERIOD_DURATION, CycleCalendar
+
+START = 1_657_497_600
+
+
+def test_assign_uses_half_open_cycles():
+    calendar = CycleCalendar(START, REPORT_PERIOD_DURATION, START + 3 * 1_209_600)
+    end = int(calendar.ends[-1])
+
+    numbers = calendar.assign(
+        [START - 1, START, START + 1_209_599, START + 1_209_600, end]
+    )
+
+    assert list(numbers) == [0, 1, 1, 2, 0]
+    assert calendar.number(calendar[2]) == 3
+
+
+def test_split_and_process_data_counts_boundary_events_once():
+    calendar = CycleCalendar(START, REPORT_PERIOD_DURATION, START + 2 * 1_209_600)
+    swaps = pd.DataFrame({"timestamp": [START, START + 1_209_600, START - 5]})
+
+    result = fees_report_v2.split_and_process_data(swaps, "SWAPS_QUERY", calendar)
+
+    assert list(result["Cycle"]) == [1, 2]
+    assert set(result["type"]) == {"swap"}
+
+
+@pytest.mark.asyncio
+async def test_boundary_blocks_looks_up_only_requested_cycles(monkeypatch):
+    calendar = CycleCalendar(START, REPORT_PERIOD_DURATION, START + 4 * 1_209_600)
+    looked_up = []
+
+    async def get_block_number_by_timestamp(chain, timestamp):
+        looked_up.append(timestamp)
+        return timestamp // 10
+
+    monkeypatch.setattr(
+        cycle, "get_block_number_by_timestamp", get_block_number_by_timestamp
+    )
+
+    blocks = await calendar.boundary_blocks(Chain.mainnet, [calendar[1]])
+    await calendar.boundary_blocks(Chain.mainnet, [calendar[1], calendar[2]])
+
+    assert looked_up == [int(b) for b in calendar.boundaries[1:4]]
+    assert blocks.tolist() == [-1, START // 10 + 120_960, START // 10 + 241_920, -1, -1]
@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+
+from fees_reporting.encoding import Dictionary
+
+
+def test_codes_are_stable_and_missing_is_minus_one():
+    dictionary = Dictionary()
+
+    assert dictionary.encode(["0xb", "0xa", "0xb"]).tolist() == [0, 1, 0]
+    assert dictionary.encode(["0xa", "0xc", None]).tolist() == [1, 2, -1]
+    assert dictionary.decode([2, 0, -1]).tolist() == ["0xc", "0xb", None]
+
+
+def test_align_makes_categoricals_mergeable():
+    dictionary = Dictionary()
+    left = pd.DataFrame(
+        {"token": dictionary.categorical(["0xa", "0xb"]), "timestamp": [10, 20]}
+    )
+    right = pd.DataFrame(
+        {"token": dictionary.categorical(["0xb", "0xc"]), "timestamp": [19, 5]}
+    )
+    # categoricals built from another process carry different codes
+    foreign = pd.Categorical(["0xa"], categories=["0xz", "0xa"])
+    prices = pd.concat(
+        [right, pd.DataFrame({"token": foreign, "timestamp": [9]})],
+        ignore_index=True,
+    )
+    dictionary.encode_columns(left, ["token"])
+    dictionary.encode_columns(prices, ["token"])
+    prices["price"] = [2.0, 3.0, 1.0]
+
+    merged = pd.merge_asof(
+        left, prices.sort_values("timestamp"), on="timestamp", by="token"
+    )
+
+    assert merged["price"].tolist() == [1.0, 2.0]
+    assert np.array_equal(merged["token"].astype(object), ["0xa", "0xb"])
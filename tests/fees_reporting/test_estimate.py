@@ -0,0 +1,181 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from balpy_v2.lib import Chain
+from fees_reporting import estimate
+from fees_reporting.aggregation import merge_partials
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.estimate import (
+    ESTIMATE_KEYS,
+    ESTIMATE_MEASURES,
+    LATEST,
+    combine_estimates,
+    escalated_units,
+    pool_snapshots_query,
+    snapshot_deltas,
+    snapshot_estimates,
+)
+from fees_reporting.fees_report_v3 import SWAP_FEE, analyze_pool
+
+
+def snapshot(block, id, volume, protocol_fee, swaps):
+    return dict(
+        id=id,
+        totalSwapVolume=volume,
+        totalProtocolFee=protocol_fee,
+        swapsCount=swaps,
+        block=block,
+    )
+
+
+def test_snapshot_deltas_flag_untrustworthy_pools():
+    snapshots = pd.DataFrame(
+        [
+            snapshot(10, "ok", 100.0, 50.0, 10),
+            snapshot(20, "ok", 160.0, 80.0, 16),
+            # created during the cycle
+            snapshot(20, "new", 5.0, 2.0, 1),
+            # swapped with tokens the subgraph can't price
+            snapshot(10, "unpriced", 1.0, 1.0, 3),
+            snapshot(20, "unpriced", 1.0, 1.0, 9),
+            # protocol fees not indexed
+            snapshot(10, "unindexed", 1.0, np.nan, 1),
+            snapshot(20, "unindexed", 2.0, np.nan, 2),
+            snapshot(10, "gone", 1.0, 1.0, 1),
+        ]
+    )
+    pools = ["ok", "new", "unpriced", "unindexed", "gone", "future"]
+
+    deltas = snapshot_deltas(snapshots, [(7, 10, 20)], pools)
+
+    assert deltas.index.tolist() == [(7, pool) for pool in pools]
+    assert deltas["ok"].tolist() == [True, True, False, False, False, True]
+    assert deltas["swapFeeUSD"].tolist()[:2] == pytest.approx(
+        [60 * SWAP_FEE, 5 * SWAP_FEE]
+    )
+    assert deltas["joinExitFeeUSD"].tolist()[:2] == [30.0, 2.0]
+    assert deltas["totalUSD"].tolist()[:2] == pytest.approx(
+        [30 + 60 * SWAP_FEE, 2 + 5 * SWAP_FEE]
+    )
+    assert deltas.loc[(7, "future"), "totalUSD"] == 0.0
+
+
+def test_combine_estimates_takes_escalated_units_from_events():
+    deltas = pd.DataFrame(
+        dict(
+            swapFeeUSD=[10.0, np.nan],
+            joinExitFeeUSD=[20.0, np.nan],
+            totalUSD=[30.0, np.nan],
+            ok=[True, False],
+        ),
+        index=pd.MultiIndex.from_tuples(
+            [(7, "a"), (7, "b")], names=["cycle", "poolId"]
+        ),
+    )
+    per_cycle = merge_partials(
+        [
+            pd.DataFrame(
+                dict(
+                    swapFeeUSD=[1.0, 2.0],
+                    swapFeeTokenAmount=[0.0, 0.0],
+                    joinExitFeeUSD=[0.5, 0.0],
+                    joinExitFeeTokenAmount=[0.0, 0.0],
+                ),
+                index=pd.MultiIndex.from_tuples(
+                    [(7, "b", "t1"), (7, "b", "t2")], names=["cycle", "poolId", "token"]
+                ),
+            )
+        ]
+    )
+
+    estimates = combine_estimates(deltas, per_cycle)
+
+    assert estimates.to_dict(orient="index") == {
+        (7, "a"): dict(
+            swapFeeUSD=10.0, joinExitFeeUSD=20.0, totalUSD=30.0, source="snapshot"
+        ),
+        (7, "b"): dict(
+            swapFeeUSD=3.0, joinExitFeeUSD=0.5, totalUSD=3.5, source="events"
+        ),
+    }
+
+
+def test_pool_snapshots_query_aliases_blocks():
+    query = pool_snapshots_query([10, LATEST], ["0xa"])
+
+    assert 'b10: pools(block: {number: 10}, first: 1000, where: {id_in: ["0xa"]})' in (
+        query
+    )
+    assert 'latest: pools(first: 1000, where: {id_in: ["0xa"]})' in query
+
+
+@pytest.mark.asyncio
+async def test_snapshot_deltas_measure_fees_as_events_do(fee_events):
+    pools, cycles = fee_events
+    *_, per_cycle = await analyze_pool(pools, cycles)
+    events = per_cycle.groupby(level=ESTIMATE_KEYS)[ESTIMATE_MEASURES].sum()
+    numbers = [get_cycle_calendar().number(cycle) for cycle in cycles]
+    pool_ids = [pool_id for pool_id, _ in pools]
+    # the cumulative fields of a subgraph indexing the same events at the
+    # same prices, block n ending cycle n
+    snapshots = pd.DataFrame(
+        [
+            snapshot(
+                block,
+                pool_id,
+                sum(
+                    events.loc[(n, pool_id), "swapFeeUSD"] / SWAP_FEE
+                    for n in numbers[: i + 1]
+                ),
+                sum(
+                    events.loc[(n, pool_id), "joinExitFeeUSD"] for n in numbers[: i + 1]
+                ),
+                i + 1,
+            )
+            for i, block in enumerate(numbers)
+            for pool_id in pool_ids
+        ]
+    )
+
+    deltas = snapshot_deltas(snapshots, [(n, n - 1, n) for n in numbers], pool_ids)
+    estimates = combine_estimates(deltas, per_cycle.iloc[:0])
+
+    assert deltas["ok"].all()
+    assert set(estimates["source"]) == {"snapshot"}
+    pd.testing.assert_frame_equal(
+        estimates[ESTIMATE_MEASURES], events, check_exact=False, rtol=1e-9
+    )
+
+
+@pytest.mark.asyncio
+async def test_pools_on_chains_without_a_block_source_are_escalated(monkeypatch):
+    calendar = get_cycle_calendar()
+    cycles = calendar.cycles[:2]
+    looked_up = []
+
+    async def boundary_blocks(chain, cycles=None):
+        looked_up.append(chain)
+        return np.arange(len(calendar.cycles) + 1)
+
+    async def fetch_pool_snapshots(chain, blocks, pool_ids):
+        return pd.DataFrame(
+            [snapshot(block, "0xa", block, block, block) for block in blocks]
+        )
+
+    monkeypatch.setattr(calendar, "boundary_blocks", boundary_blocks)
+    monkeypatch.setattr(estimate, "fetch_pool_snapshots", fetch_pool_snapshots)
+    pools = [("0xa", Chain.mainnet), ("0xb", Chain.optimism)]
+
+    deltas = await snapshot_estimates(pools, cycles)
+
+    assert looked_up == [Chain.mainnet]
+    assert deltas["ok"].to_dict() == {
+        (1, "0xa"): True,
+        (1, "0xb"): False,
+        (2, "0xa"): True,
+        (2, "0xb"): False,
+    }
+    assert escalated_units(deltas, pools, cycles) == [
+        (("0xb", Chain.optimism), cycle) for cycle in cycles
+    ]
@@ -0,0 +1,44 @@
+import pytest
+
+from balpy_v2.lib import Chain
+from fees_reporting import fees_report_v2
+from fees_reporting.cycle import Cycle
+from fees_reporting.event_store import EventStore
+
+POOL_ID = "0x5c6ee304399dbdb9c8ef030ab642b10820db8f56000200000000000000000014"
+
+
+@pytest.mark.asyncio
+async def test_closed_cycles_are_fetched_once(tmp_path, monkeypatch):
+    store = EventStore(str(tmp_path))
+    cycles = [Cycle(1_657_497_600 + i * 1_209_600) for i in range(2)]
+    calls = []
+
+    async def get_paginated_data(query, pool_id_chain, after, before):
+        calls.append((query, after))
+        if query == "JOINS_QUERY":
+            return []
+        return [{"id": f"swap-{after + 1}", "timestamp": after + 1, "tokenIn": "0xa"}]
+
+    monkeypatch.setattr(fees_report_v2, "get_paginated_data", get_paginated_data)
+
+    swaps = await fees_report_v2.fetch_data(
+        "SWAPS_QUERY", (POOL_ID, Chain.mainnet), cycles, store
+    )
+    await fees_report_v2.fetch_data(
+        "SWAPS_QUERY", (POOL_ID, Chain.mainnet), cycles, EventStore(str(tmp_path))
+    )
+
+    assert list(swaps["id"]) == [f"swap-{c.start}" for c in cycles]
+    assert len(calls) == 2
+    assert all(store.is_complete("swaps", Chain.mainnet, POOL_ID, c) for c in cycles)
+
+
+def test_open_cycle_is_not_marked_complete(tmp_path):
+    store = EventStore(str(tmp_path))
+    cycle = Cycle(2_000_000_000)
+
+    store.write("swaps", Chain.mainnet, POOL_ID, cycle, [{"id": "a", "timestamp": 1}])
+
+    assert not store.is_complete("swaps", Chain.mainnet, POOL_ID, cycle)
+    assert len(store.read("swaps", Chain.mainnet, POOL_ID, cycle)) == 1
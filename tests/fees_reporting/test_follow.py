@@ -0,0 +1,129 @@
+import pytest
+
+from balpy_v2.lib import Chain
+from fees_reporting import fees_report_v3, follow
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.follow import FeeFollower
+
+POOL = ("0x" + "1" * 64, Chain.mainnet)
+TOKEN = "0x" + "2" * 40
+
+
+@pytest.mark.asyncio
+async def test_polls_only_fetch_events_since_the_cursor(monkeypatch):
+    heads = iter([112, 112, 122])
+    start = int(get_cycle_calendar()[-1].start)
+    windows = []
+
+    async def get_indexed_block(chain, block=None):
+        number = next(heads) if block is None else block
+        return number, start + number
+
+    async def get_paginated_data(query, pool_id_chain, after, before, block=None):
+        if query == "JOINS_QUERY":
+            return []
+        windows.append((after, before))
+        return [
+            dict(
+                id=f"0x{block}",
+                timestamp=before - 1,
+                tokenIn=TOKEN,
+                tokenOut=TOKEN,
+                tokenAmountIn="1000",
+                tokenAmountOut="1000",
+            )
+        ]
+
+    async def batch_request(url, coins_dict, search_width=300, batch_size=50):
+        return [
+            {
+                "coins": {
+                    coin: {
+                        "prices": [
+                            {"timestamp": t, "price": 2.0, "confidence": 0.99}
+                            for t in tss
+                        ]
+                    }
+                }
+            }
+            for coin, tss in coins_dict.items()
+        ]
+
+    monkeypatch.setattr(follow, "get_indexed_block", get_indexed_block)
+    monkeypatch.setattr(follow, "get_paginated_data", get_paginated_data)
+    monkeypatch.setattr(fees_report_v3, "batch_request", batch_request)
+    follower = FeeFollower([POOL], reorg_depth=2)
+
+    assert await follower.poll() == 1
+    assert follower.cursors[Chain.mainnet] == (110, start + 110)
+    # the head didn't move past the cursor
+    assert await follower.poll() == 0
+    assert await follower.poll() == 1
+    assert follower.cursors[Chain.mainnet] == (120, start + 120)
+
+    assert windows == [(start - 1, start + 111), (start + 109, start + 121)]
+    assert follower.per_cycle["swapFeeTokenAmount"].sum() == pytest.approx(0.8)
+    assert follower.per_cycle["swapFeeUSD"].sum() == pytest.approx(1.6)
+
+
+def _swap(event_id, timestamp, block):
+    return dict(
+        id=event_id,
+        block=block,
+        timestamp=timestamp,
+        tokenIn=TOKEN,
+        tokenOut=TOKEN,
+        tokenAmountIn="1000",
+        tokenAmountOut="1000",
+    )
+
+
+@pytest.mark.asyncio
+async def test_events_in_blocks_sharing_a_timestamp_are_counted_once(monkeypatch):
+    start = int(get_cycle_calendar()[-1].start)
+    # blocks 110 and 111 share a timestamp
+    timestamps = {110: start + 50, 111: start + 50, 112: start + 60}
+    heads = iter([112, 113, 114])
+    indexed = [
+        _swap("0xa", start + 50, 110),
+        _swap("0xb", start + 50, 111),
+        _swap("0xc", start + 60, 112),
+    ]
+
+    async def get_indexed_block(chain, block=None):
+        return (next(heads), None) if block is None else (block, timestamps[block])
+
+    async def get_paginated_data(query, pool_id_chain, after, before, block=None):
+        if query == "JOINS_QUERY":
+            return []
+        return [
+            {k: v for k, v in swap.items() if k != "block"}
+            for swap in indexed
+            if swap["block"] <= block and after < swap["timestamp"] < before
+        ]
+
+    async def batch_request(url, coins_dict, search_width=300, batch_size=50):
+        return [
+            {
+                "coins": {
+                    coin: {
+                        "prices": [
+                            {"timestamp": t, "price": 2.0, "confidence": 0.99}
+                            for t in tss
+                        ]
+                    }
+                }
+            }
+            for coin, tss in coins_dict.items()
+        ]
+
+    monkeypatch.setattr(follow, "get_indexed_block", get_indexed_block)
+    monkeypatch.setattr(follow, "get_paginated_data", get_paginated_data)
+    monkeypatch.setattr(fees_report_v3, "batch_request", batch_request)
+    follower = FeeFollower([POOL], reorg_depth=2)
+
+    # 0xb is indexed past the safe block, though at the same timestamp
+    assert await follower.poll() == 1
+    assert await follower.poll() == 1
+    assert await follower.poll() == 1
+    assert follower.per_cycle["swapFeeTokenAmount"].sum() == pytest.approx(1.2)
@@ -0,0 +1,75 @@
+import math
+
+import pytest
+
+from balpy_v2.cache.backends import DiskBackend
+from balpy_v2.lib.time import WEEK_IN_SECONDS
+from fees_reporting import gauge_weights as gauge_weights_module
+from fees_reporting.cycle import get_cycle_calendar
+from fees_reporting.gauge_weights import gauge_weights
+
+GAUGES = ["0x" + "1" * 40, "0x" + "2" * 40]
+
+
+class FakeFunctions:
+    def gauge_relative_weight(self, gauge, timestamp):
+        return ("weight", gauge.lower(), timestamp)
+
+    def points_weight(self, gauge, timestamp):
+        return ("votes", gauge.lower(), timestamp)
+
+
+class FakeController:
+    class web3_contract:
+        functions = FakeFunctions()
+
+
+@pytest.mark.asyncio
+async def test_weights_matrix_is_read_in_batches_and_cached(tmp_path, monkeypatch):
+    batches = []
+
+    async def multicall(chain, functions, block="latest"):
+        batches.append(functions)
+        results = []
+        for kind, gauge, timestamp in functions:
+            # points are only stored at week starts
+            assert timestamp in week_starts
+            if gauge == GAUGES[1] and timestamp == week_starts[0]:
+                results.append(dict(error="execution reverted"))
+            elif kind == "votes":
+                results.append(dict(result=(3 * 10**18, 1)))
+            else:
+                results.append(dict(result=10**17 * GAUGES.index(gauge) + 1))
+        return results
+
+    monkeypatch.setattr(gauge_weights_module, "multicall", multicall)
+    monkeypatch.setattr(
+        gauge_weights_module.BalancerContractFactory,
+        "create",
+        lambda chain, name: FakeController(),
+    )
+    monkeypatch.setattr(
+        gauge_weights_module, "gauge_weights_cache", DiskBackend(str(tmp_path))
+    )
+    calendar = get_cycle_calendar()
+    # two closed cycles and the open one
+    cycles = [calendar[0], calendar[1], calendar[-1]]
+    week_starts = [cycle.start // WEEK_IN_SECONDS * WEEK_IN_SECONDS for cycle in cycles]
+
+    weights = await gauge_weights(GAUGES, cycles, batch_size=4)
+
+    assert [len(batch) for batch in batches] == [4, 2]
+    assert weights.index.tolist() == [1, 2, len(calendar)]
+    assert weights.columns.tolist() == GAUGES
+    assert weights.iloc[1].tolist() == pytest.approx([1e-18, 0.1 + 1e-18])
+    assert math.isnan(weights.iloc[0, 1])
+
+    batches.clear()
+    assert (await gauge_weights(GAUGES, cycles)).equals(weights)
+    # the failed read and the open cycle are read again
+    assert [len(batch) for batch in batches] == [3]
+
+    batches.clear()
+    votes = await gauge_weights(GAUGES, cycles[1:2], measure="votes")
+    assert votes.iloc[0].tolist() == [3.0, 3.0]
+    assert [t for _, _, t in batches[0]] == [week_starts[1]] * 2
@@ -0,0 +1,40 @@
+import pandas as pd
+
+from fees_reporting.join_exits import JoinExits
+
+
+def join_exits(timestamps, tokens):
+    return JoinExits.from_events(
+        pd.DataFrame(
+            {
+                "timestamp": timestamps,
+                "chain": "mainnet",
+                "pool.tokensList": [tokens] * len(timestamps),
+                "amounts": [[f"{t}.5"] * len(tokens) for t in timestamps],
+                "protocolFeeAmounts": [["0.000000000000000001"] * len(tokens)]
+                * len(timestamps),
+            }
+        )
+    )
+
+
+def test_amounts_are_a_child_table_of_the_events():
+    joins = join_exits([10, 20], ["0xa", "0xb", "0xc"])
+
+    assert list(joins.events.columns) == ["timestamp", "chain"]
+    assert joins.offsets.tolist() == [0, 3, 6]
+    assert joins.amounts["tokenIndex"].tolist() == [0, 1, 2] * 2
+    assert joins.amounts["token"].astype(object).tolist() == ["0xa", "0xb", "0xc"] * 2
+    assert joins.amounts["amounts_int"].tolist() == [10] * 3 + [20] * 3
+    assert joins.amounts["protocolFeeAmounts_e18"].tolist() == [1] * 6
+    assert joins.gather("timestamp").tolist() == [10] * 3 + [20] * 3
+
+
+def test_concat_shifts_parent_rows():
+    joins = JoinExits.concat(
+        [join_exits([10], ["0xa", "0xb"]), JoinExits(), join_exits([20, 30], ["0xc"])]
+    )
+
+    assert len(joins) == 3
+    assert joins.offsets.tolist() == [0, 2, 3, 4]
+    assert joins.gather("timestamp").tolist() == [10, 10, 20, 30]
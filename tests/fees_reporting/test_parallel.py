@@ -0,0 +1,64 @@
+import pandas as pd
+import pytest
+
+from fees_reporting.encoding import identifiers
+from fees_reporting.fees_report_v3 import analyze_pool
+from fees_reporting.join_exits import JoinExits
+from fees_reporting.parallel import SharedFrame, shard_events
+
+
+def test_shared_frames_round_trip_through_shared_memory():
+    df = pd.DataFrame(
+        {
+            "token": identifiers.categorical(["0xa", "0xb", "0xa"]),
+            "timestamp": [1, 2, 3],
+            "price": [1.0, 2.0, 1.5],
+        }
+    )
+    frame = SharedFrame.create(df)
+    try:
+        pd.testing.assert_frame_equal(frame.read(), df)
+    finally:
+        frame.unlink()
+
+
+def test_every_pool_lands_in_one_shard():
+    pools = ["0xp1", "0xp2", "0xp3"]
+    swaps = pd.DataFrame({"pool.id": identifiers.categorical(pools * 2)})
+    joins = JoinExits.from_events(
+        pd.DataFrame(
+            {
+                "pool.id": identifiers.categorical(pools),
+                "pool.tokensList": [["0xa", "0xb"]] * 3,
+                "amounts": [["1", "2"]] * 3,
+                "protocolFeeAmounts": [["0", "1"]] * 3,
+            }
+        )
+    )
+
+    shards = list(shard_events(swaps, joins, 2))
+
+    seen = [
+        set(s["pool.id"].astype(object)) | set(j.events["pool.id"].astype(object))
+        for s, j in shards
+    ]
+    assert sorted(pool for pools in seen for pool in pools) == pools
+    for shard_swaps, shard_joins in shards:
+        assert set(shard_swaps["pool.id"]) == set(shard_joins.events["pool.id"])
+        assert shard_joins.offsets.tolist() == list(
+            range(0, 2 * len(shard_joins) + 1, 2)
+        )
+
+
+@pytest.mark.asyncio
+async def test_workers_match_sequential_analysis(fee_events, assert_same_per_cycle):
+    pools, cycles = fee_events
+
+    swaps, joins, _, per_cycle = await analyze_pool(pools, cycles)
+    swaps_w, joins_w, _, per_cycle_w = await analyze_pool(pools, cycles, workers=2)
+
+    assert not per_cycle.empty
+    assert_same_per_cycle(per_cycle_w, per_cycle)
+    assert len(swaps_w) == len(swaps) and len(joins_w) == len(joins)
+    assert swaps_w["swapFees"].sum() == pytest.approx(swaps["swapFees"].sum())
+    assert joins_w["amountsUSD"].sum() == pytest.approx(joins["amountsUSD"].sum())
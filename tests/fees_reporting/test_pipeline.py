@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from fees_reporting.fees_report_v3 import analyze_pool
+from fees_reporting.pipeline import (
+    DONE,
+    _collect,
+    _produce,
+    _run_stage,
+    stream_analyze_pool,
+)
+
+
+@pytest.mark.asyncio
+async def test_stages_drain_bounded_queues_with_many_workers():
+    inbox, outbox, results = asyncio.Queue(1), asyncio.Queue(1), []
+
+    async def square_odd(n):
+        await asyncio.sleep(0)
+        return n * n if n % 2 else None
+
+    await asyncio.gather(
+        _produce(range(10), inbox),
+        _run_stage(square_odd, inbox, outbox, workers=3),
+        _collect(outbox, results),
+    )
+
+    assert sorted(results) == [1, 9, 25, 49, 81]
+    assert inbox.get_nowait() is DONE
+
+
+@pytest.mark.asyncio
+async def test_batched_stages_forward_every_result():
+    inbox, outbox, results, batches = asyncio.Queue(), asyncio.Queue(), [], []
+
+    async def double(items):
+        batches.append(len(items))
+        return [n * 2 for n in items]
+
+    await _produce(range(5), inbox)
+    await asyncio.gather(
+        _run_stage(double, inbox, outbox, batch_size=2),
+        _collect(outbox, results),
+    )
+
+    assert results == [0, 2, 4, 6, 8]
+    assert batches == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_streaming_matches_analyze_pool(fee_events, assert_same_per_cycle):
+    pools, cycles = fee_events
+
+    *_, per_cycle = await analyze_pool(pools, cycles)
+    streamed = await stream_analyze_pool(pools, cycles, price_batch=4)
+
+    assert not per_cycle.empty
+    assert_same_per_cycle(streamed, per_cycle)
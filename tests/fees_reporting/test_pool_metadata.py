@@ -0,0 +1,121 @@
+import pandas as pd
+import pytest
+
+from balpy_v2.lib import Chain
+from fees_reporting import fees_report_v2
+from fees_reporting.fees_report_v2 import attach_pool_metadata, get_join_exit_tokens
+
+POOL_ID = "0x" + "1" * 64
+TOKENS = ["0xa", "0xb"]
+OLD_TOKENS = ["0xa", "0xb", "0xc"]
+
+
+def test_pool_metadata_is_joined_locally():
+    swaps = pd.DataFrame({"timestamp": [1], "tokenIn": ["0xa"]})
+    joins = pd.DataFrame(
+        {
+            "timestamp": [1, 2],
+            "amounts": [["1", "2"], ["1", "2", "3"]],
+            "protocolFeeAmounts": [["0", "1"], ["0", "1", "2"]],
+        }
+    )
+
+    joins = attach_pool_metadata(swaps, joins, POOL_ID, [TOKENS, OLD_TOKENS])
+
+    assert list(swaps["pool.id"]) == [POOL_ID]
+    assert list(joins["timestamp"]) == [1, 2]
+    assert list(joins["pool.tokensList"]) == [TOKENS, OLD_TOKENS]
+    assert list(joins["pool.id"]) == [POOL_ID, POOL_ID]
+
+
+@pytest.mark.asyncio
+async def test_join_exits_before_a_token_change_get_the_old_token_list(monkeypatch):
+    looked_up = []
+
+    async def get_pool_tokens(pool_id_chain, block=None):
+        looked_up.append(block)
+        return TOKENS if block is None or block >= 200 else OLD_TOKENS
+
+    async def get_block_number_by_timestamp(chain, timestamp):
+        return timestamp
+
+    monkeypatch.setattr(fees_report_v2, "get_pool_tokens", get_pool_tokens)
+    monkeypatch.setattr(
+        fees_report_v2, "get_block_number_by_timestamp", get_block_number_by_timestamp
+    )
+    joins = pd.DataFrame(
+        {
+            "timestamp": [300, 120, 100, 250],
+            "amounts": [["1", "2"], ["1", "2", "3"], ["1", "2", "3"], ["1", "2"]],
+        }
+    )
+
+    token_lists = await get_join_exit_tokens((POOL_ID, Chain.mainnet), joins)
+
+    assert token_lists == [TOKENS, OLD_TOKENS, OLD_TOKENS, TOKENS]
+    # the older version is fetched once for both exits that need it
+    assert looked_up == [None, 100]
+
+
+@pytest.mark.asyncio
+async def test_join_exits_matching_no_token_list_are_not_dropped(monkeypatch):
+    async def get_pool_tokens(pool_id_chain, block=None):
+        return TOKENS
+
+    async def get_block_number_by_timestamp(chain, timestamp):
+        return timestamp
+
+    monkeypatch.setattr(fees_report_v2, "get_pool_tokens", get_pool_tokens)
+    monkeypatch.setattr(
+        fees_report_v2, "get_block_number_by_timestamp", get_block_number_by_timestamp
+    )
+    joins = pd.DataFrame({"timestamp": [1], "amounts": [["1", "2", "3"]]})
+
+    with pytest.raises(ValueError, match="3 amounts"):
+        await get_join_exit_tokens((POOL_ID, Chain.mainnet), joins)
+
+
+@pytest.mark.asyncio
+async def test_swaps_of_removed_tokens_reveal_a_same_length_change(monkeypatch):
+    looked_up = []
+    renamed = ["0xa", "0xd"]
+
+    async def get_pool_tokens(pool_id_chain, block=None):
+        looked_up.append(block)
+        return TOKENS if block is None or block >= 200 else renamed
+
+    async def get_block_number_by_timestamp(chain, timestamp):
+        return timestamp
+
+    monkeypatch.setattr(fees_report_v2, "get_pool_tokens", get_pool_tokens)
+    monkeypatch.setattr(
+        fees_report_v2, "get_block_number_by_timestamp", get_block_number_by_timestamp
+    )
+    swaps = pd.DataFrame(
+        {"timestamp": [150, 250], "tokenIn": ["0xD", "0xa"], "tokenOut": ["0xa", "0xb"]}
+    )
+    joins = pd.DataFrame({"timestamp": [300, 100], "amounts": [["1", "2"]] * 2})
+
+    token_lists = await get_join_exit_tokens((POOL_ID, Chain.mainnet), joins, swaps)
+
+    assert token_lists == [TOKENS, renamed]
+    assert looked_up == [None, 100]
+
+
+@pytest.mark.asyncio
+async def test_chains_without_a_block_source_keep_the_current_tokens(
+    monkeypatch, caplog
+):
+    async def get_pool_tokens(pool_id_chain, block=None):
+        assert block is None
+        return TOKENS
+
+    monkeypatch.setattr(fees_report_v2, "get_pool_tokens", get_pool_tokens)
+    joins = pd.DataFrame(
+        {"timestamp": [1, 2, 3], "amounts": [["1", "2"], ["1", "2", "3"], ["1"]]}
+    )
+
+    token_lists = await get_join_exit_tokens((POOL_ID, Chain.optimism), joins)
+
+    assert token_lists == [TOKENS, [*TOKENS, None], ["0xa"]]
+    assert "no block source" in caplog.text
@@ -0,0 +1,66 @@
+import json
+import time
+
+import pandas as pd
+
+from balpy_v2.lib import Chain
+from fees_reporting.aggregation import merge_partials
+from fees_reporting.checkpoint import ReportCheckpoint
+from fees_reporting.cycle import REPORT_PERIOD_START_DATE, Cycle
+from fees_reporting.report import parse_pool, pools_from_gauges
+
+POOL = ("0xpool", Chain.mainnet)
+
+
+def partial(cycle, value):
+    index = pd.MultiIndex.from_tuples(
+        [(cycle, "0xpool", "ethereum:0xtoken")], names=["cycle", "poolId", "token"]
+    )
+    return merge_partials(
+        [
+            pd.DataFrame(
+                dict(
+                    swapFeeUSD=[value],
+                    swapFeeTokenAmount=[value],
+                    joinExitFeeUSD=[0.0],
+                    joinExitFeeTokenAmount=[0.0],
+                ),
+                index=index,
+            )
+        ]
+    )
+
+
+def test_checkpoint_records_closed_cycles_only(tmp_path):
+    closed = Cycle(REPORT_PERIOD_START_DATE)
+    empty_closed = Cycle(closed.end)
+    open_cycle = Cycle(time.time() - 60)
+    checkpoint = ReportCheckpoint(str(tmp_path))
+
+    checkpoint.write(POOL, closed, partial(1, 2.0))
+    checkpoint.write(POOL, empty_closed, merge_partials([]))
+    checkpoint.write(POOL, open_cycle, partial(3, 5.0))
+
+    resumed = ReportCheckpoint(str(tmp_path))
+    assert resumed.is_complete(POOL, closed)
+    assert resumed.is_complete(POOL, empty_closed)
+    assert not resumed.is_complete(POOL, open_cycle)
+    loaded = resumed.load([(POOL, closed), (POOL, empty_closed)])
+    assert loaded["totalUSD"].tolist() == [2.0]
+
+
+def test_pools_from_gauges_and_pool_options(tmp_path, caplog):
+    path = tmp_path / "gauges.json"
+    gauges = [
+        dict(network=1, pool=dict(id="0xa")),
+        dict(network=100, pool=dict(id="0xb")),
+        dict(network=1, pool=dict(id="0xa")),
+        dict(network=5, pool=dict(id="0xc")),
+    ]
+    path.write_text(json.dumps(gauges))
+
+    assert pools_from_gauges(path) == [("0xa", Chain.mainnet), ("0xb", Chain.gnosis)]
+    assert pools_from_gauges(path, [Chain.gnosis]) == [("0xb", Chain.gnosis)]
+    assert "1 gauges of unsupported network 5" in caplog.text
+    assert parse_pool("gnosis:0xb") == ("0xb", Chain.gnosis)
+    assert parse_pool("0xa", Chain.polygon) == ("0xa", Chain.polygon)
@@ -0,0 +1,43 @@
+import pandas as pd
+
+from fees_reporting.fees_report import fee_deltas, period_analysis, snapshot_table
+
+BLOCKS = [100, 200, 300]
+DATES = [1_000, 2_000, 3_000]
+
+
+def pool_token(token, fees, price):
+    return {
+        "id": f"0xpool-{token}",
+        "symbol": token.upper(),
+        "address": f"0x{token}",
+        "paidProtocolFees": fees,
+        "token": {"latestUSDPrice": price},
+        "pool": {"id": "0xpool", "address": "0xpooladdress", "symbol": "POOL"},
+    }
+
+
+RESPONSES = {
+    "b100": [pool_token("a", "1.5", "2"), pool_token("b", "10", "1")],
+    # b is missing from this snapshot, so it has no delta for either period
+    "b200": [pool_token("a", "4", "2.5"), pool_token("c", "1", "3")],
+    "b300": [
+        pool_token("a", "4", "3"),
+        pool_token("b", "12", "1"),
+        pool_token("c", "1.000000000000000001", "3"),
+    ],
+}
+
+
+def test_fee_deltas_match_pairwise_period_analysis():
+    data = [
+        ({"poolTokens": RESPONSES[f"b{block}"]}, block, date)
+        for block, date in zip(BLOCKS, DATES)
+    ]
+    expected = pd.concat(
+        [period_analysis(start, end) for start, end in zip(data, data[1:])]
+    )
+
+    deltas = fee_deltas(snapshot_table(RESPONSES, BLOCKS, DATES))
+
+    pd.testing.assert_frame_equal(deltas, expected)